@@ -0,0 +1,61 @@
+'''Low-rank factorization of convolution layers, e.g conv6_3 (3x3x512x4096) and conv7 (1x1x4096x4096).
+The kernel reshaped to a [kh*kw*in, out] matrix is approximated by a truncated SVD and
+replaced by two convolutions:
+ - <name>_lr_a: kh x kw x in x rank, no bias, no relu
+ - <name>_lr_b: 1 x 1 x rank x out, with the bias and relu of the original layer
+nn.conv_layer builds the pair automatically when the weight dict holds the factored keys.
+Per pixel cost drops from kh*kw*in*out to rank*(kh*kw*in + out) multiply-adds.
+'''
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+# Suffixes of the two factors in the weight dict
+FACTOR_A = '_lr_a'
+FACTOR_B = '_lr_b'
+
+DEFAULT_RANKS = {'conv6_3': 512, 'conv7': 512}
+
+
+def factorize_conv(kernel, bias, rank):
+    '''
+    kernel: [kh, kw, in, out], bias: [out]
+    Return: ((kernel_a, bias_a), (kernel_b, bias_b)), bias_a is zero
+    '''
+    kh, kw, in_channels, out_channels = kernel.shape
+    rank = min(rank, kh * kw * in_channels, out_channels)
+    matrix = kernel.reshape(kh * kw * in_channels, out_channels).astype(np.float64)
+    u, s, vt = np.linalg.svd(matrix, full_matrices=False)
+    root = np.sqrt(s[:rank])
+    kernel_a = (u[:, :rank] * root).reshape(kh, kw, in_channels, rank).astype(np.float32)
+    kernel_b = (root[:, np.newaxis] * vt[:rank]).reshape(1, 1, rank, out_channels).astype(np.float32)
+    return ((kernel_a, np.zeros(rank, dtype=np.float32)), (kernel_b, np.asarray(bias, dtype=np.float32)))
+
+def explained_energy(kernel, rank):
+    '''Share of the squared singular values kept at rank'''
+    s = np.linalg.svd(kernel.reshape(-1, kernel.shape[-1]).astype(np.float64), compute_uv=False)
+    return float((s[:rank] ** 2).sum() / (s ** 2).sum())
+
+def factorize_weight_dict(data_dict, ranks=DEFAULT_RANKS):
+    '''
+    Return a copy of data_dict with the layers in ranks (layer -> rank) replaced by their factors.
+    Layers which are already factored are factored again from their product.
+    '''
+    factored = dict(data_dict)
+    for name, rank in ranks.items():
+        if name in factored:
+            kernel, bias = factored.pop(name)
+        elif name + FACTOR_A in factored:
+            (kernel_a, _), (kernel_b, bias) = factored.pop(name + FACTOR_A), factored.pop(name + FACTOR_B)
+            kernel = np.tensordot(kernel_a, kernel_b[0, 0], axes=([3], [0]))
+        else:
+            print('No layer %s in the weight dict, not factored' % name)
+            continue
+        a, b = factorize_conv(np.asarray(kernel), bias, rank)
+        factored[name + FACTOR_A] = a
+        factored[name + FACTOR_B] = b
+        print('Factored %s %s at rank %d, energy kept %.4f' %
+              (name, str(np.shape(kernel)), a[0].shape[3], explained_energy(np.asarray(kernel), rank)))
+    return factored
@@ -0,0 +1,143 @@
+'''Structured channel pruning of the VGG16 trunk of a weight dict.
+Whole filters (output channels) of a layer are removed and the matching input channels
+of every layer reading its output (CONSUMERS, incl. the score_pool3/4 skip layers) are
+removed with them. The pruned dict holds smaller dense kernels, the models build the
+reduced shapes from it like from any weight file, so the convolutions really get cheaper.
+
+Filters are ranked per layer by
+ - 'l1': the L1 norm of the filter weights
+ - 'activation': the mean activation of the channel on a few val images, see activation_means()
+The mean contribution of a removed channel is folded into the bias of its consumers.
+The pruned file is fine-tuned with the training scripts like any other weight file.
+'''
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import tensorflow as tf
+
+from compression.lowrank import FACTOR_A, FACTOR_B
+
+# Prunable layers in forward order
+PRUNE_ORDER = ['conv1_1', 'conv1_2', 'conv2_1', 'conv2_2',
+               'conv3_1', 'conv3_2', 'conv3_3', 'conv4_1', 'conv4_2', 'conv4_3',
+               'conv5_1', 'conv5_2', 'conv5_3', 'conv6_1', 'conv6_2', 'conv6_3', 'conv7']
+
+# Layer -> layers whose input channels are the output channels of the layer
+CONSUMERS = {'conv1_1': ['conv1_2'], 'conv1_2': ['conv2_1'],
+             'conv2_1': ['conv2_2'], 'conv2_2': ['conv3_1'],
+             'conv3_1': ['conv3_2'], 'conv3_2': ['conv3_3'],
+             'conv3_3': ['conv4_1', 'score_pool3', 'score_pool3_mask'],
+             'conv4_1': ['conv4_2'], 'conv4_2': ['conv4_3'],
+             'conv4_3': ['conv5_1', 'score_pool4', 'score_pool4_mask'],
+             'conv5_1': ['conv5_2'], 'conv5_2': ['conv5_3'], 'conv5_3': ['conv6_1'],
+             'conv6_1': ['conv6_2'], 'conv6_2': ['conv6_3'], 'conv6_3': ['conv7'],
+             'conv7': ['score_fr', 'score_fr_mask']}
+
+# Layer -> name of the tensor its consumers read in the model dict of _build_model()
+CONSUMED_OUTPUT = {'conv1_2': 'pool1', 'conv2_2': 'pool2', 'conv3_3': 'pool3',
+                   'conv4_3': 'pool4', 'conv5_3': 'pool5'}
+
+# Fraction of filters kept, conv6_3/conv7 are better reduced by compression/lowrank.py
+DEFAULT_KEEP = dict((name, 0.75) for name in PRUNE_ORDER[:13])
+
+
+def num_kept(num_filters, keep, multiple=8):
+    '''Number of kept filters, rounded up to a multiple for efficient kernels'''
+    num = int(np.ceil(num_filters * keep / multiple)) * multiple
+    return int(min(max(num, multiple), num_filters))
+
+def l1_scores(kernel):
+    '''L1 norm of every filter of a kernel [kh, kw, in, out], shape=[out]'''
+    return np.abs(kernel).sum(axis=(0, 1, 2))
+
+def activation_means(sess, model, image, images, feed_dict=None):
+    '''
+    Mean activation per channel of the outputs of the prunable layers, as read by their consumers.
+    model: model dict of _build_model(), built with is_train=False
+    images: val images, shape=[H, W, 3] each
+    Return: layer -> mean activation, shape=[out_channels]
+    '''
+    fetches = {}
+    for layer in PRUNE_ORDER:
+        output = CONSUMED_OUTPUT.get(layer, layer)
+        if output in model:
+            fetches[layer] = tf.reduce_mean(model[output], [0, 1, 2])
+
+    means = None
+    count = 0
+    for img in images:
+        feed = dict(feed_dict) if feed_dict else {}
+        feed[image] = np.asarray(img)[np.newaxis, ...]
+        values = sess.run(fetches, feed_dict=feed)
+        if means is None:
+            means = values
+        else:
+            for layer in means:
+                means[layer] += values[layer]
+        count += 1
+    return dict((layer, value / count) for layer, value in means.items())
+
+def prune_weight_dict(data_dict, keep=DEFAULT_KEEP, criterion='l1', act_means=None, multiple=8):
+    '''
+    Input
+    data_dict: weight dict, layer -> (kernel, bias) or upscore kernel
+    keep: layer -> fraction of filters kept
+    criterion: 'l1' or 'activation', the latter needs act_means
+    act_means: layer -> mean activation per channel, see activation_means(). If given the
+               removed channels are replaced by their mean in the consumer biases,
+               otherwise by relu(bias)
+    Return: (pruned copy of data_dict, layer -> indices of the kept filters)
+    '''
+    if criterion == 'activation' and act_means is None:
+        raise ValueError("criterion 'activation' needs the activation means")
+    if criterion not in ('l1', 'activation'):
+        raise ValueError("Unknown pruning criterion %s" % criterion)
+
+    pruned = dict(data_dict)
+    kept = {}
+    for name in PRUNE_ORDER:
+        if name not in keep:
+            continue
+        # a low-rank factored layer is pruned at the output of its second factor
+        key = name if name in pruned else name + FACTOR_B
+        if key not in pruned:
+            print('No layer %s in the weight dict, not pruned' % name)
+            continue
+        kernel, bias = pruned[key]
+        num_filters = kernel.shape[3]
+        scores = act_means[name] if criterion == 'activation' else l1_scores(kernel)
+        index = np.sort(np.argsort(-scores, kind='mergesort')[:num_kept(num_filters, keep[name], multiple)])
+        removed = np.setdiff1d(np.arange(num_filters), index)
+        if act_means is not None and name in act_means:
+            fill = np.asarray(act_means[name], dtype=np.float32)[removed]
+        else:
+            fill = np.maximum(bias[removed], 0)
+        pruned[key] = (kernel[..., index], bias[index])
+        kept[name] = index
+
+        for consumer in CONSUMERS[name]:
+            ckey = consumer if consumer in pruned else consumer + FACTOR_A
+            if ckey not in pruned:
+                continue
+            ckernel, cbias = pruned[ckey]
+            # constant input of the removed channels, border effects of the padding ignored
+            cbias = cbias + np.dot(fill, ckernel[:, :, removed, :].sum(axis=(0, 1)))
+            pruned[ckey] = (ckernel[:, :, index, :], cbias.astype(np.float32))
+
+        print('Pruned %s: %d -> %d filters' % (name, num_filters, len(index)))
+    return pruned, kept
+
+def trunk_macs(data_dict, image_size=(1024, 2048)):
+    '''Multiply-adds of the trunk convolutions for one image, to compare pruned and full dicts'''
+    strides = {'conv1': 1, 'conv2': 2, 'conv3': 4, 'conv4': 8, 'conv5': 16, 'conv6': 32, 'conv7': 32}
+    total = 0
+    for name in PRUNE_ORDER:
+        keys = [name] if name in data_dict else [name + FACTOR_A, name + FACTOR_B]
+        stride = strides[name.split('_')[0]]
+        pixels = int(np.ceil(image_size[0] / stride)) * int(np.ceil(image_size[1] / stride))
+        for key in keys:
+            if key in data_dict:
+                total += pixels * np.asarray(data_dict[key][0]).size
+    return total
@@ -0,0 +1,152 @@
+'''Post-training quantization of weight dicts (the np.save(var_dict) files of the training scripts).
+-- fp16: every large array is stored as float16
+-- int8: per output channel symmetric int8 with one float32 scale per channel.
+   The clipping range of every channel is calibrated: the quantization error of every
+   input channel is weighted by its mean squared activation on a few val images, and the
+   clip ratio with the smallest weighted error is kept.
+
+A quantized array is stored as {'q': int8 array, 'scale': float32 array} or as a float16 array,
+biases and small arrays stay float32. data_utils.load_weight dequantizes transparently, so
+the models load quantized files like float files.
+'''
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import tensorflow as tf
+
+# Arrays with less elements are not quantized
+MIN_QUANT_SIZE = 4096
+# Candidate clip ratios of the int8 range, relative to the max abs value of a channel
+CLIP_RATIOS = (1.0, 0.95, 0.9, 0.85, 0.8, 0.7, 0.6, 0.5)
+
+# Layer -> name of its input in the model dict of FCN16VGG/InstanceFCN8s, used for the calibration
+LAYER_INPUTS = {'conv1_2': 'conv1_1', 'conv2_1': 'pool1', 'conv2_2': 'conv2_1',
+                'conv3_1': 'pool2', 'conv3_2': 'conv3_1', 'conv3_3': 'conv3_2',
+                'conv4_1': 'pool3', 'conv4_2': 'conv4_1', 'conv4_3': 'conv4_2',
+                'conv5_1': 'pool4', 'conv5_2': 'conv5_1', 'conv5_3': 'conv5_2',
+                'conv6_1': 'pool5', 'conv6_2': 'conv6_1', 'conv6_3': 'conv6_2',
+                'conv7': 'conv6_3', 'score_fr': 'conv7', 'score_fr_mask': 'conv7',
+                'score_pool4': 'pool4', 'score_pool4_mask': 'pool4',
+                'score_pool3': 'pool3', 'score_pool3_mask': 'pool3'}
+
+
+def is_quantized(value):
+    return isinstance(value, dict) and 'q' in value
+
+def quantize_int8(kernel, act_sq=None, clip_ratios=CLIP_RATIOS):
+    '''
+    Per output channel (last axis) int8 quantization of a kernel.
+    act_sq: mean squared activation per input channel (axis -2), shape=[in_channels],
+            weights the error of the clip ratio search, uniform if None
+    Return: {'q': int8 kernel, 'scale': float32 scale per output channel}
+    '''
+    kernel = np.asarray(kernel, dtype=np.float32)
+    out_channels = kernel.shape[-1]
+    flat = kernel.reshape(-1, kernel.shape[-2], out_channels)
+    max_abs = np.maximum(np.abs(flat).max(axis=(0, 1)), 1e-12)
+    if act_sq is None:
+        act_sq = np.ones(kernel.shape[-2], dtype=np.float32)
+    act_sq = np.asarray(act_sq, dtype=np.float32)[np.newaxis, :, np.newaxis]
+
+    best_err = np.full(out_channels, np.inf)
+    best_scale = max_abs / 127.0
+    for ratio in clip_ratios:
+        scale = ratio * max_abs / 127.0
+        q = np.clip(np.round(flat / scale), -127, 127)
+        err = (act_sq * (flat - q * scale) ** 2).sum(axis=(0, 1))
+        better = err < best_err
+        best_err[better] = err[better]
+        best_scale[better] = scale[better]
+
+    q = np.clip(np.round(flat / best_scale), -127, 127).astype(np.int8)
+    return {'q': q.reshape(kernel.shape), 'scale': best_scale.astype(np.float32)}
+
+def dequantize(value):
+    '''Quantized array (int8 dict or float16) -> float32 array, other values are returned as they are'''
+    if is_quantized(value):
+        return value['q'].astype(np.float32) * value['scale']
+    if isinstance(value, np.ndarray) and value.dtype == np.float16:
+        return value.astype(np.float32)
+    return value
+
+def dequantize_weight_dict(data_dict):
+    '''Dequantize all arrays of a weight dict, in place. Return: data_dict'''
+    for name, value in data_dict.items():
+        if isinstance(value, (tuple, list)):
+            data_dict[name] = type(value)(dequantize(v) for v in value)
+        else:
+            data_dict[name] = dequantize(value)
+    return data_dict
+
+def is_quantized_dict(data_dict):
+    for value in data_dict.values():
+        values = value if isinstance(value, (tuple, list)) else (value,)
+        for v in values:
+            if is_quantized(v) or (isinstance(v, np.ndarray) and v.dtype == np.float16):
+                return True
+    return False
+
+def quantize_weight_dict(data_dict, mode='int8', act_stats=None, min_size=MIN_QUANT_SIZE):
+    '''
+    Input
+    data_dict: weight dict, layer -> (kernel, bias) or upscore kernel
+    mode: 'int8' or 'fp16'
+    act_stats: layer -> mean squared activation of its input channels, see activation_stats()
+    Return: quantized copy of data_dict, biases stay float32
+    '''
+    if act_stats is None:
+        act_stats = {}
+    quantized = {}
+    for name, value in data_dict.items():
+        kernel, rest = (value[0], list(value[1:])) if isinstance(value, (tuple, list)) else (value, None)
+        kernel = np.asarray(kernel)
+        if kernel.size < min_size:
+            qkernel = kernel
+        elif mode == 'fp16':
+            qkernel = kernel.astype(np.float16)
+        elif mode == 'int8':
+            act_sq = act_stats.get(name)
+            if act_sq is not None and len(act_sq) != kernel.shape[-2]:
+                act_sq = None
+            qkernel = quantize_int8(kernel, act_sq)
+        else:
+            raise ValueError("Unknown quantization mode %s" % mode)
+        quantized[name] = qkernel if rest is None else tuple([qkernel] + rest)
+    return quantized
+
+def activation_stats(sess, model, image, images, feed_dict=None):
+    '''
+    Mean squared activation per channel of the inputs of the quantized layers.
+    model: model dict of _build_model(), the layer inputs are looked up via LAYER_INPUTS
+    images: calibration images, shape=[H, W, 3] each
+    Return: layer -> mean squared activation, shape=[in_channels]
+    '''
+    fetches = {}
+    for layer, input_name in LAYER_INPUTS.items():
+        if input_name in model:
+            fetches[layer] = tf.reduce_mean(tf.square(model[input_name]), [0, 1, 2])
+    if 'conv1_1' not in fetches:
+        fetches['conv1_1'] = tf.reduce_mean(tf.square(image), [0, 1, 2])
+
+    stats = None
+    count = 0
+    for img in images:
+        feed = dict(feed_dict) if feed_dict else {}
+        feed[image] = np.asarray(img)[np.newaxis, ...]
+        values = sess.run(fetches, feed_dict=feed)
+        if stats is None:
+            stats = values
+        else:
+            for layer in stats:
+                stats[layer] += values[layer]
+        count += 1
+    return dict((layer, value / count) for layer, value in stats.items())
+
+def weight_dict_bytes(data_dict):
+    total = 0
+    for value in data_dict.values():
+        for v in (value if isinstance(value, (tuple, list)) else (value,)):
+            total += v['q'].nbytes + v['scale'].nbytes if is_quantized(v) else np.asarray(v).nbytes
+    return total
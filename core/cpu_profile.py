@@ -0,0 +1,152 @@
+'''CPU execution profile for inference processes:
+-- Session thread pools (intra-op / inter-op) configured per process
+-- Pinning of worker processes to disjoint core sets, so N workers do not oversubscribe the cores
+-- An auto-tuner measuring FCN16VGG forward latency/throughput on synthetic input,
+   the best setting is saved as json and loaded by make_session()
+
+USAGE:
+    # once per host, see run/tune_cpu.py
+    tune('../data/val_weights/city_fcn8s_skip_100000.npy', save_path='../data/cpu_profile.json')
+    # in every worker process
+    sess = make_session('../data/cpu_profile.json', worker_index=i, num_workers=n)
+'''
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import os
+import json
+import time
+import subprocess
+import multiprocessing
+
+import numpy as np
+import tensorflow as tf
+
+from network.fcn_vgg16 import FCN16VGG
+
+
+def session_config(intra_op_threads=0, inter_op_threads=0, cpu_only=True):
+    '''
+    intra_op_threads: threads used inside one op e.g a convolution, 0 lets tensorflow decide
+    inter_op_threads: ops run in parallel, 0 lets tensorflow decide
+    '''
+    config = tf.ConfigProto(intra_op_parallelism_threads=intra_op_threads,
+                            inter_op_parallelism_threads=inter_op_threads,
+                            use_per_session_threads=True)
+    if cpu_only:
+        config.device_count['GPU'] = 0
+    return config
+
+def available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(multiprocessing.cpu_count()))
+
+def worker_cores(worker_index, num_workers, cores=None):
+    '''Contiguous share of cores for one of num_workers processes'''
+    if cores is None:
+        cores = available_cores()
+    if num_workers > len(cores):
+        raise ValueError("%d workers for %d cores" % (num_workers, len(cores)))
+    per_worker = len(cores) // num_workers
+    return cores[worker_index * per_worker:(worker_index + 1) * per_worker]
+
+def pin_process(cores, pid=0):
+    '''
+    Restrict a process (the current one if pid is 0) to the given cores.
+    Return: True if the affinity was set
+    '''
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(pid, cores)
+        return True
+    # python 2: use taskset of util-linux
+    try:
+        subprocess.check_call(['taskset', '-pc', ','.join(str(c) for c in cores), str(pid or os.getpid())],
+                              stdout=open(os.devnull, 'w'))
+        return True
+    except (OSError, subprocess.CalledProcessError):
+        print('Warning: could not pin process to cores %s' % str(cores))
+        return False
+
+def load_profile(path):
+    with open(path, 'r') as f:
+        return json.load(f)['best']
+
+def make_session(profile_path=None, worker_index=0, num_workers=1, pin=True, graph=None):
+    '''
+    Session configured for CPU inference.
+    profile_path: json written by tune(), without a profile every worker uses all its cores
+                  for intra-op and 1 thread for inter-op parallelism
+    worker_index, num_workers: the process is pinned to its share of cores if pin
+    '''
+    cores = worker_cores(worker_index, num_workers)
+    if pin and num_workers > 1:
+        pin_process(cores)
+    if profile_path is not None and os.path.isfile(profile_path):
+        profile = load_profile(profile_path)
+        intra = min(profile['intra_op_threads'], len(cores))
+        inter = profile['inter_op_threads']
+    else:
+        intra = len(cores)
+        inter = 1
+    print('CPU session: worker %d/%d, cores %s, intra_op %d, inter_op %d' %
+          (worker_index, num_workers, str(cores), intra, inter))
+    return tf.Session(graph=graph, config=session_config(intra, inter))
+
+def _default_settings(num_cores):
+    threads = sorted(set([1, 2, 4, 8, 16, 32, num_cores // 2, num_cores]))
+    threads = [t for t in threads if 1 <= t <= num_cores]
+    return [(intra, inter) for intra in threads for inter in (1, 2)]
+
+def tune(weight_path, image_size=(512, 1024), settings=None, batch_sizes=(1, 2), runs=5,
+         num_classes=20, scale_min='fcn8s', objective='throughput', save_path=None):
+    '''
+    Measure FCN16VGG forward passes on a random image for every (intra_op, inter_op)
+    setting and batch size, every setting in its own session.
+    objective: 'throughput' (images/s) or 'latency' (ms at batch size 1)
+    Return: {'best': {...}, 'results': [...]}, also written to save_path
+    '''
+    # The weights are loaded once and used by every graph
+    model = FCN16VGG(weight_path)
+    if settings is None:
+        settings = _default_settings(len(available_cores()))
+
+    results = []
+    for intra, inter in settings:
+        graph = tf.Graph()
+        with graph.as_default():
+            image = tf.placeholder(tf.float32, shape=[None, image_size[0], image_size[1], 3])
+            option = {'fcn32s':False, 'fcn16s':False, 'fcn8s':False}
+            option[scale_min] = True
+            predict = model.inference(image, num_classes, scale_min=scale_min, option=option, compact=True)
+            init = tf.initialize_all_variables()
+        with tf.Session(graph=graph, config=session_config(intra, inter)) as sess:
+            sess.run(init)
+            for batch_size in batch_sizes:
+                batch = np.random.uniform(0, 255, (batch_size,) + tuple(image_size) + (3,)).astype(np.float32)
+                # warm up, the first run allocates and selects the kernels
+                sess.run(predict, feed_dict={image: batch})
+                start = time.time()
+                for _ in range(runs):
+                    sess.run(predict, feed_dict={image: batch})
+                seconds = (time.time() - start) / runs
+                result = {'intra_op_threads': intra, 'inter_op_threads': inter, 'batch_size': batch_size,
+                          'latency_ms': 1000.0 * seconds, 'images_per_s': batch_size / seconds}
+                results.append(result)
+                print('intra_op %2d, inter_op %d, batch %d: %8.1f ms, %6.2f img/s' %
+                      (intra, inter, batch_size, result['latency_ms'], result['images_per_s']))
+
+    if objective == 'latency':
+        candidates = [r for r in results if r['batch_size'] == min(batch_sizes)]
+        best = min(candidates, key=lambda r: r['latency_ms'])
+    else:
+        best = max(results, key=lambda r: r['images_per_s'])
+    profile = {'best': best, 'results': results, 'image_size': list(image_size),
+               'objective': objective, 'num_cores': len(available_cores())}
+    print('Best setting: %s' % json.dumps(best))
+
+    if save_path is not None:
+        with open(save_path, 'w') as f:
+            json.dump(profile, f, indent=2)
+        print('CPU profile saved to %s' % save_path)
+    return profile
@@ -6,14 +6,18 @@ import sys
 import random
 import numpy as np
 
-from dataset.VOCDataSet import VOCDataSet
+from dataset.VOCDataSet import VOCDataSet, IGNORE_LABEL
 from dataset.CityDataSet import CityDataSet
+from compression.quantize import is_quantized_dict, dequantize_weight_dict
 
 def load_weight(path):
 
     # Initial network params
     fpath = os.path.abspath(os.path.join(path, os.curdir))
     data_dict = np.load(fpath, encoding='latin1').item()
+    if is_quantized_dict(data_dict):
+        # int8/fp16 weight file of compression/quantize.py
+        data_dict = dequantize_weight_dict(data_dict)
     print("Successfully load weight file from %s."%fpath)
     return data_dict
 
@@ -55,6 +55,7 @@ class CityDataSet():
         ]
         self.trainId2Color = [label.color for label in self.labels]
         self.trainId2labelId = [label.labelId for label in self.labels]
+        self.trainId2labelId_lut = np.array(self.trainId2labelId, dtype=np.uint8)
         # Randomization for training
         self.idx = 0
         self.random = params.get('randomize',True)
@@ -98,6 +99,33 @@ class CityDataSet():
         print('Training images:%d Ground Truth images:%d'%(len(files_img), len(files_lbl)))
         return (files_img, files_lbl)
 
+    def gt_path(self, img_idx, gt_type='labelIds'):
+        '''
+        Path of the gtFine file of a given type for the image at img_idx,
+        e.g gt_type: 'labelIds', 'instanceIds', 'labelTrainIds'
+        '''
+        img_fname = self.img_indices[img_idx]
+        city = os.path.basename(os.path.dirname(img_fname))
+        fname = os.path.basename(img_fname).replace('leftImg8bit', 'gtFine_%s'%gt_type)
+        return os.path.join(self.city_dir, 'gtFine', self.dataset_type, city, fname)
+
+    def sequence_frames(self, img_idx, first=-19, last=10):
+        '''
+        Paths of the leftImg8bit_sequence frames around the annotated image at img_idx,
+        from frame first to frame last relative to it. A snippet holds 30 frames,
+        the annotated one is the 20th. Frames missing on disk are left out.
+        '''
+        img_fname = self.img_indices[img_idx]
+        city = os.path.basename(os.path.dirname(img_fname))
+        city_name, seq, frame, _ = os.path.basename(img_fname).rsplit('_', 3)
+        frames = []
+        for i in range(int(frame) + first, int(frame) + last + 1):
+            fname = '%s_%s_%06d_leftImg8bit.png'%(city_name, seq, i)
+            path = os.path.join(self.city_dir, 'leftImg8bit_sequence', self.dataset_type, city, fname)
+            if os.path.isfile(path):
+                frames.append(path)
+        return frames
+
     def next_batch(self):
         """
         - Reshape image and label, extend 1st axis for batch dimension
@@ -213,13 +241,15 @@ class CityDataSet():
             vector[-iaxis_pad_width[1]:] = values
         return vector
 
-    def save_trainID_img(self, fname_prefix, pred_in):
+    def save_trainID_img(self, fname_prefix, pred_in, img_idx=None):
         '''
         This method is meant to save original prediction into .png
-        pred_in shape: [1, H, W] -> need to reshape to [H, W] to save .png
+        pred_in shape: [1, H, W] or [H, W] -> need to reshape to [H, W] to save .png
+        img_idx: index of the predicted image, the last image of next_batch() if None
         '''
-        # Since self.idx is already increased by 1, need to decrease 1.
-        img_idx = self.idx - 1
+        if img_idx is None:
+            # Since self.idx is already increased by 1, need to decrease 1.
+            img_idx = self.idx - 1
         img_inx = self.img_indices[img_idx].split('/')
         fname = img_inx[6]
         fname = fname.split('_')
@@ -227,12 +257,18 @@ class CityDataSet():
         save_path = os.path.join(self.pred_save_path,fname)
 
         # Reshape to [H,W]
-        pred_in = np.reshape(pred_in, (pred_in.shape[1], pred_in.shape[2]))
+        pred_in = np.reshape(pred_in, (pred_in.shape[-2], pred_in.shape[-1]))
         # Save .png, don't rescale
         toimage(pred_in, high=19, low=0, cmin=0, cmax=19).save(save_path)
         #print("TrainIDs prediction saved to %s "%save_path)
 
 
+    def trainID_to_labelID(self, pred_in):
+        '''
+        Map a trainID prediction of any shape to labelIDs for the evaluation, without going through .png
+        '''
+        return self.trainId2labelId_lut[pred_in]
+
     def pred_to_labelID(self, prefix):
         '''
         For evaluation purpose:
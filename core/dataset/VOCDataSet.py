@@ -8,6 +8,11 @@ import sys
 import random
 import numpy as np
 
+# Label of void pixels in SegmentationClass, also used for the padding of bucketed samples
+IGNORE_LABEL = 255
+# Canonical (height, width) sizes of bucketed samples, multiples of 32, VOC images are at most 500x500
+VOC_BUCKETS = [(352, 512), (512, 352), (384, 512), (512, 384), (512, 512)]
+
 class VOCDataSet():
 
     def __init__(self, params):
@@ -36,6 +41,11 @@ class VOCDataSet():
             random.seed(self.seed)
             self.idx = random.randint(0, len(self.indices)-1)
 
+        # bucketing mode, see next_bucket_batch()
+        self.buckets = sorted(params.get('buckets', VOC_BUCKETS), key=lambda b: (b[0] * b[1], b))
+        self.pending = {}       # bucket -> indices waiting for a full batch
+        self.image_sizes = {}   # index -> (height, width)
+
     def next_batch(self, predef_inx=None):
         """
         - Reshape image and label, extend 1st axis for batch dimension
@@ -44,14 +54,7 @@ class VOCDataSet():
         - Return: (image, label)
         """
         if predef_inx is None:
-            # pick next input
-            if self.random:
-                self.idx = random.randint(0, len(self.indices)-1)
-            else:
-                self.idx += 1
-                if self.idx == len(self.indices):
-                    self.idx = 0
-            idx_str = self.indices[self.idx]
+            idx_str = self.next_index()
         else:
             idx_str = predef_inx
 
@@ -64,6 +67,73 @@ class VOCDataSet():
 
         return (image,label)
 
+    def next_index(self):
+        """Pick the next index, randomly selected(if self.random is set), or incrementally"""
+        if self.random:
+            self.idx = random.randint(0, len(self.indices)-1)
+        else:
+            self.idx += 1
+            if self.idx == len(self.indices):
+                self.idx = 0
+        return self.indices[self.idx]
+
+    def image_size(self, idx):
+        """(height, width) of an image, only the header is read"""
+        if idx not in self.image_sizes:
+            width, height = Image.open('{}/JPEGImages/{}.jpg'.format(self.voc_dir, idx)).size
+            self.image_sizes[idx] = (height, width)
+        return self.image_sizes[idx]
+
+    def bucket_of(self, size):
+        """
+        Smallest bucket holding an image of size (height, width). Larger images get
+        their own bucket, the size rounded up to a multiple of 32.
+        """
+        for bucket in self.buckets:
+            if size[0] <= bucket[0] and size[1] <= bucket[1]:
+                return bucket
+        return (-(-size[0] // 32) * 32, -(-size[1] // 32) * 32)
+
+    def pad_to_bucket(self, image, label, bucket):
+        """
+        Pad image [h, w, 3] with zeros (the mean after preprocessing) and label [1, h, w]
+        with IGNORE_LABEL at the bottom and right to bucket (height, width)
+        """
+        pad_h = bucket[0] - image.shape[0]
+        pad_w = bucket[1] - image.shape[1]
+        image = np.pad(image, ((0, pad_h), (0, pad_w), (0, 0)), mode='constant')
+        label = np.pad(label, ((0, 0), (0, pad_h), (0, pad_w)), mode='constant', constant_values=IGNORE_LABEL)
+        return image, label
+
+    def next_bucket_batch(self, batch_size=1):
+        """
+        Bucketing mode, samples of many sizes are batched in a few canonical shapes:
+        - Samples are picked as next_batch() and grouped by the smallest bucket holding them
+        - Once a bucket holds batch_size samples, they are padded to the bucket size
+          (labels with IGNORE_LABEL, to be ignored by the loss) and returned
+        - Samples without a label are skipped
+        - Return: (images, labels), shape=[batch_size, bucket_h, bucket_w, 3], [batch_size, bucket_h, bucket_w]
+        """
+        while True:
+            idx_str = self.next_index()
+            bucket = self.bucket_of(self.image_size(idx_str))
+            self.pending.setdefault(bucket, []).append(idx_str)
+            if len(self.pending[bucket]) >= batch_size:
+                break
+
+        images = []
+        labels = []
+        for idx_str in self.pending.pop(bucket):
+            label = self.load_label(idx_str)
+            if label is None:
+                continue
+            image, label = self.pad_to_bucket(self.load_image(idx_str), label, bucket)
+            images.append(image)
+            labels.append(label[0])
+        if len(images) == 0:
+            return self.next_bucket_batch(batch_size)
+        return (np.stack(images), np.stack(labels))
+
     def load_indices(self, fold_type='train', classes_dict=None, filter_no_label=False):
         """
         Load indices of images and labels as list
@@ -1,44 +1,111 @@
+# cython: language_level=2
 # cython methods to speed-up evaluation
 
 import numpy as np
 cimport cython
 cimport numpy as np
-import ctypes
 
 np.import_array()
 
 cdef extern from "addToConfusionMatrix_impl.c":
-	void addToConfusionMatrix( const unsigned char* f_prediction_p  ,
-                               const unsigned char* f_groundTruth_p ,
-                               const unsigned int   f_width_i       ,
-                               const unsigned int   f_height_i      ,
-                               unsigned long long*  f_confMatrix_p  ,
-                               const unsigned int   f_confMatDim_i  )
+	unsigned long long addToConfusionMatrix_u8 ( const unsigned char*  f_prediction_p  ,
+	                                             const unsigned char*  f_groundTruth_p ,
+	                                             const unsigned long long f_size_ull   ,
+	                                             unsigned long long*   f_confMatrix_p  ,
+	                                             const unsigned int    f_confMatDim_i  ) nogil
+	unsigned long long addToConfusionMatrix_u16( const unsigned short* f_prediction_p  ,
+	                                             const unsigned short* f_groundTruth_p ,
+	                                             const unsigned long long f_size_ull   ,
+	                                             unsigned long long*   f_confMatrix_p  ,
+	                                             const unsigned int    f_confMatDim_i  ) nogil
 
 
-cdef tonumpyarray(unsigned long long* data, unsigned long long size):
-	if not (data and size >= 0): raise ValueError
-	return np.PyArray_SimpleNewFromData(2, [size, size], np.NPY_UINT64, <void*>data)
+cdef _checkMatrix(np.ndarray confMatrix):
+	if confMatrix.ndim != 2 or confMatrix.shape[0] != confMatrix.shape[1]:
+		raise ValueError("Confusion matrix must be square, got shape {}".format(np.shape(confMatrix)))
+	if confMatrix.dtype != np.uint64 or not confMatrix.flags.c_contiguous or not confMatrix.flags.writeable:
+		raise ValueError("Confusion matrix must be a writeable C-contiguous uint64 array to be updated in place")
 
-@cython.boundscheck(False)
-def cEvaluatePair( np.ndarray[np.uint8_t , ndim=2] predictionArr   ,
-                   np.ndarray[np.uint8_t , ndim=2] groundTruthArr  ,
-                   np.ndarray[np.uint64_t, ndim=2] confMatrix      ,
-                   evalLabels                                    ):
-	cdef np.ndarray[np.uint8_t    , ndim=2, mode="c"] predictionArr_c
-	cdef np.ndarray[np.uint8_t    , ndim=2, mode="c"] groundTruthArr_c
-	cdef np.ndarray[np.ulonglong_t, ndim=2, mode="c"] confMatrix_c
+cdef _checkRange(np.ndarray labels, unsigned int confMatDim_ui, kind):
+	if labels.size == 0:
+		return
+	if labels.min() < 0:
+		raise ValueError("Unknown {} with id {:}".format(kind, labels.min()))
+	if labels.max() >= confMatDim_ui:
+		raise ValueError("Unknown {} with id {:}".format(kind, labels.max()))
+
+cdef _addPair(predictionArr, groundTruthArr, np.ndarray confMatrix):
+	# Only copies if the input is not contiguous or the dtypes differ
+	cdef np.ndarray prediction_c  = np.ascontiguousarray(predictionArr)
+	cdef np.ndarray groundTruth_c = np.ascontiguousarray(groundTruthArr)
+
+	if np.shape(predictionArr) != np.shape(groundTruthArr):
+		raise ValueError("Prediction shape {} and ground truth shape {} are not equal".format(
+		                 np.shape(predictionArr), np.shape(groundTruthArr)))
 
-	predictionArr_c  = np.ascontiguousarray(predictionArr , dtype=np.uint8    )
-	groundTruthArr_c = np.ascontiguousarray(groundTruthArr, dtype=np.uint8    )
-	confMatrix_c     = np.ascontiguousarray(confMatrix    , dtype=np.ulonglong)
+	cdef unsigned int confMatDim_ui    = confMatrix.shape[0]
+	if prediction_c.dtype != groundTruth_c.dtype:
+		# Ids outside of the matrix would wrap in the cast to uint16
+		_checkRange(groundTruth_c, confMatDim_ui, "label")
+		_checkRange(prediction_c, confMatDim_ui, "predicted label")
+		prediction_c  = prediction_c.astype(np.uint16)
+		groundTruth_c = groundTruth_c.astype(np.uint16)
 
-	cdef np.uint32_t height_ui     = predictionArr.shape[1]
-	cdef np.uint32_t width_ui      = predictionArr.shape[0]
-	cdef np.uint32_t confMatDim_ui = confMatrix.shape[0]
+	cdef unsigned long long size_ull   = prediction_c.size
+	cdef unsigned long long* confMat_p = <unsigned long long*> np.PyArray_DATA(confMatrix)
+	cdef void* prediction_p  = np.PyArray_DATA(prediction_c)
+	cdef void* groundTruth_p = np.PyArray_DATA(groundTruth_c)
+	cdef unsigned long long skipped_ull
 
-	addToConfusionMatrix(&predictionArr_c[0,0], &groundTruthArr_c[0,0], height_ui, width_ui, &confMatrix_c[0,0], confMatDim_ui)
+	if prediction_c.dtype == np.uint8:
+		with nogil:
+			skipped_ull = addToConfusionMatrix_u8(<const unsigned char*> prediction_p, <const unsigned char*> groundTruth_p,
+			                                      size_ull, confMat_p, confMatDim_ui)
+	elif prediction_c.dtype == np.uint16:
+		with nogil:
+			skipped_ull = addToConfusionMatrix_u16(<const unsigned short*> prediction_p, <const unsigned short*> groundTruth_p,
+			                                       size_ull, confMat_p, confMatDim_ui)
+	else:
+		raise TypeError("Label maps must be uint8 or uint16, got {}".format(prediction_c.dtype))
 
-	confMatrix = np.ascontiguousarray(tonumpyarray(&confMatrix_c[0,0], confMatDim_ui))
+	if skipped_ull:
+		raise ValueError("{} pixels have a label id outside of the {}x{} confusion matrix".format(
+		                 skipped_ull, confMatDim_ui, confMatDim_ui))
 
-	return np.copy(confMatrix)
\ No newline at end of file
+@cython.boundscheck(False)
+def cEvaluatePair( predictionArr, groundTruthArr, np.ndarray confMatrix, evalLabels=None ):
+	'''
+	Add one pair of label maps (uint8 or uint16, any shape) to confMatrix.
+	confMatrix is updated in place and returned, it is left unchanged if an error is raised.
+	The GIL is released while counting.
+	evalLabels is not used, kept for compatibility.
+	'''
+	_checkMatrix(confMatrix)
+	# counted apart, so an out of range id does not leave partial counts behind
+	cdef np.ndarray scratch = np.zeros_like(confMatrix)
+	_addPair(predictionArr, groundTruthArr, scratch)
+	confMatrix += scratch
+	return confMatrix
+
+@cython.boundscheck(False)
+def cEvaluateBatch( predictionArrs, groundTruthArrs, np.ndarray confMatrix ):
+	'''
+	Add a batch of label map pairs to confMatrix in one call.
+	The batch is either two stacked arrays of shape [N, H, W] or two sequences
+	of arrays which may differ in shape from pair to pair.
+	confMatrix is updated in place and returned, it is left unchanged if an error is raised
+	for any pair of the batch.
+	'''
+	_checkMatrix(confMatrix)
+	cdef np.ndarray scratch = np.zeros_like(confMatrix)
+	if isinstance(predictionArrs, np.ndarray) and isinstance(groundTruthArrs, np.ndarray):
+		# A stacked batch is just one long sequence of pixels
+		_addPair(predictionArrs, groundTruthArrs, scratch)
+	else:
+		if len(predictionArrs) != len(groundTruthArrs):
+			raise ValueError("Batch sizes of prediction {} and ground truth {} are not equal".format(
+			                 len(predictionArrs), len(groundTruthArrs)))
+		for i in range(len(predictionArrs)):
+			_addPair(predictionArrs[i], groundTruthArrs[i], scratch)
+	confMatrix += scratch
+	return confMatrix
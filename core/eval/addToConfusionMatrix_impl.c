@@ -1,17 +1,60 @@
 // cython methods to speed-up evaluation
+//
+// The confusion matrix is updated in place. Every OpenMP thread counts into a
+// private histogram which is merged into the caller's matrix at the end, so
+// threads never write to shared memory inside the pixel loop.
+// Pixels with a label outside of the matrix are skipped and counted, the
+// number of skipped pixels is returned. The other pixels are still merged, the
+// cython wrappers count into a scratch matrix and only add it if none is skipped.
 
-void addToConfusionMatrix( const unsigned char* f_prediction_p  ,
-                           const unsigned char* f_groundTruth_p ,
-                           const unsigned int   f_width_i       ,
-                           const unsigned int   f_height_i      ,
-                           unsigned long long*  f_confMatrix_p  ,
-                           const unsigned int   f_confMatDim_i  )
-{
-    const unsigned int size_ui = f_height_i * f_width_i;
-    for (unsigned int i = 0; i < size_ui; ++i)
-    {
-        const unsigned char predPx = f_prediction_p [i];
-        const unsigned char gtPx   = f_groundTruth_p[i];
-        f_confMatrix_p[f_confMatDim_i*gtPx + predPx] += 1u;
-    }
-}
\ No newline at end of file
+#include <stdlib.h>
+#include <string.h>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+// Below this number of pixels the thread start-up costs more than it gains
+#define CONF_MATRIX_MIN_PARALLEL_PIXELS 65536
+
+#define DEFINE_ADD_TO_CONFUSION_MATRIX(SUFFIX, LABEL_T)                                      \
+unsigned long long addToConfusionMatrix_##SUFFIX( const LABEL_T*       f_prediction_p  ,     \
+                                                  const LABEL_T*       f_groundTruth_p ,     \
+                                                  const unsigned long long f_size_ull  ,     \
+                                                  unsigned long long*  f_confMatrix_p  ,     \
+                                                  const unsigned int   f_confMatDim_i  )     \
+{                                                                                            \
+    const long long size_ll = (long long)f_size_ull;                                         \
+    const size_t matSize = (size_t)f_confMatDim_i * f_confMatDim_i;                          \
+    unsigned long long skipped_ull = 0;                                                      \
+                                                                                             \
+    _Pragma("omp parallel if(size_ll >= CONF_MATRIX_MIN_PARALLEL_PIXELS) reduction(+:skipped_ull)") \
+    {                                                                                        \
+        unsigned long long* hist_p = (unsigned long long*)calloc(matSize, sizeof(unsigned long long)); \
+        long long i;                                                                         \
+        _Pragma("omp for schedule(static)")                                                  \
+        for (i = 0; i < size_ll; ++i)                                                        \
+        {                                                                                    \
+            const unsigned int predPx = f_prediction_p [i];                                  \
+            const unsigned int gtPx   = f_groundTruth_p[i];                                  \
+            if (predPx >= f_confMatDim_i || gtPx >= f_confMatDim_i || !hist_p)               \
+            {                                                                                \
+                ++skipped_ull;                                                               \
+                continue;                                                                    \
+            }                                                                                \
+            hist_p[f_confMatDim_i*gtPx + predPx] += 1u;                                      \
+        }                                                                                    \
+        if (hist_p)                                                                          \
+        {                                                                                    \
+            _Pragma("omp critical(addToConfusionMatrix_merge)")                              \
+            {                                                                                \
+                for (size_t k = 0; k < matSize; ++k)                                         \
+                    f_confMatrix_p[k] += hist_p[k];                                          \
+            }                                                                                \
+            free(hist_p);                                                                    \
+        }                                                                                    \
+    }                                                                                        \
+    return skipped_ull;                                                                      \
+}
+
+DEFINE_ADD_TO_CONFUSION_MATRIX(u8 , unsigned char )
+DEFINE_ADD_TO_CONFUSION_MATRIX(u16, unsigned short)
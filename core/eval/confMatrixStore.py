@@ -0,0 +1,219 @@
+'''
+Store of per image evaluation results in a single file.
+For every image the sparse confusion matrix and the instance statistics are
+kept together with the content hash of the prediction file they were computed from.
+
+ - run_eval(resultPath, storePath) only re-evaluates images whose prediction changed.
+ - Metrics for any subset of images (city, sequence range, list of hard examples)
+   are summed from the stored matrices without reading a single png:
+
+	store = ConfMatrixStore('../data/eval_store.npz')
+	names = store.select(cities=['frankfurt'])
+	result = evalPixelSemantic.evaluateStore(store, names).summary()
+'''
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import os
+import fnmatch
+import hashlib
+
+import numpy as np
+
+from eval.csHelpers import getCsFileInfo
+
+# Order of the values of one entry in the instance statistics
+INST_KEYS = ("tp", "tpWeighted", "fn", "fnWeighted")
+
+# sha1 of the file content, used to detect changed predictions
+def hashFile(fileName):
+    sha = hashlib.sha1()
+    with open(fileName, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def _toStr(value):
+    # names are stored as bytes, str is bytes in python 2 already
+    if not isinstance(value, str):
+        return value.decode('utf-8')
+    return value
+
+class ConfMatrixStore(object):
+
+    def __init__(self, path):
+        self.path = path
+        # image name (<city>_<sequenceNb>_<frameNb>) -> entry
+        self.entries = {}
+        self.confMatDim = None
+        # flattened keys of the instance statistics, e.g 'classes/car/tp'
+        self.instKeys = None
+        self.dirty = False
+        if os.path.isfile(path):
+            self.load()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def names(self):
+        return sorted(self.entries.keys())
+
+    def get(self, name, contentHash=None):
+        '''Return the entry of an image, None if it is unknown or its hash does not match'''
+        entry = self.entries.get(name)
+        if entry is None:
+            return None
+        if contentHash is not None and entry['hash'] != contentHash:
+            return None
+        return entry
+
+    def put(self, name, contentHash, confMatrix, instStats=None):
+        '''Store the confusion matrix and optional instance statistics of one image'''
+        if self.confMatDim is None:
+            self.confMatDim = confMatrix.shape[0]
+        elif self.confMatDim != confMatrix.shape[0]:
+            raise ValueError("Confusion matrix size {} does not match the store size {}".format(
+                             confMatrix.shape[0], self.confMatDim))
+
+        flat = np.asarray(confMatrix).ravel()
+        index = np.flatnonzero(flat)
+        entry = {'hash': contentHash,
+                 'index': index.astype(np.uint32),
+                 'counts': flat[index].astype(np.uint64),
+                 'inst': None}
+        if instStats is not None:
+            if self.instKeys is None:
+                self.instKeys = self._instKeys(instStats)
+            entry['inst'] = np.array([instStats[group][key][stat] for group, key, stat in
+                                      (k.split('/') for k in self.instKeys)], dtype=np.float64)
+        self.entries[name] = entry
+        self.dirty = True
+
+    def _checkNotEmpty(self):
+        # the matrix size is only known from the first stored image
+        if self.confMatDim is None:
+            raise ValueError("The store {} has no entries".format(self.path))
+
+    def matrix(self, name):
+        '''Dense confusion matrix of one image'''
+        self._checkNotEmpty()
+        entry = self.entries[name]
+        flat = np.zeros(self.confMatDim * self.confMatDim, dtype=np.ulonglong)
+        flat[entry['index']] = entry['counts']
+        return flat.reshape(self.confMatDim, self.confMatDim)
+
+    def sum(self, names=None):
+        '''
+        Sum the stored results of the given images, all images if names is None.
+        Return: (confMatrix, instStats, nbInstImages), instStats is None if no
+        image has instance statistics.
+        '''
+        self._checkNotEmpty()
+        if names is None:
+            names = self.names()
+        flat = np.zeros(self.confMatDim * self.confMatDim, dtype=np.ulonglong)
+        instSum = None
+        nbInstImages = 0
+        for name in names:
+            entry = self.entries[name]
+            flat[entry['index']] += entry['counts']
+            if entry['inst'] is not None:
+                instSum = entry['inst'].copy() if instSum is None else instSum + entry['inst']
+                nbInstImages += 1
+
+        instStats = None
+        if instSum is not None:
+            instStats = {"classes": {}, "categories": {}}
+            for value, key in zip(instSum, self.instKeys):
+                group, name, stat = key.split('/')
+                instStats[group].setdefault(name, {})[stat] = float(value)
+        return flat.reshape(self.confMatDim, self.confMatDim), instStats, nbInstImages
+
+    def select(self, cities=None, sequences=None, names=None, pattern=None):
+        '''
+        Names of the stored images matching all given conditions
+        cities: list of city names, e.g ['frankfurt']
+        sequences: (first, last) inclusive range of sequence numbers
+        names: list of image names, e.g a hard example list
+        pattern: fnmatch pattern on the image name, e.g 'lindau_*'
+        '''
+        selected = []
+        for name in self.names():
+            csFile = getCsFileInfo(name + '_x.png')
+            if cities is not None and csFile.city not in cities:
+                continue
+            if sequences is not None and not (sequences[0] <= int(csFile.sequenceNb) <= sequences[1]):
+                continue
+            if names is not None and name not in names:
+                continue
+            if pattern is not None and not fnmatch.fnmatch(name, pattern):
+                continue
+            selected.append(name)
+        return selected
+
+    def load(self):
+        data = np.load(self.path)
+        names = [_toStr(n) for n in data['names'].tolist()]
+        hashes = [_toStr(h) for h in data['hashes'].tolist()]
+        offsets = data['offsets']
+        index = data['index']
+        counts = data['counts']
+        inst = data['inst']
+        hasInst = data['hasInst']
+        self.confMatDim = int(data['confMatDim'])
+        self.instKeys = [_toStr(k) for k in data['instKeys'].tolist()] or None
+
+        self.entries = {}
+        for i, name in enumerate(names):
+            self.entries[name] = {'hash': hashes[i],
+                                  'index': index[offsets[i]:offsets[i+1]],
+                                  'counts': counts[offsets[i]:offsets[i+1]],
+                                  'inst': inst[i] if hasInst[i] else None}
+        self.dirty = False
+        print('Loaded {} images from store {}'.format(len(names), self.path))
+
+    def save(self):
+        names = self.names()
+        entries = [self.entries[name] for name in names]
+        offsets = np.zeros(len(names) + 1, dtype=np.int64)
+        for i, entry in enumerate(entries):
+            offsets[i+1] = offsets[i] + len(entry['index'])
+        nbInstKeys = len(self.instKeys) if self.instKeys else 0
+        inst = np.zeros((len(names), nbInstKeys), dtype=np.float64)
+        hasInst = np.zeros(len(names), dtype=np.bool_)
+        for i, entry in enumerate(entries):
+            if entry['inst'] is not None:
+                inst[i] = entry['inst']
+                hasInst[i] = True
+
+        def concat(key, dtype):
+            if not entries:
+                return np.zeros(0, dtype=dtype)
+            return np.concatenate([entry[key] for entry in entries]).astype(dtype)
+
+        # Write to a temporary file first, so an interrupted save keeps the old store
+        tmpPath = self.path + '.tmp'
+        with open(tmpPath, 'wb') as f:
+            np.savez_compressed(f,
+                                names=np.array(names, dtype=np.string_),
+                                hashes=np.array([entry['hash'] for entry in entries], dtype=np.string_),
+                                offsets=offsets,
+                                index=concat('index', np.uint32),
+                                counts=concat('counts', np.uint64),
+                                inst=inst,
+                                hasInst=hasInst,
+                                confMatDim=np.int64(self.confMatDim or 0),
+                                instKeys=np.array(self.instKeys or [], dtype=np.string_))
+        os.rename(tmpPath, self.path)
+        self.dirty = False
+
+    def _instKeys(self, instStats):
+        keys = []
+        for group in ("classes", "categories"):
+            for name in sorted(instStats[group].keys()):
+                for stat in INST_KEYS:
+                    keys.append('/'.join((group, name, stat)))
+        return keys
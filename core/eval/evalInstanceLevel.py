@@ -0,0 +1,258 @@
+'''
+The script is to evaluate instance level segmentation (AP, AP50) of InstanceFCN8s.
+Support scripts needed:
+ - csHelpers.py
+
+ Predictions are the per class instance index maps returned by InstanceFCN8s.inference:
+ one [H, W] map per predicted class, 0 is background and every other value is one instance.
+ Ground truth are the <city>_123456_123456_gtFine_instanceIds.png files, where the pixels
+ of an instance have the value labelId*1000 + instance number.
+
+ All instance pairs of an image are compared at once: the IoUs are computed from one
+ joint histogram of (predicted id, ground truth id) instead of one mask comparison per pair.
+
+ USAGE:
+  - in-process:
+	evaluator = InstanceEvaluator(classTrainIds=[13])
+	evaluator.add(instance_masks, gt_instanceIds)
+	print(evaluator.summary()['averageAP'])
+  - on files, in parallel across images:
+	evaluator = evaluateFiles(predictionFileLists, groundTruthFiles, classTrainIds=[13], processes=8)
+'''
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import sys
+import threading
+import multiprocessing
+from PIL import Image
+
+from eval.csHelpers import *
+
+# IoU thresholds of the AP, as used by the cityscapes benchmark
+IOU_THRESHOLDS = np.arange(0.5, 1.0, 0.05)
+# Instances (ground truth and prediction) with less pixels are not evaluated
+MIN_REGION_SIZE = 100
+
+# Match the predicted instances of one class to the ground truth instances.
+# Return: (scores, isMatched, nbGt)
+#   scores: score of every predicted instance, shape=[nbPred]
+#   isMatched: true positive flag per IoU threshold, shape=[nbThresholds, nbPred]
+#   nbGt: number of ground truth instances of the class
+def matchInstances(predMask, gtInstances, labelId, confidence=None,
+                   iouThresholds=IOU_THRESHOLDS, minRegionSize=MIN_REGION_SIZE):
+    predMask = np.asarray(predMask)
+    gtInstances = np.asarray(gtInstances)
+    if predMask.shape != gtInstances.shape:
+        raise ValueError("Prediction shape {} and ground truth shape {} are not equal.".format(
+                         predMask.shape, gtInstances.shape))
+
+    # Ground truth ids of this class -> 1..nbGt, everything else -> 0
+    gtClassMask = np.logical_and(gtInstances >= 1000, gtInstances // 1000 == labelId)
+    gtIds, gtIndex = np.unique(gtInstances[gtClassMask], return_inverse=True)
+    gtLabel = np.zeros(gtInstances.shape, dtype=np.int64)
+    gtLabel[gtClassMask] = gtIndex + 1
+    nbGtIds = len(gtIds) + 1
+
+    # Joint histogram of all (prediction, ground truth) pairs in one pass
+    predLabel = predMask.astype(np.int64)
+    nbPredIds = int(predLabel.max()) + 1
+    joint = np.bincount((predLabel * nbGtIds + gtLabel).ravel(),
+                        minlength=nbPredIds * nbGtIds).reshape(nbPredIds, nbGtIds)
+    predArea = joint.sum(axis=1)
+    gtArea = joint.sum(axis=0)
+
+    # Instances are the non background ids that are large enough
+    predIds = np.flatnonzero(predArea[1:] >= minRegionSize) + 1
+    validGt = gtArea[1:] >= minRegionSize
+    nbGt = int(np.count_nonzero(validGt))
+
+    intersection = joint[predIds, 1:].astype(np.float64)
+    union = predArea[predIds, np.newaxis] + gtArea[np.newaxis, 1:] - intersection
+    iou = intersection / np.maximum(union, 1)
+
+    if confidence is not None:
+        # mean confidence over the pixels of each instance
+        confSum = np.bincount(predLabel.ravel(), weights=np.asarray(confidence, dtype=np.float64).ravel(),
+                              minlength=nbPredIds)
+        scores = confSum[predIds] / predArea[predIds]
+    else:
+        # without confidences, larger instances are ranked first
+        scores = predArea[predIds].astype(np.float64)
+
+    # Greedy matching in descending score order, separately for every threshold
+    order = np.argsort(-scores, kind='mergesort')
+    isMatched = np.zeros((len(iouThresholds), len(predIds)), dtype=np.bool_)
+    isIgnored = np.zeros(len(predIds), dtype=np.bool_)
+    for t, threshold in enumerate(iouThresholds):
+        gtTaken = np.zeros(len(gtIds), dtype=np.bool_)
+        for p in order:
+            candidates = np.logical_and(iou[p] >= threshold, np.logical_not(gtTaken))
+            if not candidates.any():
+                continue
+            g = int(np.argmax(np.where(candidates, iou[p], -1.0)))
+            gtTaken[g] = True
+            if validGt[g]:
+                isMatched[t, p] = True
+            elif t == 0:
+                # matched to a too small ground truth instance: neither true nor false positive
+                isIgnored[p] = True
+
+    keep = np.logical_not(isIgnored)
+    return scores[keep], isMatched[:, keep], nbGt
+
+# Match all classes of one image.
+# Return: list with one (scores, isMatched, nbGt) per class
+def matchImage(instanceMasks, gtInstances, classLabelIds, confidences=None,
+               iouThresholds=IOU_THRESHOLDS, minRegionSize=MIN_REGION_SIZE):
+    if len(instanceMasks) != len(classLabelIds):
+        raise ValueError("Got {} instance masks for {} classes.".format(len(instanceMasks), len(classLabelIds)))
+    matches = []
+    for i, labelId in enumerate(classLabelIds):
+        confidence = confidences[i] if confidences is not None else None
+        matches.append(matchInstances(instanceMasks[i], gtInstances, labelId, confidence,
+                                      iouThresholds, minRegionSize))
+    return matches
+
+# Average precision from scored detections, area under the interpolated precision/recall curve
+def getAveragePrecision(scores, isMatched, nbGt):
+    if nbGt == 0:
+        return float('nan')
+    if len(scores) == 0:
+        return 0.0
+    order = np.argsort(-scores, kind='mergesort')
+    tp = np.cumsum(isMatched[order])
+    precision = tp / np.arange(1, len(tp) + 1, dtype=np.float64)
+    recall = tp / float(nbGt)
+
+    # make precision monotonically decreasing
+    precision = np.concatenate(([0.0], precision, [0.0]))
+    recall = np.concatenate(([0.0], recall, [recall[-1]]))
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    return float(np.sum((recall[1:] - recall[:-1]) * precision[1:]))
+
+
+class InstanceEvaluator(object):
+    '''
+    Streaming AP/AP50 evaluator for InstanceFCN8s predictions.
+    classTrainIds: trainIds of the predicted classes, in the order of the masks
+                   returned by InstanceFCN8s.inference, e.g [13] for car
+    '''
+
+    def __init__(self, classTrainIds=(13,), iouThresholds=IOU_THRESHOLDS, minRegionSize=MIN_REGION_SIZE):
+        self.classLabelIds = [trainId2label[trainId].id for trainId in classTrainIds]
+        self.classNames = [id2label[labelId].name for labelId in self.classLabelIds]
+        self.iouThresholds = np.asarray(iouThresholds)
+        self.minRegionSize = minRegionSize
+        # per class: list of scores, list of isMatched, number of ground truth instances
+        self.scores = [[] for _ in self.classLabelIds]
+        self.isMatched = [[] for _ in self.classLabelIds]
+        self.nbGt = [0 for _ in self.classLabelIds]
+        self.nbImages = 0
+        self.lock = threading.Lock()
+
+    def add(self, instanceMasks, gtInstances, confidences=None):
+        '''
+        instanceMasks: list of [H, W] instance index maps, one per class, or the
+                       stacked maps, shape=[H, W, nbClasses], e.g InstanceFCN8s.inference(compact=True)
+        gtInstances: ground truth instanceIds, shape=[H, W]
+        confidences: optional list of [H, W] confidence maps used to rank the instances
+        '''
+        if isinstance(instanceMasks, np.ndarray) and instanceMasks.ndim == 3:
+            instanceMasks = [instanceMasks[..., i] for i in range(instanceMasks.shape[2])]
+        matches = matchImage(instanceMasks, gtInstances, self.classLabelIds, confidences,
+                             self.iouThresholds, self.minRegionSize)
+        self.addMatches(matches)
+
+    def addMatches(self, matches):
+        '''Add the result of matchImage() for one image'''
+        with self.lock:
+            for i, (scores, isMatched, nbGt) in enumerate(matches):
+                self.scores[i].append(scores)
+                self.isMatched[i].append(isMatched)
+                self.nbGt[i] += nbGt
+            self.nbImages += 1
+
+    def merge(self, other):
+        with other.lock:
+            scores = [list(s) for s in other.scores]
+            isMatched = [list(m) for m in other.isMatched]
+            nbGt = list(other.nbGt)
+            nbImages = other.nbImages
+        with self.lock:
+            for i in range(len(self.classLabelIds)):
+                self.scores[i] += scores[i]
+                self.isMatched[i] += isMatched[i]
+                self.nbGt[i] += nbGt[i]
+            self.nbImages += nbImages
+        return self
+
+    def summary(self):
+        '''
+        Return: {'classes': {name: {'AP':, 'AP50':, 'nbGt':, 'nbPred':}},
+                 'averageAP':, 'averageAP50':}
+        '''
+        result = {'classes': {}}
+        idx50 = int(np.argmin(np.abs(self.iouThresholds - 0.5)))
+        with self.lock:
+            for i, name in enumerate(self.classNames):
+                if self.scores[i]:
+                    scores = np.concatenate(self.scores[i])
+                    isMatched = np.concatenate(self.isMatched[i], axis=1)
+                else:
+                    scores = np.zeros(0)
+                    isMatched = np.zeros((len(self.iouThresholds), 0), dtype=np.bool_)
+                aps = [getAveragePrecision(scores, isMatched[t], self.nbGt[i])
+                       for t in range(len(self.iouThresholds))]
+                result['classes'][name] = {'AP': float(np.mean(aps)),
+                                           'AP50': aps[idx50],
+                                           'nbGt': self.nbGt[i],
+                                           'nbPred': len(scores)}
+        apList = [c['AP'] for c in result['classes'].values() if not math.isnan(c['AP'])]
+        ap50List = [c['AP50'] for c in result['classes'].values() if not math.isnan(c['AP50'])]
+        result['averageAP'] = float(np.mean(apList)) if apList else float('nan')
+        result['averageAP50'] = float(np.mean(ap50List)) if ap50List else float('nan')
+        return result
+
+    def printSummary(self):
+        result = self.summary()
+        print('{:<12} {:>8} {:>8} {:>8}'.format('class', 'AP', 'AP50', '#gt'))
+        for name in self.classNames:
+            scores = result['classes'][name]
+            print('{:<12} {:>8.3f} {:>8.3f} {:>8d}'.format(name, scores['AP'], scores['AP50'], scores['nbGt']))
+        print('{:<12} {:>8.3f} {:>8.3f}'.format('average', result['averageAP'], result['averageAP50']))
+        return result
+
+
+# Worker of evaluateFiles(), loads and matches one image
+def _matchFiles(job):
+    predictionFiles, groundTruthFile, classLabelIds, iouThresholds, minRegionSize = job
+    instanceMasks = [np.array(Image.open(fname)) for fname in predictionFiles]
+    gtInstances = np.array(Image.open(groundTruthFile))
+    return matchImage(instanceMasks, gtInstances, classLabelIds, None, iouThresholds, minRegionSize)
+
+def evaluateFiles(predictionFileLists, groundTruthFiles, classTrainIds=(13,), processes=None,
+                  iouThresholds=IOU_THRESHOLDS, minRegionSize=MIN_REGION_SIZE):
+    '''
+    predictionFileLists: per image, the list of instance map pngs, one per class
+    groundTruthFiles: per image, the *_gtFine_instanceIds.png file
+    processes: number of worker processes, all cores if None
+    Return: InstanceEvaluator with all images added
+    '''
+    if len(predictionFileLists) != len(groundTruthFiles):
+        printError("List of images for prediction and groundtruth are not of equal size.")
+    evaluator = InstanceEvaluator(classTrainIds, iouThresholds, minRegionSize)
+    jobs = [(list(preds), gt, evaluator.classLabelIds, evaluator.iouThresholds, minRegionSize)
+            for preds, gt in zip(predictionFileLists, groundTruthFiles)]
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        for i, matches in enumerate(pool.imap(_matchFiles, jobs, chunksize=4)):
+            evaluator.addMatches(matches)
+            print("\rImages Processed: {}".format(i+1), end=' ')
+            sys.stdout.flush()
+    finally:
+        pool.close()
+        pool.join()
+    print("")
+    return evaluator
@@ -22,6 +22,11 @@ Support scripts needed:
   - The number of prediction files and number of groundtruth MUST be the same.
   - The evaluation method reads prediction results in os.environ['CITYSCAPES_RESULTS']
     and groundtruth files in os.environ['CITYSCAPES_GROUNDTRUTH'] to Calculate accuracy.
+
+ USAGE (in-process, on arrays):
+  - Create an Evaluator, add() pairs of predicted and groundtruth labelIds as they
+    are produced and call summary() for the IoU/iIoU result dictionary.
+    No files, environment variables or global args are involved.
 '''
 from __future__ import absolute_import
 from __future__ import division
@@ -29,20 +34,26 @@ from __future__ import print_function
 import os, sys
 import platform
 import fnmatch
+import threading
 from PIL import Image
+from itertools import chain
 try:
     from itertools import izip
 except ImportError:
     izip = zip
 
 from eval.csHelpers import *
+from eval.confMatrixStore import ConfMatrixStore, hashFile
 
 CSUPPORT = True
 if CSUPPORT:
     try:
         import addToConfusionMatrix
     except:
-        CSUPPORT = False
+        try:
+            from eval import addToConfusionMatrix
+        except:
+            CSUPPORT = False
 
 os.environ['CITYSCAPES_DATASET'] = '../data/CityDatabase'
 # To specify where the predictions are
@@ -57,7 +68,38 @@ os.environ['CITYSCAPES_RESULTS'] = '../data/test_city_labelIDs'
 
 class CArgs(object):
 	pass
-args = CArgs()
+
+# Evaluation settings that do not depend on any path.
+# Used for the global args of run_eval() and by every Evaluator instance.
+def createArgs():
+	args = CArgs()
+	args.evalInstLevelScore = True
+	args.evalPixelAccuracy  = True
+	args.evalLabels         = []
+	args.printRow           = 5
+	args.normalized         = True
+	args.colorized          = hasattr(sys.stderr, "isatty") and sys.stderr.isatty() and platform.system()=='Linux'
+	args.bold               = colors.BOLD if args.colorized else ""
+	args.nocol              = colors.ENDC if args.colorized else ""
+	args.JSONOutput         = True
+	args.quiet              = False
+	args.debug              = False
+
+	args.avgClassSize       = {
+	    "bicycle"    :  4672.3249222261 ,
+	    "caravan"    : 36771.8241758242 ,
+	    "motorcycle" :  6298.7200839748 ,
+	    "rider"      :  3930.4788056518 ,
+	    "bus"        : 35732.1511111111 ,
+	    "train"      : 67583.7075812274 ,
+	    "car"        : 12794.0202738185 ,
+	    "person"     :  3462.4756337644 ,
+	    "truck"      : 27855.1264367816 ,
+	    "trailer"    : 16926.9763313609 ,
+	}
+	return args
+
+args = createArgs()
 
 # Specify database path
 if 'CITYSCAPES_DATASET' in os.environ:
@@ -71,32 +113,6 @@ if 'CITYSCAPES_GROUNDTRUTH' in os.environ:
 else:
 	args.groundTruthSearch  = os.path.join( args.cityscapesPath , "gtFine" , "val" , "*", "*_gtFine_labelIds.png" )
 
-
-args.evalInstLevelScore = False
-args.evalPixelAccuracy  = True
-args.evalLabels         = []
-args.printRow           = 5
-args.normalized         = True
-args.colorized          = hasattr(sys.stderr, "isatty") and sys.stderr.isatty() and platform.system()=='Linux'
-args.bold               = colors.BOLD if args.colorized else ""
-args.nocol              = colors.ENDC if args.colorized else ""
-args.JSONOutput         = True
-args.quiet              = False
-args.debug				= False
-
-args.avgClassSize       = {
-    "bicycle"    :  4672.3249222261 ,
-    "caravan"    : 36771.8241758242 ,
-    "motorcycle" :  6298.7200839748 ,
-    "rider"      :  3930.4788056518 ,
-    "bus"        : 35732.1511111111 ,
-    "train"      : 67583.7075812274 ,
-    "car"        : 12794.0202738185 ,
-    "person"     :  3462.4756337644 ,
-    "truck"      : 27855.1264367816 ,
-    "trailer"    : 16926.9763313609 ,
-}
-
 args.predictionPath = None
 args.predictionWalk = None
 
@@ -156,7 +172,7 @@ def generateMatrix(args):
     # We use longlong type to be sure that there are no overflows
     return np.zeros(shape=(maxId+1, maxId+1),dtype=np.ulonglong)
 
-'''
+# Generate empty instance statistics, used for the iIoU scores
 def generateInstanceStats(args):
     instanceStats = {}
     instanceStats["classes"   ] = {}
@@ -189,7 +205,13 @@ def generateInstanceStats(args):
         instanceStats["categories"][category]["labelIds"] = labelIds
 
     return instanceStats
-'''
+
+# Add the instance statistics of src to dst
+def addInstanceStats(dst, src):
+    for group in ("classes", "categories"):
+        for name in src[group]:
+            for key in ("tp", "tpWeighted", "fn", "fnWeighted"):
+                dst[group][name][key] += src[group][name][key]
 
 # Calculate and return IOU score for a particular label
 def getIouScoreForLabel(label, confMatrix, args):
@@ -224,7 +246,6 @@ def getIouScoreForLabel(label, confMatrix, args):
     # return IOU
     return float(tp) / denom
 
-'''
 # Calculate and return iIOU score for a particular label
 def getInstanceIouScoreForLabel(label, confMatrix, instStats, args):
     if id2label[label].ignoreInEval:
@@ -247,7 +268,6 @@ def getInstanceIouScoreForLabel(label, confMatrix, instStats, args):
 
     # return IOU
     return float(tp) / denom
-'''
 
 # Calculate prior for a particular class id. Used to generate result dictionary
 def getPrior(label, confMatrix):
@@ -269,24 +289,82 @@ def getScoreAverage(scoreList, args):
 
 # Calculate and return IOU score for a particular category
 def getIouScoreForCategory(category, confMatrix, args):
-	'''
-	No need for now
-	'''
-	pass
+    # All labels in this category
+    labels = category2labels[category]
+    # The IDs of all valid labels in this category
+    labelIds = [label.id for label in labels if not label.ignoreInEval and label.id in args.evalLabels]
+    # If there are no valid labels, then return NaN
+    if not labelIds:
+        return float('nan')
 
-# Calculate and return IOU score for a particular category
+    # the number of true positive pixels for this category
+    # this is the sum of all entries in the confusion matrix
+    # where row and column belong to a label ID of this category
+    tp = np.longlong(confMatrix[labelIds,:][:,labelIds].sum())
+
+    # the number of false negative pixels for this category
+    # that is the sum of all rows of labels within this category
+    # minus the number of true positive pixels
+    fn = np.longlong(confMatrix[labelIds,:].sum()) - tp
+
+    # the number of false positive pixels for this category
+    # we count the column sum of all labels within this category
+    # while skipping the rows of ignored labels and of labels within this category
+    notIgnoredAndNotInCategory = [l for l in args.evalLabels if not id2label[l].ignoreInEval and id2label[l].category != category]
+    fp = np.longlong(confMatrix[notIgnoredAndNotInCategory,:][:,labelIds].sum())
+
+    # the denominator of the IOU score
+    denom = (tp + fp + fn)
+    if denom == 0:
+        return float('nan')
+
+    # return IOU
+    return float(tp) / denom
+
+# Calculate and return iIOU score for a particular category
 def getInstanceIouScoreForCategory(category, confMatrix, instStats, args):
-	'''
-	No need for now
-	'''
-	pass
+    if not category in instStats["categories"]:
+        return float('nan')
+    labelIds = instStats["categories"][category]["labelIds"]
+
+    tp = instStats["categories"][category]["tpWeighted"]
+    fn = instStats["categories"][category]["fnWeighted"]
+
+    # the number of false positive pixels for this category
+    # same as above
+    notIgnoredAndNotInCategory = [l for l in args.evalLabels if not id2label[l].ignoreInEval and id2label[l].category != category]
+    fp = np.longlong(confMatrix[notIgnoredAndNotInCategory,:][:,labelIds].sum())
+
+    # the denominator of the IOU score
+    denom = (tp + fp + fn)
+    if denom == 0:
+        return float('nan')
+
+    # return IOU
+    return float(tp) / denom
 
 # create a dictionary containing all relevant results
 def createResultDict( confMatrix, classScores, classInstScores, categoryScores, categoryInstScores, perImageStats, args ):
-	'''
-	Implement later. Not crucial
-	'''
-	pass
+    wholeData = {}
+    wholeData["confMatrix"] = confMatrix.tolist()
+    wholeData["priors"] = {}
+    wholeData["labels"] = {}
+    for label in args.evalLabels:
+        wholeData["priors"][id2label[label].name] = getPrior(label, confMatrix)
+        wholeData["labels"][id2label[label].name] = label
+    wholeData["classScores"] = classScores
+    wholeData["classInstScores"] = classInstScores
+    wholeData["categoryScores"] = categoryScores
+    wholeData["categoryInstScores"] = categoryInstScores
+    wholeData["averageScoreClasses"] = getScoreAverage(classScores, args)
+    wholeData["averageScoreInstClasses"] = getScoreAverage(classInstScores, args)
+    wholeData["averageScoreCategories"] = getScoreAverage(categoryScores, args)
+    wholeData["averageScoreInstCategories"] = getScoreAverage(categoryInstScores, args)
+
+    if perImageStats:
+        wholeData["perImageScores"] = perImageStats
+
+    return wholeData
 
 # Write results to a json file.
 def writeJSONFile(wholeData, args):
@@ -353,12 +431,12 @@ def evaluateImgLists(predictionImgList, groundTruthImgList, args):
 	print('The average score is {}'.format(avgScore))
 
     # Calculate instance IOU scores on class level from matrix
-	'''
-	classInstScoreList = {}
-	for label in args.evalLabels:
-	    labelName = id2label[label].name
-	    classInstScoreList[labelName] = getInstanceIouScoreForLabel(label, confMatrix, instStats, args)
-	'''
+	if args.evalInstLevelScore:
+		classInstScoreList = {}
+		for label in args.evalLabels:
+			labelName = id2label[label].name
+			classInstScoreList[labelName] = getInstanceIouScoreForLabel(label, confMatrix, instStats, args)
+		print('The average instance score is {}'.format(getScoreAverage(classInstScoreList, args)))
 
 
     # Print IOU scores
@@ -424,16 +502,15 @@ def evaluatePair(predictionImgFileName, groundTruthImgFileName, confMatrix, inst
 	except:
 		printError("Unable to load " + groundTruthImgFileName)
 
-    # load ground truth instances, if needed. False anyway for now.
-	'''
+    # load ground truth instances, if needed
+	instanceNp = None
 	if args.evalInstLevelScore:
-	    groundTruthInstanceImgFileName = groundTruthImgFileName.replace("labelIds","instanceIds")
-	    try:
-	        instanceImg = Image.open(groundTruthInstanceImgFileName)
-	        instanceNp  = np.array(instanceImg)
-	    except:
-	        printError("Unable to load " + groundTruthInstanceImgFileName)
-	'''
+		groundTruthInstanceImgFileName = groundTruthImgFileName.replace("labelIds","instanceIds")
+		try:
+			instanceImg = Image.open(groundTruthInstanceImgFileName)
+			instanceNp  = np.array(instanceImg)
+		except:
+			printError("Unable to load " + groundTruthInstanceImgFileName)
 
     # Check for equal image sizes
 	if (predictionImg.size[0] != groundTruthImg.size[0]):
@@ -443,75 +520,196 @@ def evaluatePair(predictionImgFileName, groundTruthImgFileName, confMatrix, inst
 	if ( len(predictionNp.shape) != 2 ):
 		printError("Predicted image has multiple channels.")
 
-	imgWidth  = predictionImg.size[0]
-	imgHeight = predictionImg.size[1]
-	nbPixels  = imgWidth*imgHeight
+	return evaluateArrays(predictionNp, groundTruthNp, instanceNp, confMatrix, instanceStats, perImageStats, predictionImgFileName, args)
+
+# Evaluate one pair of prediction and ground truth label maps given as
+# numpy arrays of labelIds. The confusion matrix and the instance stats
+# are updated in place. Returns the number of evaluated pixels.
+def evaluateArrays(predictionNp, groundTruthNp, instanceNp, confMatrix, instanceStats, perImageStats, imageName, args):
+	if predictionNp.shape != groundTruthNp.shape:
+		raise ValueError("Prediction shape {} and ground truth shape {} are not equal.".format(predictionNp.shape, groundTruthNp.shape))
+	if len(predictionNp.shape) != 2:
+		raise ValueError("Predicted image has multiple channels.")
+
+	nbPixels = predictionNp.size
 
     # Evaluate images
-	if (CSUPPORT):
-		# using cython
-		confMatrix = addToConfusionMatrix.cEvaluatePair(predictionNp, groundTruthNp, confMatrix, args.evalLabels)
-	else:
-		# the slower python way
-		for (groundTruthImgPixel,predictionImgPixel) in izip(groundTruthImg.getdata(),predictionImg.getdata()):
-			if (not groundTruthImgPixel in args.evalLabels):
-				printError("Unknown label with id {:}".format(groundTruthImgPixel))
+	addToMatrix(predictionNp, groundTruthNp, confMatrix)
 
-			confMatrix[groundTruthImgPixel][predictionImgPixel] += 1
+	if args.evalInstLevelScore and instanceNp is not None:
+		evaluateInstances(predictionNp, instanceNp, instanceStats, args)
 
-	if args.evalInstLevelScore:
-	    # Generate category masks
-	    categoryMasks = {}
-	    for category in instanceStats["categories"]:
-	        categoryMasks[category] = np.in1d( predictionNp , instanceStats["categories"][category]["labelIds"] ).reshape(predictionNp.shape)
-
-	    instList = np.unique(instanceNp[instanceNp > 1000])
-	    for instId in instList:
-	        labelId = int(instId/1000)
-	        label = id2label[ labelId ]
-	        if label.ignoreInEval:
-	            continue
-
-	        mask = instanceNp==instId
-	        instSize = np.count_nonzero( mask )
-
-	        tp = np.count_nonzero( predictionNp[mask] == labelId )
-	        fn = instSize - tp
-
-	        weight = args.avgClassSize[label.name] / float(instSize)
-	        tpWeighted = float(tp) * weight
-	        fnWeighted = float(fn) * weight
-
-	        instanceStats["classes"][label.name]["tp"]         += tp
-	        instanceStats["classes"][label.name]["fn"]         += fn
-	        instanceStats["classes"][label.name]["tpWeighted"] += tpWeighted
-	        instanceStats["classes"][label.name]["fnWeighted"] += fnWeighted
-
-	        category = label.category
-	        if category in instanceStats["categories"]:
-	            catTp = 0
-	            catTp = np.count_nonzero( np.logical_and( mask , categoryMasks[category] ) )
-	            catFn = instSize - catTp
-
-	            catTpWeighted = float(catTp) * weight
-	            catFnWeighted = float(catFn) * weight
-
-	            instanceStats["categories"][category]["tp"]         += catTp
-	            instanceStats["categories"][category]["fn"]         += catFn
-	            instanceStats["categories"][category]["tpWeighted"] += catTpWeighted
-	            instanceStats["categories"][category]["fnWeighted"] += catFnWeighted
-
-	if args.evalPixelAccuracy:
+	if args.evalPixelAccuracy and imageName is not None:
 		notIgnoredLabels = [l for l in args.evalLabels if not id2label[l].ignoreInEval]
 		notIgnoredPixels = np.in1d( groundTruthNp , notIgnoredLabels , invert=True ).reshape(groundTruthNp.shape)
 		erroneousPixels = np.logical_and( notIgnoredPixels , ( predictionNp != groundTruthNp ) )
-		perImageStats[predictionImgFileName] = {}
-		perImageStats[predictionImgFileName]["nbNotIgnoredPixels"] = np.count_nonzero(notIgnoredPixels)
-		perImageStats[predictionImgFileName]["nbCorrectPixels"]    = np.count_nonzero(erroneousPixels)
+		perImageStats[imageName] = {}
+		perImageStats[imageName]["nbNotIgnoredPixels"] = np.count_nonzero(notIgnoredPixels)
+		perImageStats[imageName]["nbCorrectPixels"]    = np.count_nonzero(erroneousPixels)
 
 	return nbPixels
 
-def run_eval(resultPath):
+# Add the instance statistics of one image, needed for the iIoU scores
+# All instances are handled in a single pass over the instance pixels
+def evaluateInstances(predictionNp, instanceNp, instanceStats, args):
+	instPixelMask = instanceNp > 1000
+	instPixels = instanceNp[instPixelMask]
+	if instPixels.size == 0:
+		return
+	predPixels = predictionNp[instPixelMask]
+
+	# Index every instance pixel by its instance
+	instList, instIndex = np.unique(instPixels, return_inverse=True)
+	instLabelIds = instList // 1000
+	pixelLabelIds = instLabelIds[instIndex]
+
+	# Lookup table labelId -> index of its instance category, -1 for all other labels
+	categories = list(instanceStats["categories"].keys())
+	lutSize = max(int(predPixels.max()), int(instLabelIds.max())) + 1
+	categoryLut = -np.ones(lutSize, dtype=np.int32)
+	for catIdx, category in enumerate(categories):
+		for labelId in instanceStats["categories"][category]["labelIds"]:
+			if labelId < lutSize:
+				categoryLut[labelId] = catIdx
+	pixelCategories = categoryLut[pixelLabelIds]
+
+	nbInst = len(instList)
+	instSizes = np.bincount(instIndex, minlength=nbInst)
+	tps = np.bincount(instIndex, weights=(predPixels == pixelLabelIds), minlength=nbInst)
+	catHits = np.logical_and(categoryLut[predPixels] == pixelCategories, pixelCategories >= 0)
+	catTps = np.bincount(instIndex, weights=catHits, minlength=nbInst)
+
+	for i in range(nbInst):
+		label = id2label[ int(instLabelIds[i]) ]
+		if label.ignoreInEval:
+			continue
+
+		instSize = int(instSizes[i])
+		tp = int(tps[i])
+		fn = instSize - tp
+
+		weight = args.avgClassSize[label.name] / float(instSize)
+		tpWeighted = float(tp) * weight
+		fnWeighted = float(fn) * weight
+
+		instanceStats["classes"][label.name]["tp"]         += tp
+		instanceStats["classes"][label.name]["fn"]         += fn
+		instanceStats["classes"][label.name]["tpWeighted"] += tpWeighted
+		instanceStats["classes"][label.name]["fnWeighted"] += fnWeighted
+
+		category = label.category
+		if category in instanceStats["categories"]:
+			catTp = int(catTps[i])
+			catFn = instSize - catTp
+
+			catTpWeighted = float(catTp) * weight
+			catFnWeighted = float(catFn) * weight
+
+			instanceStats["categories"][category]["tp"]         += catTp
+			instanceStats["categories"][category]["fn"]         += catFn
+			instanceStats["categories"][category]["tpWeighted"] += catTpWeighted
+			instanceStats["categories"][category]["fnWeighted"] += catFnWeighted
+
+# The cython kernel only counts uint8 and uint16 label maps
+def isCompactLabels(labelsNp):
+	return labelsNp.dtype in (np.uint8, np.uint16)
+
+# Add label maps of any shape, or stacked batches of them, to the confusion matrix in place
+def addToMatrix(predictionNp, groundTruthNp, confMatrix):
+	if CSUPPORT and isCompactLabels(predictionNp) and isCompactLabels(groundTruthNp):
+		# using cython, multithreaded and without copies
+		addToConfusionMatrix.cEvaluatePair(predictionNp, groundTruthNp, confMatrix)
+	else:
+		# the slower numpy way
+		confMatDim = confMatrix.shape[0]
+		if groundTruthNp.max() >= confMatDim:
+			raise ValueError("Unknown label with id {:}".format(groundTruthNp.max()))
+		if predictionNp.max() >= confMatDim:
+			raise ValueError("Unknown predicted label with id {:}".format(predictionNp.max()))
+		pairIds = groundTruthNp.astype(np.int64).ravel() * confMatDim + predictionNp.ravel()
+		confMatrix += np.bincount(pairIds, minlength=confMatDim*confMatDim).reshape(confMatDim, confMatDim).astype(np.ulonglong)
+
+# Evaluate image lists pairwise, re-using the per image results of the store.
+# Only pairs whose prediction file changed since the last run are evaluated.
+def evaluateImgListsWithStore(predictionImgList, groundTruthImgList, store, args):
+	if len(predictionImgList) != len(groundTruthImgList):
+		printError("List of images for prediction and groundtruth are not of equal size.")
+
+	nbEvaluated = 0
+	for i in range(len(predictionImgList)):
+		predictionImgFileName = predictionImgList[i]
+		groundTruthImgFileName = groundTruthImgList[i]
+		name = getCoreImageFileName(groundTruthImgFileName)
+		contentHash = hashFile(predictionImgFileName)
+
+		entry = store.get(name, contentHash)
+		if entry is None or (args.evalInstLevelScore and entry['inst'] is None):
+			confMatrix = generateMatrix(args)
+			instStats = generateInstanceStats(args) if args.evalInstLevelScore else None
+			evaluatePair(predictionImgFileName, groundTruthImgFileName, confMatrix, instStats, {}, args)
+			store.put(name, contentHash, confMatrix, instStats)
+			nbEvaluated += 1
+
+		if not args.quiet:
+			print("\rImages Processed: {}".format(i+1), end=' ')
+			sys.stdout.flush()
+	if not args.quiet:
+		print("\n")
+
+	if store.dirty:
+		store.save()
+	print('Evaluated {} changed images, {} taken from store {}'.format(nbEvaluated, len(predictionImgList)-nbEvaluated, store.path))
+
+	names = [getCoreImageFileName(gt) for gt in groundTruthImgList]
+	result = evaluateStore(store, names).summary()
+	avgScore = result["averageScoreClasses"]
+	print('The average score is {}'.format(avgScore))
+	if args.evalInstLevelScore:
+		print('The average instance score is {}'.format(result["averageScoreInstClasses"]))
+	return avgScore
+
+# Evaluator with the summed results of the given images in the store, all images if names is None
+def evaluateStore(store, names=None):
+	evaluator = Evaluator()
+	if names is None:
+		names = store.names()
+	if len(names) == 0:
+		raise ValueError("No images selected from the store {}".format(store.path))
+	confMatrix, instStats, nbInstImages = store.sum(names)
+	evaluator.addStats(confMatrix, instStats, nbImages=len(names), nbInstImages=nbInstImages)
+	return evaluator
+
+# Print the class and average scores of several result dictionaries side by side,
+# e.g of the fcn32s, fcn16s and fcn8s heads evaluated on the same images.
+# results: dict name -> result dictionary of createResultDict() / Evaluator.summary()
+# Return: dict name -> (mIoU, iIoU, category IoU)
+def printScoreComparison(results, names=None):
+    if names is None:
+        names = sorted(results.keys())
+    labelIds = results[names[0]]["labels"]
+    lineWidth = 16 + 10 * len(names)
+    print('{:<16}'.format('IoU') + ''.join('{:>10}'.format(name) for name in names))
+    print('-' * lineWidth)
+    for labelName in sorted(labelIds.keys(), key=lambda n: labelIds[n]):
+        print('{:<16}'.format(labelName) +
+              ''.join('{:>10.3f}'.format(results[name]["classScores"][labelName]) for name in names))
+    print('-' * lineWidth)
+
+    averages = {}
+    for name in names:
+        averages[name] = (results[name]["averageScoreClasses"],
+                          results[name]["averageScoreInstClasses"],
+                          results[name]["averageScoreCategories"])
+    for i, title in enumerate(("mIoU", "iIoU", "category IoU")):
+        print('{:<16}'.format(title) + ''.join('{:>10.3f}'.format(averages[name][i]) for name in names))
+    return averages
+
+def run_eval(resultPath, storePath=None):
+	'''
+	resultPath: directory of the labelIds predictions
+	storePath: optional file of per image results, see confMatrixStore.py.
+	           If given, only changed predictions are evaluated.
+	'''
 	global args
 	
 	args.predictionPath = resultPath
@@ -531,10 +729,171 @@ def run_eval(resultPath):
 	#print('list of predictions: ', predictionImgList)
 	#print('list of truth: ', groundTruthImgList)
 	print('predictions %d truth %d: '%(len(predictionImgList), len(groundTruthImgList)))
-	avgScore = evaluateImgLists(predictionImgList, groundTruthImgList, args)
+	if storePath is None:
+		avgScore = evaluateImgLists(predictionImgList, groundTruthImgList, args)
+	else:
+		avgScore = evaluateImgListsWithStore(predictionImgList, groundTruthImgList, ConfMatrixStore(storePath), args)
 
 	print('evaluation done!')
 
 	return avgScore
 
 
+class Evaluator(object):
+    '''
+    Streaming evaluator on label arrays for in-process validation.
+    Every instance owns its confusion matrix, instance statistics and settings,
+    it neither reads files nor touches the global args, so several evaluators
+    can be used at the same time, e.g one per validation thread, and merged.
+
+    USAGE:
+        evaluator = Evaluator()
+        for each image:
+            evaluator.add(pred_labelIds, gt_labelIds, gt_instances)
+        result = evaluator.summary()
+        print(result['averageScoreClasses'], result['averageScoreInstClasses'])
+    '''
+
+    def __init__(self, evalPixelAccuracy=False):
+        self.args = createArgs()
+        self.args.quiet = True
+        self.args.evalInstLevelScore = True
+        self.args.evalPixelAccuracy = evalPixelAccuracy
+        self.confMatrix = generateMatrix(self.args)
+        self.instStats = generateInstanceStats(self.args)
+        self.perImageStats = {}
+        self.nbImages = 0
+        self.nbInstImages = 0
+        self.nbPixels = 0
+        # add() may be called from several threads
+        self.lock = threading.Lock()
+
+    def add(self, pred_labelIds, gt_labelIds, gt_instances=None, name=None):
+        '''
+        pred_labelIds: predicted labelIds, shape=[H, W], uint8
+        gt_labelIds: ground truth labelIds (*_gtFine_labelIds.png), shape=[H, W], uint8
+        gt_instances: optional ground truth instanceIds (*_gtFine_instanceIds.png), shape=[H, W],
+                      needed for the iIoU scores
+        name: optional image name, used as key for the per image stats
+        '''
+        pred_labelIds = np.asarray(pred_labelIds)
+        gt_labelIds = np.asarray(gt_labelIds)
+        if gt_instances is not None:
+            gt_instances = np.asarray(gt_instances)
+
+        # Evaluate into private stats first, so the lock is only held for the merge
+        confMatrix = np.zeros_like(self.confMatrix)
+        instStats = generateInstanceStats(self.args)
+        perImageStats = {}
+        nbPixels = evaluateArrays(pred_labelIds, gt_labelIds, gt_instances, confMatrix,
+                                  instStats, perImageStats, name, self.args)
+
+        with self.lock:
+            self.confMatrix += confMatrix
+            if gt_instances is not None:
+                addInstanceStats(self.instStats, instStats)
+                self.nbInstImages += 1
+            self.perImageStats.update(perImageStats)
+            self.nbImages += 1
+            self.nbPixels += nbPixels
+        return nbPixels
+
+    def addBatch(self, pred_labelIds, gt_labelIds, gt_instances=None):
+        '''
+        Add a batch of images in one call, the fastest path with cython support.
+        pred_labelIds, gt_labelIds: stacked arrays of shape [N, H, W] or lists of [H, W] arrays
+        gt_instances: optional, same layout as gt_labelIds
+        '''
+        if len(pred_labelIds) != len(gt_labelIds):
+            raise ValueError("Batch sizes of prediction {} and ground truth {} are not equal.".format(
+                             len(pred_labelIds), len(gt_labelIds)))
+        confMatrix = np.zeros_like(self.confMatrix)
+        nbPixels = 0
+        # e.g a raw int64 tf.argmax batch takes the numpy path, which checks the label range
+        compact = all(isCompactLabels(np.asarray(labels)) for labels in chain(pred_labelIds, gt_labelIds))
+        if CSUPPORT and compact:
+            addToConfusionMatrix.cEvaluateBatch(pred_labelIds, gt_labelIds, confMatrix)
+            nbPixels = sum(np.asarray(pred).size for pred in pred_labelIds)
+        else:
+            for pred, gt in izip(pred_labelIds, gt_labelIds):
+                addToMatrix(np.asarray(pred), np.asarray(gt), confMatrix)
+                nbPixels += np.asarray(pred).size
+
+        instStats = generateInstanceStats(self.args)
+        if gt_instances is not None:
+            for pred, inst in izip(pred_labelIds, gt_instances):
+                evaluateInstances(np.asarray(pred), np.asarray(inst), instStats, self.args)
+
+        with self.lock:
+            self.confMatrix += confMatrix
+            if gt_instances is not None:
+                addInstanceStats(self.instStats, instStats)
+                self.nbInstImages += len(gt_instances)
+            self.nbImages += len(pred_labelIds)
+            self.nbPixels += nbPixels
+        return nbPixels
+
+    def addStats(self, confMatrix, instStats=None, nbImages=1, nbInstImages=None):
+        '''Add already accumulated results, e.g summed from a ConfMatrixStore'''
+        with self.lock:
+            self.confMatrix += confMatrix.astype(self.confMatrix.dtype)
+            if instStats is not None:
+                addInstanceStats(self.instStats, instStats)
+                self.nbInstImages += nbImages if nbInstImages is None else nbInstImages
+            self.nbImages += nbImages
+            self.nbPixels += int(confMatrix.sum())
+
+    def merge(self, other):
+        '''Add all results collected by another Evaluator to this one'''
+        with other.lock:
+            confMatrix = other.confMatrix.copy()
+            instStats = generateInstanceStats(self.args)
+            addInstanceStats(instStats, other.instStats)
+            perImageStats = dict(other.perImageStats)
+            counts = (other.nbImages, other.nbInstImages, other.nbPixels)
+
+        with self.lock:
+            self.confMatrix += confMatrix
+            addInstanceStats(self.instStats, instStats)
+            self.perImageStats.update(perImageStats)
+            self.nbImages += counts[0]
+            self.nbInstImages += counts[1]
+            self.nbPixels += counts[2]
+        return self
+
+    def summary(self):
+        '''
+        Return the same result dictionary as createResultDict(), e.g
+        result['classScores'], result['averageScoreClasses'] for IoU and
+        result['classInstScores'], result['averageScoreInstClasses'] for iIoU.
+        iIoU scores are nan if no ground truth instances were added.
+        '''
+        with self.lock:
+            confMatrix = self.confMatrix.copy()
+            instStats = generateInstanceStats(self.args)
+            addInstanceStats(instStats, self.instStats)
+            perImageStats = dict(self.perImageStats)
+            hasInstances = self.nbInstImages > 0
+        args = self.args
+
+        classScores = {}
+        classInstScores = {}
+        for label in args.evalLabels:
+            labelName = id2label[label].name
+            classScores[labelName] = getIouScoreForLabel(label, confMatrix, args)
+            if hasInstances:
+                classInstScores[labelName] = getInstanceIouScoreForLabel(label, confMatrix, instStats, args)
+            else:
+                classInstScores[labelName] = float('nan')
+
+        categoryScores = {}
+        categoryInstScores = {}
+        for category in category2labels.keys():
+            categoryScores[category] = getIouScoreForCategory(category, confMatrix, args)
+            if hasInstances:
+                categoryInstScores[category] = getInstanceIouScoreForCategory(category, confMatrix, instStats, args)
+            else:
+                categoryInstScores[category] = float('nan')
+
+        return createResultDict(confMatrix, classScores, classInstScores, categoryScores,
+                                categoryInstScores, perImageStats, args)
@@ -6,6 +6,7 @@
 
 try:
 	from distutils.core import setup
+	from distutils.extension import Extension
 	from Cython.Build import cythonize
 except:
 	print("Unable to setup. Please use pip to install: cython")
@@ -16,4 +17,10 @@ import numpy
 os.environ["CC"] = "g++"
 os.environ["CXX"] = "g++"
 
-setup(ext_modules = cythonize("addToConfusionMatrix.pyx"),include_dirs=[numpy.get_include()])
\ No newline at end of file
+# OpenMP for the multithreaded confusion matrix kernel
+extensions = [Extension("addToConfusionMatrix", ["addToConfusionMatrix.pyx"],
+                        include_dirs=[numpy.get_include()],
+                        extra_compile_args=["-O3", "-fopenmp"],
+                        extra_link_args=["-fopenmp"])]
+
+setup(ext_modules = cythonize(extensions),include_dirs=[numpy.get_include()])
@@ -0,0 +1,205 @@
+"""Batched inference for the models in this package.
+Images of equal shape are stacked into batches and evaluated with one sess.run,
+the outputs are split again and returned per image, in input order.
+The image placeholder must have an unknown batch dimension, e.g [None, None, None, 3].
+MicroBatcher does the same for concurrent requests of a long running service.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+import threading
+import collections
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+import numpy as np
+
+
+def _split_outputs(outputs, num_images):
+    '''
+    Split fetched outputs along the batch axis, the structure (dict, list or array) is kept.
+    Return: list with the outputs of every image
+    '''
+    if isinstance(outputs, dict):
+        per_key = dict((key, _split_outputs(value, num_images)) for key, value in outputs.items())
+        return [dict((key, per_key[key][b]) for key in per_key) for b in range(num_images)]
+    if isinstance(outputs, (list, tuple)):
+        per_item = [_split_outputs(value, num_images) for value in outputs]
+        return [[item[b] for item in per_item] for b in range(num_images)]
+    return [outputs[b] for b in range(num_images)]
+
+def iter_batched(sess, fetches, image, images, batch_size=4, feed_dict=None):
+    '''
+    Generator version of run_batched(), yields (index, outputs) per image in input order.
+    Frames are buffered until batch_size frames of the same shape are collected. With mixed
+    shapes the bucket of the oldest frame is run early as an incomplete batch as soon as more
+    than batch_size frames or outputs are held, so a rare shape does not hold back the
+    frames after it and at most batch_size + 1 frames are buffered.
+    '''
+    buckets = {}        # image shape -> [(index, image)]
+    done = {}           # index -> outputs, finished but not yet yielded
+    next_index = 0
+
+    def run_bucket(shape):
+        bucket = buckets.pop(shape)
+        batch = np.stack([img for _, img in bucket])
+        feed = dict(feed_dict) if feed_dict else {}
+        feed[image] = batch
+        outputs = _split_outputs(sess.run(fetches, feed_dict=feed), len(bucket))
+        for (idx, _), output in zip(bucket, outputs):
+            done[idx] = output
+
+    count = 0
+    for count, img in enumerate(images, 1):
+        img = np.asarray(img)
+        if img.ndim == 4:
+            # a single image with batch dimension, as returned by next_batch()
+            img = img[0]
+        buckets.setdefault(img.shape, []).append((count - 1, img))
+        if len(buckets[img.shape]) >= batch_size:
+            run_bucket(img.shape)
+        while next_index not in done and count - next_index > batch_size:
+            # the oldest frame blocks the output, its bucket is the one starting with it
+            run_bucket([shape for shape, bucket in buckets.items() if bucket[0][0] == next_index][0])
+        while next_index in done:
+            yield next_index, done.pop(next_index)
+            next_index += 1
+
+    # Incomplete batches at the end of the input
+    for shape in list(buckets.keys()):
+        run_bucket(shape)
+    while next_index < count:
+        yield next_index, done.pop(next_index)
+        next_index += 1
+
+def run_batched(sess, fetches, image, images, batch_size=4, feed_dict=None):
+    '''
+    Input
+    fetches: outputs of inference(), their first axis must be the batch axis,
+             e.g the dict of FCN16VGG.inference or the list of InstanceFCN8s.inference(squeeze=False)
+    image: image placeholder, shape=[None, H, W, 3]
+    images: list or generator of images, shape=[H, W, 3] or [1, H, W, 3]
+    batch_size: maximum number of images in one sess.run
+    feed_dict: additional feeds of every run
+
+    Return: list of outputs per image, in the order of images, with the same
+            structure as fetches and the batch axis removed
+    '''
+    return [outputs for _, outputs in iter_batched(sess, fetches, image, images, batch_size, feed_dict)]
+
+
+class MicroBatcher(object):
+    '''
+    Coalesce concurrent single image requests into batches for a long running service.
+    A worker thread takes the oldest request and waits at most max_latency seconds for
+    more requests of the same image shape, up to max_batch_size, then runs one sess.run.
+    Requests of other shapes stay queued for the next batch.
+
+    USAGE:
+        batcher = MicroBatcher(sess, fetches, image, max_batch_size=4, max_latency=0.02)
+        outputs = batcher.predict(img)      # from any thread, blocks until done
+        print(batcher.stats())
+    '''
+
+    def __init__(self, sess, fetches, image, max_batch_size=4, max_latency=0.02, history=1000):
+        self.sess = sess
+        self.fetches = fetches
+        self.image = image
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.requests = queue.Queue()
+        # requests taken from the queue but not fitting into the last batch
+        self.pending = []
+        # per request seconds from predict() to the result, of the last history requests
+        self.latencies = collections.deque(maxlen=history)
+        self.batch_sizes = collections.deque(maxlen=history)
+        self.num_images = 0
+        self.num_batches = 0
+        self.lock = threading.Lock()
+        self.worker = threading.Thread(target=self._run)
+        self.worker.daemon = True
+        self.worker.start()
+
+    def predict(self, img):
+        '''
+        img: one image, shape=[H, W, 3], preprocessed like CityDataSet.load_image
+        Return: the outputs of this image with the structure of fetches
+        '''
+        request = {'image': np.asarray(img), 'start': time.time(),
+                   'done': threading.Event(), 'outputs': None, 'error': None}
+        self.requests.put(request)
+        request['done'].wait()
+        if request['error'] is not None:
+            raise request['error']
+        return request['outputs']
+
+    def queue_depth(self):
+        return self.requests.qsize() + len(self.pending)
+
+    def stats(self):
+        '''Queue depth, counters and latency percentiles in ms of the recent requests'''
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000.0
+            batch_sizes = np.array(self.batch_sizes)
+            stats = {'queue_depth': self.queue_depth(),
+                     'images': self.num_images,
+                     'batches': self.num_batches}
+        stats['mean_batch_size'] = float(batch_sizes.mean()) if len(batch_sizes) else 0.0
+        stats['latency_ms'] = {}
+        for p in (50, 90, 99):
+            stats['latency_ms']['p%d'%p] = float(np.percentile(latencies, p)) if len(latencies) else 0.0
+        return stats
+
+    def _next_request(self, timeout=None):
+        if self.pending:
+            return self.pending.pop(0)
+        try:
+            return self.requests.get(timeout=timeout) if timeout is None or timeout > 0 else self.requests.get_nowait()
+        except queue.Empty:
+            return None
+
+    def _collect(self):
+        first = self._next_request()
+        batch = [first]
+        shape = first['image'].shape
+        deadline = first['start'] + self.max_latency
+        skipped = []
+        while len(batch) < self.max_batch_size:
+            if self.pending:
+                request = self.pending.pop(0)
+            else:
+                request = self._next_request(max(deadline - time.time(), 0))
+            if request is None:
+                break
+            if request['image'].shape == shape:
+                batch.append(request)
+            else:
+                skipped.append(request)
+        self.pending = skipped + self.pending
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                feed = {self.image: np.stack([request['image'] for request in batch])}
+                outputs = _split_outputs(self.sess.run(self.fetches, feed_dict=feed), len(batch))
+                for request, output in zip(batch, outputs):
+                    request['outputs'] = output
+            except Exception as e:
+                for request in batch:
+                    request['error'] = e
+
+            now = time.time()
+            with self.lock:
+                for request in batch:
+                    self.latencies.append(now - request['start'])
+                self.batch_sizes.append(len(batch))
+                self.num_images += len(batch)
+                self.num_batches += 1
+            for request in batch:
+                request['done'].set()
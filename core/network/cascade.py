@@ -0,0 +1,99 @@
+"""Cascaded coarse-to-fine inference of FCN16VGG.
+1. coarse pass: the trunk, the fcn32s scores (score_fr, 1/32 resolution) and their softmax margin
+   (top1 - top2 probability). The coarse labels are upsampled as labels only, see nn.upsample_argmax(),
+   they equal the fcn32s argmax when upscore_fr_32s has its bilinear kernel.
+   pool3 and fuse_pool4 are fetched for the fine pass, the fcn8s decoder is not run.
+2. fine pass: only on the tiles with a cell below the margin threshold (or next to one), the cropped
+   pool3/fuse_pool4 features plus a halo are fed into the same graph, so only the fcn8s skip fusion
+   and the full resolution upsampling of the tile are computed.
+Confident tiles keep the coarse labels. For image sizes that are multiples of 32 the refined tiles
+equal the full fcn8s prediction, the halo covers the support of the upscore kernels.
+
+USAGE:
+    model = fcn._build_model(image, num_classes, scale_min='fcn8s')
+    cascade = build_cascade(model, image)
+    labels, refined = cascade_predict(sess, model, cascade, image, img, tile_size=256, threshold=0.3)
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+sys.path.append("..")
+
+import numpy as np
+import tensorflow as tf
+import nn
+from network.tiling import TILE_MULTIPLE
+
+# Halo of a refined tile in pixels, covers the upscore_pool4_2s and upscore8 kernels
+CASCADE_HALO = 32
+
+
+def build_cascade(model, image):
+    '''
+    Tensors of the cascade on top of a model dict of FCN16VGG._build_model() with scale_min 'fcn8s'.
+    Return: dict 'coarse': coarse labels, shape=[batch, H, W], 'margin': softmax margin at 1/32,
+            'fine': fcn8s argmax, shape=[batch, H, W]
+    '''
+    if 'fuse_pool4' not in model or 'fcn8s' not in model:
+        raise ValueError('The cascade needs a model built with scale_min fcn8s')
+    top2 = tf.nn.top_k(tf.nn.softmax(model['score_fr']), 2)[0]
+    return {'coarse': nn.upsample_argmax(model['score_fr'], tf.shape(image), 32),
+            'margin': top2[..., 0] - top2[..., 1],
+            'fine': tf.argmax(model['fcn8s'], dimension=3)}
+
+def uncertain_tiles(margin, tile_size, threshold):
+    '''
+    margin: softmax margin of the coarse head, shape=[h/32, w/32]
+    Return: (row, col) of the tiles holding a cell with a margin below threshold,
+            the cells next to a tile count as well, a boundary may cross the tile border
+    '''
+    cells = tile_size // TILE_MULTIPLE
+    uncertain = margin < threshold
+    tiles = []
+    for row in range(int(np.ceil(margin.shape[0] / cells))):
+        for col in range(int(np.ceil(margin.shape[1] / cells))):
+            window = uncertain[max(row * cells - 1, 0):(row + 1) * cells + 1,
+                               max(col * cells - 1, 0):(col + 1) * cells + 1]
+            if window.any():
+                tiles.append((row, col))
+    return tiles
+
+def cascade_predict(sess, model, cascade, image, img, tile_size=256, threshold=0.3, feed_dict=None):
+    '''
+    Input
+    model: model dict of FCN16VGG._build_model() with scale_min 'fcn8s', image: its placeholder [1, None, None, 3]
+    cascade: tensors of build_cascade()
+    img: one image, shape=[H, W, 3]
+    tile_size: side of the refined tiles in pixels, a multiple of 32
+    threshold: cells with a softmax margin below it are refined
+    feed_dict: additional feeds of every run
+    Return: (labels, shape=[H, W], fraction of the pixels refined)
+    '''
+    if tile_size % TILE_MULTIPLE:
+        raise ValueError('tile_size must be a multiple of %d, got %d' % (TILE_MULTIPLE, tile_size))
+    img = np.asarray(img)
+    height, width = img.shape[:2]
+    feed = dict(feed_dict) if feed_dict else {}
+    feed[image] = img[np.newaxis, ...]
+    coarse, margin, pool3, fuse_pool4 = sess.run([cascade['coarse'], cascade['margin'],
+                                                  model['pool3'], model['fuse_pool4']], feed_dict=feed)
+    labels = coarse[0]
+
+    refined = 0
+    for row, col in uncertain_tiles(margin[0], tile_size, threshold):
+        y0, x0 = row * tile_size, col * tile_size
+        y1, x1 = min(y0 + tile_size, height), min(x0 + tile_size, width)
+        # tile with halo, on the 1/16 grid so the crops of pool3 and fuse_pool4 align
+        ry0, rx0 = max(y0 - CASCADE_HALO, 0), max(x0 - CASCADE_HALO, 0)
+        ry1, rx1 = min(y1 + CASCADE_HALO, height), min(x1 + CASCADE_HALO, width)
+        feed = dict(feed_dict) if feed_dict else {}
+        feed[model['pool3']] = pool3[:, ry0 // 8:-(-ry1 // 8), rx0 // 8:-(-rx1 // 8)]
+        feed[model['fuse_pool4']] = fuse_pool4[:, ry0 // 16:-(-ry1 // 16), rx0 // 16:-(-rx1 // 16)]
+        # only the shape of the image is used behind the fed features
+        feed[image] = np.zeros((1, ry1 - ry0, rx1 - rx0, 3), dtype=np.float32)
+        fine = sess.run(cascade['fine'], feed_dict=feed)[0]
+        labels[y0:y1, x0:x1] = fine[y0 - ry0:y1 - ry0, x0 - rx0:x1 - rx0]
+        refined += (y1 - y0) * (x1 - x0)
+    return labels, refined / float(height * width)
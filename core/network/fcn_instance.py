@@ -14,12 +14,14 @@ import tensorflow as tf
 import numpy as np
 import nn
 import data_utils as dt
+from network.vgg16_trunk import build_trunk
 
 DATA_DIR = 'data'
 
 class InstanceFCN8s:
 
-    def __init__(self, data_path=None, pred_class={11:'person', 13:'car'}, gt_class={11:'person', 13:'car'}):
+    def __init__(self, data_path=None, pred_class={11:'person', 13:'car'}, gt_class={11:'person', 13:'car'},
+                 backbone='vgg16'):
         # Define classes to be segmented to instance level e.g {11:'person', 13:'car'}
         self.gt_class = gt_class
         self.pred_class = pred_class
@@ -27,17 +29,21 @@ class InstanceFCN8s:
         self.num_gt_class = len(gt_class)
 
 
+        # 'vgg16' or 'lite', see network/vgg16_trunk.py
+        self.backbone = backbone
+
         # Load pretrained weight
-        data_dict = dt.load_weight(data_path)
+        data_dict = dt.load_weight(data_path) if data_path is not None else {}
         self.data_dict = data_dict
 
         # used to save trained weights
         self.var_dict = {}
+        # used to assign new weights to the built model, see load_weights()
+        self.assign_ops = {}
 
 
     def _build_model(self, image, max_instance, direct_slice, is_train=False, save_var=False, val_dict=None):
 
-        model = {}
         if val_dict is None:
             # Not during validation, use pretrained weight
             feed_dict = self.data_dict
@@ -53,50 +59,24 @@ class InstanceFCN8s:
             var_dict = None
 
 
-        # Step1: build fcn8s and score_out which has shape[H, W, Classes]
-        model['conv1_1'] = nn.conv_layer(image, feed_dict, "conv1_1", var_dict=var_dict)
-        model['conv1_2'] = nn.conv_layer(model['conv1_1'], feed_dict, "conv1_2", var_dict=var_dict)
-        model['pool1'] = nn.max_pool_layer(model['conv1_2'], "pool1")
-
-        model['conv2_1'] = nn.conv_layer(model['pool1'], feed_dict, "conv2_1", var_dict=var_dict)
-        model['conv2_2'] = nn.conv_layer(model['conv2_1'], feed_dict, "conv2_2", var_dict=var_dict)
-        model['pool2'] = nn.max_pool_layer(model['conv2_2'], "pool2")
-
-        model['conv3_1'] = nn.conv_layer(model['pool2'], feed_dict, "conv3_1", var_dict=var_dict)
-        model['conv3_2'] = nn.conv_layer(model['conv3_1'], feed_dict, "conv3_2", var_dict=var_dict)
-        model['conv3_3'] = nn.conv_layer(model['conv3_2'], feed_dict, "conv3_3", var_dict=var_dict)
-        model['pool3'] = nn.max_pool_layer(model['conv3_3'], "pool3")
-
-        model['conv4_1'] = nn.conv_layer(model['pool3'], feed_dict, "conv4_1", var_dict=var_dict)
-        model['conv4_2'] = nn.conv_layer(model['conv4_1'], feed_dict, "conv4_2", var_dict=var_dict)
-        model['conv4_3'] = nn.conv_layer(model['conv4_2'], feed_dict, "conv4_3", var_dict=var_dict)
-        model['pool4'] = nn.max_pool_layer(model['conv4_3'], "pool4")
-
-
-        model['conv5_1'] = nn.conv_layer(model['pool4'], feed_dict, "conv5_1", var_dict=var_dict)
-        model['conv5_2'] = nn.conv_layer(model['conv5_1'], feed_dict, "conv5_2", var_dict=var_dict)
-        model['conv5_3'] = nn.conv_layer(model['conv5_2'], feed_dict, "conv5_3", var_dict=var_dict)
-        model['pool5'] = nn.max_pool_layer(model['conv5_3'], "pool5")
-
-        model['conv6_1'] = nn.conv_layer(model['pool5'], feed_dict, "conv6_1",
-                                         shape=[3, 3, 512, 512], dropout=is_train,
-                                         keep_prob=0.5, var_dict=var_dict)
+        # Step1: VGG16 trunk up to conv7
+        model = build_trunk(self.backbone, image, feed_dict, is_train=is_train, var_dict=var_dict)
+        # Step2: instance mask skip decoder
+        self._build_mask_decoder(model, image, feed_dict, max_instance, var_dict)
 
-        model['conv6_2'] = nn.conv_layer(model['conv6_1'], feed_dict, "conv6_2",
-                                         shape=[3, 3, 512, 512], dropout=is_train,
-                                         keep_prob=0.5, var_dict=var_dict)
-
-        model['conv6_3'] = nn.conv_layer(model['conv6_2'], feed_dict, "conv6_3",
-                                         shape=[3, 3, 512, 4096], dropout=is_train,
-                                         keep_prob=0.5, var_dict=var_dict)
-
-        model['conv7'] = nn.conv_layer(model['conv6_3'], feed_dict, "conv7",
-                                       shape=[1, 1, 4096, 4096], dropout=is_train,
-                                       keep_prob=0.5, var_dict=var_dict)
+        print('InstanceFCN8s model is builded successfully!')
+        print('Model: %s' % str(model.keys()))
+        return model
 
+    def _build_mask_decoder(self, model, image, feed_dict, max_instance, var_dict=None):
+        '''
+        Instance mask skip decoder on top of the trunk: score_fr_mask, the skip fusions
+        with pool4/pool3 and upmask, shape=[batch, h, w, num_pred_class * max_instance].
+        The outputs are added to model.
+        '''
         # Skip feature fusion
         model['score_fr'] = nn.conv_layer(model['conv7'], feed_dict, "score_fr_mask",
-                                          shape=[1, 1, 4096, self.num_pred_class * max_instance], relu=False,
+                                          shape=[1, 1, model['conv7'].get_shape()[3].value, self.num_pred_class * max_instance], relu=False,
                                           dropout=False, var_dict=var_dict)
 
         # Upsample: score_fr*2
@@ -124,6 +104,8 @@ class InstanceFCN8s:
                                     relu=False, dropout=False, var_dict=var_dict)
 
         score_out = tf.add(upscore_pool4_2s, score_pool3)
+        # 1/8 resolution scores, see inference_lowres()
+        model['score_out'] = score_out
 
     
        
@@ -132,8 +114,6 @@ class InstanceFCN8s:
                                   "upmask", tf.shape(image), self.num_pred_class * max_instance,
                                   ksize=16, stride=8, var_dict=var_dict)
 
-        print('InstanceFCN8s model is builded successfully!')
-        print('Model: %s' % str(model.keys()))
         return model
 
     def train(self, params, image, gt_masks, direct_slice=True, save_var=True):
@@ -162,21 +142,90 @@ class InstanceFCN8s:
         
         return train_step, loss
 
-    def inference(self, params, image, direct_slice=True):
+    def load_weights(self, sess, data_dict):
+        '''
+        Assign a new weight dict e.g a checkpoint saved by the training scripts to the
+        variables of the built model. The model must be built with save_var=True.
+        '''
+        nn.assign_var_dict(sess, self.var_dict, data_dict, self.assign_ops)
+
+    def inference(self, params, image, direct_slice=True, save_var=False, squeeze=True, logits=False,
+                  resize_factor=1.0, upsample='logits', compact=False):
         """
-        Input: image
-        Return: a stack of masks, shape = [h, w, num_classes],
+        Input: image, shape = [batch, h, w, 3]
+        save_var: keep the variables in var_dict, needed to swap weights with load_weights()
+        squeeze: remove the batch axis of a single image, must be False for batches,
+                 see network.batch_inference.run_batched()
+        logits: return the upscored scores of every class instead of the argmax,
+                shape = [batch, h, w, max_instance] each, squeeze is not applied
+        resize_factor: run the network on the image resized by this factor (float or scalar tensor),
+                       the masks are upsampled to the original size again
+        upsample: 'logits' bilinear upsampling of the scores before the argmax,
+                  'labels' nearest neighbour upsampling of the instance masks
+        compact: return all masks as one uint8 tensor, stacked in the last axis,
+                 shape = [h, w, num_pred_class] or [batch, h, w, num_pred_class] if not squeeze
+        Return: a list of masks, one per class, shape = [h, w] or [batch, h, w] if not squeeze,
                 each slice represent instance masks belonging to a class
                 value of each pixel is between [0,max_instance)
         """
+        resized = isinstance(resize_factor, tf.Tensor) or resize_factor != 1.0
+        in_image = nn.resize_image(image, resize_factor) if resized else image
+
         # Build model
-        model = self._build_model(image, params['max_instance'], direct_slice=direct_slice, is_train=False)
+        model = self._build_model(in_image, params['max_instance'], direct_slice=direct_slice, is_train=False, save_var=save_var)
         pred_masks = model['upmask']
+        if resized and (logits or upsample == 'logits'):
+            pred_masks = nn.upsample_logits(pred_masks, tf.shape(image))
 
         # Split stack by semantic class
         pred_mask_list = tf.split(3, self.num_pred_class, pred_masks)
+        if logits:
+            return pred_mask_list
         instance_masks = []
         for i in range(self.num_pred_class):
             pred = tf.argmax(pred_mask_list[i], dimension=3)
-            instance_masks.append(tf.squeeze(pred))
+            if resized and upsample == 'labels':
+                pred = nn.upsample_labels(pred, tf.shape(image))
+            if squeeze and not compact:
+                pred = tf.squeeze(pred)
+            instance_masks.append(pred)
+        if compact:
+            # max_instance < 256, one byte per pixel and class
+            instance_masks = nn.compact_labels(tf.pack(instance_masks, axis=3))
+            if squeeze:
+                instance_masks = tf.squeeze(instance_masks, [0])
+        return instance_masks
+
+    def inference_lowres(self, params, image, direct_slice=True, save_var=False, squeeze=True, refine=True,
+                         compact=False, confidence=False):
+        """
+        Memory efficient inference: the argmax of every class is taken on the fused 1/8 resolution
+        scores (pool3 + pool4 + score_fr) and only the labels are upsampled, see nn.upsample_argmax().
+        upmask is not computed, no full resolution [h, w, num_pred_class * max_instance] scores exist.
+        The labels are those of upmask with its bilinear kernel, they differ from inference() only
+        where a trained upmask kernel is not bilinear.
+        refine: boundary refinement of the nearest neighbour upsampled labels, see nn.upsample_argmax()
+        squeeze, compact: as inference()
+        confidence: also return the softmax probability of the winning instance per class,
+                    at 1/8 resolution, shape = [batch, h/8, w/8] each
+        Return: the masks as inference(), and the list of confidences if confidence
+        """
+        model = self._build_model(image, params['max_instance'], direct_slice=direct_slice, is_train=False, save_var=save_var)
+        score_list = tf.split(3, self.num_pred_class, model['score_out'])
+
+        instance_masks = []
+        confidences = []
+        for score in score_list:
+            pred = nn.upsample_argmax(score, tf.shape(image), 8, refine=refine)
+            if squeeze and not compact:
+                pred = tf.squeeze(pred)
+            instance_masks.append(pred)
+            if confidence:
+                confidences.append(tf.reduce_max(tf.nn.softmax(score), reduction_indices=3))
+        if compact:
+            instance_masks = nn.compact_labels(tf.pack(instance_masks, axis=3))
+            if squeeze:
+                instance_masks = tf.squeeze(instance_masks, [0])
+        if confidence:
+            return instance_masks, confidences
         return instance_masks
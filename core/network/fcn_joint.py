@@ -0,0 +1,112 @@
+"""Joint semantic and instance segmentation on one shared VGG16 trunk.
+The trunk (conv1_1 ... conv7) is computed once per image and branches into the
+semantic skip decoder of FCN16VGG (score_fr ... fcn8s) and the instance mask skip
+decoder of InstanceFCN8s (score_fr_mask ... upmask).
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+sys.path.append("..")
+
+import tensorflow as tf
+import numpy as np
+import nn
+from network.fcn_vgg16 import FCN16VGG
+from network.fcn_instance import InstanceFCN8s
+from network.vgg16_trunk import build_vgg16_trunk
+
+class JointFCN8s:
+
+    def __init__(self, semantic_path=None, instance_path=None, trunk='semantic',
+                 pred_class={11:'person', 13:'car'}, gt_class={11:'person', 13:'car'}):
+        '''
+        semantic_path: FCN16VGG weight file, e.g city_fcn8s_skip_100000.npy
+        instance_path: InstanceFCN8s weight file, e.g city_instance_50000.npy
+        trunk: 'semantic' or 'instance', which of the two files the shared trunk weights are taken from
+        '''
+        if trunk not in ('semantic', 'instance'):
+            raise ValueError("trunk must be 'semantic' or 'instance', got %s" % trunk)
+        self.trunk = trunk
+        # The decoders are built by the single task models
+        self.semantic = FCN16VGG(semantic_path)
+        self.instance = InstanceFCN8s(data_path=instance_path, pred_class=pred_class, gt_class=gt_class)
+
+        # used to save trained weights, trunk and both decoders
+        self.var_dict = {}
+        # used to assign new weights to the built model, see load_weights()
+        self.assign_ops = {}
+
+    def _build_model(self, image, num_classes, max_instance, scale_min='fcn8s', save_var=False):
+
+        if save_var:
+            var_dict = self.var_dict
+        else:
+            var_dict = None
+
+        if self.trunk == 'semantic':
+            trunk_dict = self.semantic.data_dict
+        else:
+            trunk_dict = self.instance.data_dict
+
+        trunk = build_vgg16_trunk(image, trunk_dict, is_train=False, var_dict=var_dict)
+        self.trunk_layers = set(trunk.keys())
+        # The decoders use partly the same keys e.g score_fr, so every decoder gets its own model dict
+        semantic_model = dict(trunk)
+        self.semantic._build_decoder(semantic_model, image, self.semantic.data_dict, num_classes,
+                                     scale_min, var_dict)
+        instance_model = dict(trunk)
+        self.instance._build_mask_decoder(instance_model, image, self.instance.data_dict,
+                                          max_instance, var_dict)
+
+        print('JointFCN8s model is builded successfully!')
+        return semantic_model, instance_model
+
+    def inference(self, params, image, scale_min='fcn8s', save_var=False, squeeze=True,
+                  compact=False, label_lut=None):
+        '''
+        Input
+        params: needs 'num_classes' and 'max_instance'
+        image: shape=[batch, Height, Width, 3]
+        save_var: keep the variables in var_dict, needed to swap weights with load_weights()
+        squeeze: remove the batch axis of the instance masks, see InstanceFCN8s.inference
+        compact: uint8 outputs, the instance masks stacked in one tensor, see InstanceFCN8s.inference
+        label_lut: map the semantic trainIds in the graph, see FCN16VGG.inference
+        Return: (semantic, instance_masks)
+                semantic: argmax of scale_min, shape=[batch, Height, Width]
+                instance_masks: list of instance masks, one per predicted class
+        '''
+        semantic_model, instance_model = self._build_model(image, params['num_classes'], params['max_instance'],
+                                                           scale_min=scale_min, save_var=save_var)
+        semantic = tf.argmax(semantic_model[scale_min], dimension=3)
+        if compact or label_lut is not None:
+            semantic = nn.compact_labels(semantic, label_lut)
+
+        # Split stack by semantic class
+        pred_mask_list = tf.split(3, self.instance.num_pred_class, instance_model['upmask'])
+        instance_masks = []
+        for i in range(self.instance.num_pred_class):
+            pred = tf.argmax(pred_mask_list[i], dimension=3)
+            if squeeze and not compact:
+                pred = tf.squeeze(pred)
+            instance_masks.append(pred)
+        if compact:
+            instance_masks = nn.compact_labels(tf.pack(instance_masks, axis=3))
+            if squeeze:
+                instance_masks = tf.squeeze(instance_masks, [0])
+        return semantic, instance_masks
+
+    def load_weights(self, sess, semantic_dict=None, instance_dict=None):
+        '''
+        Assign new weight dicts of the single task models to the built model (save_var=True).
+        The trunk layers are only taken from the dict selected by trunk, layers missing
+        in a dict keep their values.
+        '''
+        for name, data_dict in (('semantic', semantic_dict), ('instance', instance_dict)):
+            if data_dict is None:
+                continue
+            if name != self.trunk:
+                data_dict = dict((key, value) for key, value in data_dict.items()
+                                 if key not in self.trunk_layers)
+            nn.assign_var_dict(sess, self.var_dict, data_dict, self.assign_ops)
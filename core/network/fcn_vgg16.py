@@ -14,22 +14,29 @@ import tensorflow as tf
 import numpy as np
 import nn
 import data_utils as dt
+from network.vgg16_trunk import build_trunk
 
 DATA_DIR = 'data'
 
 class FCN16VGG:
 
-    def __init__(self, data_path=None):
+    def __init__(self, data_path=None, backbone='vgg16'):
+        '''
+        data_path: weight file, None to train from scratch
+        backbone: 'vgg16' or 'lite' (reduced width, separable convolutions), see network/vgg16_trunk.py
+        '''
+        self.backbone = backbone
         # Load pretrained weight
-        data_dict = dt.load_weight(data_path)
+        data_dict = dt.load_weight(data_path) if data_path is not None else {}
         self.data_dict = data_dict
 
         # used to save trained weights
         self.var_dict = {}
+        # used to assign new weights to the built model, see load_weights()
+        self.assign_ops = {}
 
     def _build_model(self, image, num_classes, is_train=False, scale_min='fcn16s', save_var=False, val_dict=None):
         
-        model = {}
         if val_dict is None:
             # Not during validation, use pretrained weight
             feed_dict = self.data_dict
@@ -44,48 +51,22 @@ class FCN16VGG:
             # During inference or validation, no need to save weights
             var_dict = None
 
-        model['conv1_1'] = nn.conv_layer(image, feed_dict, "conv1_1", var_dict=var_dict)
-        model['conv1_2'] = nn.conv_layer(model['conv1_1'], feed_dict, "conv1_2", var_dict=var_dict)
-        model['pool1'] = nn.max_pool_layer(model['conv1_2'], "pool1")
-
-        model['conv2_1'] = nn.conv_layer(model['pool1'], feed_dict, "conv2_1", var_dict=var_dict)
-        model['conv2_2'] = nn.conv_layer(model['conv2_1'], feed_dict, "conv2_2", var_dict=var_dict)
-        model['pool2'] = nn.max_pool_layer(model['conv2_2'], "pool2")
-
-        model['conv3_1'] = nn.conv_layer(model['pool2'], feed_dict, "conv3_1", var_dict=var_dict)
-        model['conv3_2'] = nn.conv_layer(model['conv3_1'], feed_dict, "conv3_2", var_dict=var_dict)
-        model['conv3_3'] = nn.conv_layer(model['conv3_2'], feed_dict, "conv3_3", var_dict=var_dict)
-        model['pool3'] = nn.max_pool_layer(model['conv3_3'], "pool3")
-
-        model['conv4_1'] = nn.conv_layer(model['pool3'], feed_dict, "conv4_1", var_dict=var_dict)
-        model['conv4_2'] = nn.conv_layer(model['conv4_1'], feed_dict, "conv4_2", var_dict=var_dict)
-        model['conv4_3'] = nn.conv_layer(model['conv4_2'], feed_dict, "conv4_3", var_dict=var_dict)
-        model['pool4'] = nn.max_pool_layer(model['conv4_3'], "pool4")
-
-
-        model['conv5_1'] = nn.conv_layer(model['pool4'], feed_dict, "conv5_1", var_dict=var_dict)
-        model['conv5_2'] = nn.conv_layer(model['conv5_1'], feed_dict, "conv5_2", var_dict=var_dict)
-        model['conv5_3'] = nn.conv_layer(model['conv5_2'], feed_dict, "conv5_3", var_dict=var_dict)
-        model['pool5'] = nn.max_pool_layer(model['conv5_3'], "pool5")
+        # VGG16 or lite trunk up to conv7
+        model = build_trunk(self.backbone, image, feed_dict, is_train=is_train, var_dict=var_dict)
+        self._build_decoder(model, image, feed_dict, num_classes, scale_min, var_dict)
 
-        model['conv6_1'] = nn.conv_layer(model['pool5'], feed_dict, "conv6_1", 
-                                         shape=[3, 3, 512, 512], dropout=is_train, 
-                                         keep_prob=0.5, var_dict=var_dict)
-
-        model['conv6_2'] = nn.conv_layer(model['conv6_1'], feed_dict, "conv6_2", 
-                                         shape=[3, 3, 512, 512], dropout=is_train, 
-                                         keep_prob=0.5, var_dict=var_dict)
-
-        model['conv6_3'] = nn.conv_layer(model['conv6_2'], feed_dict, "conv6_3", 
-                                         shape=[3, 3, 512, 4096], dropout=is_train, 
-                                         keep_prob=0.5, var_dict=var_dict)
-
-        model['conv7'] = nn.conv_layer(model['conv6_3'], feed_dict, "conv7", 
-                                       shape=[1, 1, 4096, 4096], dropout=is_train, 
-                                       keep_prob=0.5, var_dict=var_dict)
+        #self.var_dict = var_dict
+        print('Model with scale %s is builded successfully!' % scale_min)
+        print('Model: %s' % str(model.keys()))
+        return model
 
+    def _build_decoder(self, model, image, feed_dict, num_classes, scale_min='fcn16s', var_dict=None):
+        '''
+        Semantic skip decoder on top of the trunk: score_fr, fcn32s and the skip
+        fusions with pool4/pool3 up to scale_min. The outputs are added to model.
+        '''
         model['score_fr'] = nn.conv_layer(model['conv7'], feed_dict, "score_fr", 
-                                          shape=[1, 1, 4096, num_classes], relu=False, 
+                                          shape=[1, 1, model['conv7'].get_shape()[3].value, num_classes], relu=False, 
                                           dropout=False, var_dict=var_dict)
 
         # fcn32s is always calculated for now
@@ -106,6 +87,8 @@ class FCN16VGG:
                                         relu=False, dropout=False, var_dict=var_dict)
             
             fuse_pool4 = tf.add(upscore_fr_2s, score_pool4)
+            # deep features of conv7 and pool4 at 1/16 resolution, cached by network.temporal
+            model['fuse_pool4'] = fuse_pool4
 
             # Upsample fusion *16
             model['fcn16s'] = nn.upscore_layer(fuse_pool4, feed_dict, "upscore_pool4_16s",
@@ -131,39 +114,117 @@ class FCN16VGG:
             model['fcn8s'] = nn.upscore_layer(fuse_pool3, feed_dict, "upscore8",
                                               tf.shape(image), num_classes,
                                               ksize=16, stride=8, var_dict=var_dict)
-         
-        #self.var_dict = var_dict
-        print('Model with scale %s is builded successfully!' % scale_min)
-        print('Model: %s' % str(model.keys()))
+
         return model
 
-    def inference(self, image, num_classes, scale_min='fcn16s', option={'fcn32s':False, 'fcn16s':True, 'fcn8s':False}):
+    def inference(self, image, num_classes, scale_min='fcn16s', option={'fcn32s':False, 'fcn16s':True, 'fcn8s':False}, save_var=False, logits=False,
+                  resize_factor=1.0, upsample='logits', compact=False, label_lut=None, roi=None, roi_fill=(10, 0)):
+        '''
+        image: shape=[batch, Height, Width, 3], the batch may hold several images of equal
+               shape, see network.batch_inference.run_batched()
+        save_var: keep the variables in var_dict, needed to swap weights with load_weights()
+        logits: return the upscored scores instead of the argmax, shape=[batch, Height, Width, num_classes],
+                e.g to blend overlapping tiles, see network.tiling
+        resize_factor: run the network on the image resized by this factor (float or scalar tensor),
+                       the predictions are upsampled to the original size again
+        upsample: 'logits' bilinear upsampling of the scores before the argmax,
+                  'labels' nearest neighbour upsampling of the argmax (cheaper)
+        compact: cast the argmax to uint8 in the graph instead of returning int64
+        label_lut: map the trainIds to e.g labelIds in the graph, CityDataSet.trainId2labelId_lut,
+                   the output is uint8
+        roi: (top, bottom) fixed band of rows the network runs on, bottom is exclusive and may be
+             negative or None as in a slice, e.g (256, -192) skips the sky and the ego-vehicle hood
+             of a 1024x2048 Cityscapes frame. The rows outside get roi_fill, the output keeps the
+             image shape. Not with logits.
+        roi_fill: trainId of the rows outside the roi, or (trainId above, trainId below), default sky above
+                  and road below. The filled rows are scored by the evaluator, so they must be real classes:
+                  void (19) maps to labelId 19 (traffic light) and would count every ground truth pixel of
+                  the band as a false positive. The ego-vehicle (labelId 1) is ignored in the evaluation,
+                  the road below the hood line is not.
+        Return: dict scale -> argmax, shape=[batch, Height, Width]
+        '''
+        if roi is not None:
+            if logits:
+                raise ValueError('roi is not supported with logits')
+            full_shape = tf.shape(image)
+            top = roi[0] or 0
+            image = image[:, top:roi[1]]
+
+        resized = isinstance(resize_factor, tf.Tensor) or resize_factor != 1.0
+        in_image = nn.resize_image(image, resize_factor) if resized else image
+
         # Build model
-        model = self._build_model(image, num_classes, is_train=False, scale_min=scale_min)
+        model = self._build_model(in_image, num_classes, is_train=False, scale_min=scale_min, save_var=save_var)
         
         # Keep using dictionary incase we want to compare results between different scales
         predict = {}
         for scale in option.keys():
-            if option[scale]:
-                predict[scale] = tf.argmax(model[scale], dimension=3)
+            if not option[scale]:
+                continue
+            score = model[scale]
+            if resized and (logits or upsample == 'logits'):
+                score = nn.upsample_logits(score, tf.shape(image))
+            if logits:
+                predict[scale] = score
+            elif resized and upsample == 'labels':
+                predict[scale] = nn.upsample_labels(tf.argmax(score, dimension=3), tf.shape(image))
+            else:
+                predict[scale] = tf.argmax(score, dimension=3)
+            if roi is not None:
+                predict[scale] = nn.fill_rows(predict[scale], full_shape, top, roi_fill)
+            if not logits and (compact or label_lut is not None):
+                predict[scale] = nn.compact_labels(predict[scale], label_lut)
 
         return predict
 
-    def train(self, params, image, truth, scale_min='fcn16s', save_var=True):
+    def load_weights(self, sess, data_dict):
+        '''
+        Assign a new weight dict e.g a checkpoint saved by the training scripts to the
+        variables of the built model. The model must be built with save_var=True.
+        '''
+        nn.assign_var_dict(sess, self.var_dict, data_dict, self.assign_ops)
+
+    def train(self, params, image, truth, scale_min='fcn16s', save_var=True, teacher=None):
         '''
         Note Dtype:
-        image: reshaped image value, shape=[1, Height, Width, 3], tf.float32, numpy ndarray
-        truth: reshaped image label, shape=[Height*Width], tf.int32, numpy ndarray
+        image: reshaped image value, shape=[batch, Height, Width, 3], tf.float32, numpy ndarray
+        truth: reshaped image label, shape=[batch*Height*Width], tf.int32, numpy ndarray
+        params['ignore_label']: optional, pixels with this label e.g the padding of bucketed
+                                VOC samples (VOCDataSet.next_bucket_batch) are left out of the loss
+        teacher: distillation mode if given, a trained FCN16VGG e.g loaded from city_fcn8s_skip_*.npy.
+                 Its fcn8s scores are the soft labels, the loss is
+                 (1 - params['distill_weight']) * hard loss + params['distill_weight'] * T^2 * soft loss
+                 at the temperature T = params['temperature']. Only this model is trained.
         '''
         # Build model
-        model = self._build_model(image, params['num_classes'], is_train=True, scale_min=scale_min, save_var=save_var) 
+        model = self._build_model(image, params['num_classes'], is_train=True, scale_min=scale_min, save_var=save_var)
         upscored = model[scale_min]
         old_shape = tf.shape(upscored)
         new_shape = [old_shape[0]*old_shape[1]*old_shape[2], params['num_classes']]
         prediction = tf.reshape(upscored, new_shape)
+        if params.get('ignore_label') is not None:
+            valid = tf.not_equal(truth, params['ignore_label'])
+            prediction = tf.boolean_mask(prediction, valid)
+            truth = tf.boolean_mask(truth, valid)
 
         loss = tf.reduce_mean(tf.nn.sparse_softmax_cross_entropy_with_logits(prediction, truth))
-        train_step = tf.train.AdamOptimizer(params['rate']).minimize(loss)
+        if teacher is None:
+            train_step = tf.train.AdamOptimizer(params['rate']).minimize(loss)
+            return train_step, loss
+
+        # Distillation, the teacher variables are kept apart and not trained
+        with tf.variable_scope('teacher') as scope:
+            teacher_model = teacher._build_model(image, params['num_classes'], is_train=False, scale_min='fcn8s')
+        teacher_vars = tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES, scope=scope.name)
+        student_vars = [var for var in tf.trainable_variables() if var not in teacher_vars]
+        teacher_scores = tf.stop_gradient(tf.reshape(teacher_model['fcn8s'], new_shape))
+        if params.get('ignore_label') is not None:
+            teacher_scores = tf.boolean_mask(teacher_scores, valid)
+        soft_labels = tf.nn.softmax(teacher_scores / params['temperature'])
+        soft_loss = tf.reduce_mean(tf.nn.softmax_cross_entropy_with_logits(prediction / params['temperature'], soft_labels))
+        loss = ((1.0 - params['distill_weight']) * loss +
+                params['distill_weight'] * params['temperature']**2 * soft_loss)
+        train_step = tf.train.AdamOptimizer(params['rate']).minimize(loss, var_list=student_vars)
 
         return train_step, loss
 
@@ -0,0 +1,92 @@
+"""Export and load frozen inference graphs.
+A frozen graph holds the weights as constants and only the ops needed for the outputs,
+so a worker restores it from one file without loading the weight dict or rebuilding
+the model layer by layer.
+The names of the input and output tensors are stored in the file as well.
+
+USAGE:
+    # export, after the model is built and initialized in sess
+    export_frozen(sess, {'fcn8s': predict['fcn8s']}, {'image': image}, '../data/frozen/city_fcn8s.pb')
+
+    # load
+    graph, inputs, outputs = load_frozen('../data/frozen/city_fcn8s.pb')
+    with tf.Session(graph=graph) as sess:
+        pred = sess.run(outputs['fcn8s'], feed_dict={inputs['image']: img})
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+
+import tensorflow as tf
+from tensorflow.python.framework import graph_util
+from tensorflow.python.framework import tensor_util
+from tensorflow.python.tools import optimize_for_inference_lib
+
+# Name of the constant holding the names of the input and output tensors
+FROZEN_META = 'frozen_meta'
+
+
+def export_frozen(sess, outputs, inputs, path, optimize=True):
+    '''
+    Input
+    sess: session with the built and initialized model
+    outputs: dict name -> output tensor, e.g the dict returned by FCN16VGG.inference
+    inputs: dict name -> placeholder, e.g {'image': image}, all placeholders must be float32
+    path: file to write the serialized GraphDef to
+    optimize: strip ops which are not needed for inference, e.g identity ops of the variables
+    Return: the frozen GraphDef
+    '''
+    output_nodes = sorted(set(tensor.op.name for tensor in outputs.values()))
+    input_nodes = [tensor.op.name for tensor in inputs.values()]
+
+    # Replace every variable by a constant with its current value
+    graph_def = graph_util.convert_variables_to_constants(sess, sess.graph.as_graph_def(), output_nodes)
+    if optimize:
+        graph_def = optimize_for_inference_lib.optimize_for_inference(graph_def, input_nodes, output_nodes,
+                                                                      tf.float32.as_datatype_enum)
+
+    meta = {'inputs': dict((name, tensor.name) for name, tensor in inputs.items()),
+            'outputs': dict((name, tensor.name) for name, tensor in outputs.items())}
+    with tf.Graph().as_default() as meta_graph:
+        tf.constant(json.dumps(meta), name=FROZEN_META)
+    graph_def.node.extend(meta_graph.as_graph_def().node)
+
+    with open(path, 'wb') as f:
+        f.write(graph_def.SerializeToString())
+    print('Frozen graph with %d ops saved to %s'%(len(graph_def.node), path))
+    return graph_def
+
+def load_frozen(path, graph=None, name='frozen'):
+    '''
+    Import a graph written by export_frozen().
+    graph: graph to import into, a new graph if None
+    name: name scope of the imported ops
+    Return: (graph, inputs, outputs), inputs and outputs are dicts name -> tensor
+    '''
+    graph_def = tf.GraphDef()
+    with open(path, 'rb') as f:
+        graph_def.ParseFromString(f.read())
+
+    meta = None
+    nodes = []
+    for node in graph_def.node:
+        if node.name == FROZEN_META:
+            meta = json.loads(tensor_util.MakeNdarray(node.attr['value'].tensor).item())
+        else:
+            nodes.append(node)
+    if meta is None:
+        raise ValueError("%s is not a graph written by export_frozen()"%path)
+    del graph_def.node[:]
+    graph_def.node.extend(nodes)
+
+    if graph is None:
+        graph = tf.Graph()
+    with graph.as_default():
+        tf.import_graph_def(graph_def, name=name)
+    inputs = dict((key, graph.get_tensor_by_name(name + '/' + tensor_name))
+                  for key, tensor_name in meta['inputs'].items())
+    outputs = dict((key, graph.get_tensor_by_name(name + '/' + tensor_name))
+                   for key, tensor_name in meta['outputs'].items())
+    return graph, inputs, outputs
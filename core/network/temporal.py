@@ -0,0 +1,73 @@
+"""Temporal feature reuse for video sequences, e.g the Cityscapes leftImg8bit_sequence snippets.
+The full FCN8s runs on keyframes only. On the frames in between, the deep features of the last
+keyframe (fuse_pool4 = score_fr of conv7 + score_pool4 of pool4, at 1/16 resolution) are fed
+into the graph, so only conv1_1 ... pool3, score_pool3 and the upsampling are computed.
+No second graph is needed, tensorflow does not run the layers behind a fed tensor.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+
+class KeyframeSegmenter(object):
+    '''
+    Segment the frames of a sequence in order, with a keyframe every keyframe_interval frames.
+
+    USAGE:
+        model = fcn._build_model(image, num_classes, scale_min='fcn8s')
+        predict = tf.argmax(model['fcn8s'], dimension=3)
+        segmenter = KeyframeSegmenter(sess, model, image, predict, keyframe_interval=5)
+        for frame in frames:
+            pred = segmenter.segment(frame)
+        segmenter.reset()       # before the next sequence
+    '''
+
+    def __init__(self, sess, model, image, predict, keyframe_interval=5, feed_dict=None):
+        '''
+        model: model dict of FCN16VGG._build_model() with scale_min 'fcn8s'
+        image: image placeholder, shape=[batch, H, W, 3]
+        predict: tensor computed from the model, e.g the argmax of model['fcn8s']
+        keyframe_interval: 1 runs the full model on every frame
+        '''
+        if 'fuse_pool4' not in model or 'fcn8s' not in model:
+            raise ValueError('KeyframeSegmenter needs a model built with scale_min fcn8s')
+        self.sess = sess
+        self.image = image
+        self.predict = predict
+        self.cache_tensor = model['fuse_pool4']
+        self.keyframe_interval = keyframe_interval
+        self.feed_dict = feed_dict
+        self.reset()
+
+    def reset(self):
+        '''Start a new sequence, the next frame is a keyframe'''
+        self.cache = None
+        self.cache_shape = None
+        self.frame_index = 0
+        self.last_was_keyframe = False
+
+    def segment(self, frame):
+        '''
+        frame: shape=[H, W, 3] or [1, H, W, 3], preprocessed like CityDataSet.load_image
+        Return: predict of this frame
+        '''
+        frame = np.asarray(frame)
+        if frame.ndim == 3:
+            frame = frame[np.newaxis, ...]
+        feed = dict(self.feed_dict) if self.feed_dict else {}
+        feed[self.image] = frame
+
+        keyframe = (self.cache is None or self.frame_index % self.keyframe_interval == 0
+                    or frame.shape != self.cache_shape)
+        if keyframe:
+            output, self.cache = self.sess.run([self.predict, self.cache_tensor], feed_dict=feed)
+            self.cache_shape = frame.shape
+            self.frame_index = 0
+        else:
+            feed[self.cache_tensor] = self.cache
+            output = self.sess.run(self.predict, feed_dict=feed)
+        self.frame_index += 1
+        self.last_was_keyframe = keyframe
+        return output
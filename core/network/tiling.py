@@ -0,0 +1,180 @@
+"""Tiled (sliding window) inference with bounded memory.
+The image is cut into overlapping tiles of equal shape, the logits of every tile are
+computed in batches (see batch_inference) and blended into a full size score map with
+linear weights in the overlap regions, the argmax is done on the stitched scores.
+The activations inside the network are bounded by the tile size instead of the image size,
+the stitched score maps still have the image size, see estimate_stitching_bytes().
+
+NOTE: the instance channels of InstanceFCN8s are not consistent between tiles, the same
+object may be predicted in different channels by two tiles. Tiles larger than the objects
+of interest and a large overlap reduce the effect, but instance maps stitched from tiles
+are less reliable than the semantic maps of FCN16VGG.
+
+USAGE:
+    logits = model.inference(image, num_classes, scale_min='fcn8s', option=option, logits=True)
+    tile_size = pick_tile_size(2 << 30, img.shape[:2], num_classes)   # activations and stitched scores
+    predict = tiled_predict(sess, logits, image, img, tile_size, overlap=64)
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+from network.batch_inference import iter_batched
+
+# Tile sizes are multiples of the total stride, so all upscore shapes align
+TILE_MULTIPLE = 32
+
+# (channels, downsampling) of the VGG16 feature maps in the order they are computed
+VGG16_ACTIVATIONS = [(64, 1), (64, 1), (64, 2),
+                     (128, 2), (128, 2), (128, 4),
+                     (256, 4), (256, 4), (256, 4), (256, 8),
+                     (512, 8), (512, 8), (512, 8), (512, 16),
+                     (512, 16), (512, 16), (512, 16), (512, 32),
+                     (512, 32), (512, 32), (4096, 32), (4096, 32)]
+
+
+def tile_starts(size, tile, overlap):
+    '''
+    Start offsets of the tiles along one axis, the last tile is shifted to the image border,
+    so every tile has the same size and the real overlap may be larger than overlap.
+    '''
+    if size <= tile:
+        return [0]
+    if overlap >= tile:
+        raise ValueError("Overlap {} must be smaller than the tile size {}".format(overlap, tile))
+    starts = list(range(0, size - tile, tile - overlap))
+    starts.append(size - tile)
+    return starts
+
+def tile_weights(tile_h, tile_w, y0, x0, image_h, image_w, overlap):
+    '''
+    Blending weights of one tile, shape=[tile_h, tile_w].
+    The weights rise linearly over overlap pixels on every side that borders another tile,
+    sides at the image border keep the full weight.
+    '''
+    def ramp(size, start, image_size):
+        weight = np.ones(size, dtype=np.float32)
+        n = min(overlap, size // 2)
+        if n > 0:
+            rise = np.arange(1, n + 1, dtype=np.float32) / (n + 1)
+            if start > 0:
+                weight[:n] = rise
+            if start + size < image_size:
+                weight[size-n:] = rise[::-1]
+        return weight
+    return np.outer(ramp(tile_h, y0, image_h), ramp(tile_w, x0, image_w))
+
+def _map_outputs(fn, outputs):
+    '''Apply fn to every array of a fetched structure (dict, list or array)'''
+    if isinstance(outputs, dict):
+        return dict((key, _map_outputs(fn, value)) for key, value in outputs.items())
+    if isinstance(outputs, (list, tuple)):
+        return [_map_outputs(fn, value) for value in outputs]
+    return fn(outputs)
+
+def _add_tile(acc, outputs, weight, y0, x0):
+    if isinstance(acc, dict):
+        for key in acc:
+            _add_tile(acc[key], outputs[key], weight, y0, x0)
+    elif isinstance(acc, list):
+        for a, o in zip(acc, outputs):
+            _add_tile(a, o, weight, y0, x0)
+    else:
+        h, w = weight.shape
+        acc[y0:y0+h, x0:x0+w] += outputs * weight[..., np.newaxis]
+
+def tiled_logits(sess, logits, image, img, tile_size, overlap=64, batch_size=1, feed_dict=None):
+    '''
+    Input
+    logits: score tensors of inference(..., logits=True), dict, list or a single tensor,
+            each of shape [batch, H, W, C]
+    image: image placeholder with open batch dimension, shape=[None, None, None, 3]
+    img: one image, shape=[H, W, 3]
+    tile_size: (tile_h, tile_w), multiples of TILE_MULTIPLE, clipped to the image size
+    overlap: overlap of neighbouring tiles in pixels
+    batch_size: number of tiles per sess.run
+
+    Return: blended scores with the structure of logits, each of shape [H, W, C]
+    '''
+    img = np.asarray(img)
+    if img.ndim == 4:
+        img = img[0]
+    image_h, image_w = img.shape[:2]
+    tile_h = min(tile_size[0], image_h)
+    tile_w = min(tile_size[1], image_w)
+    tiles = [(y0, x0) for y0 in tile_starts(image_h, tile_h, overlap)
+                      for x0 in tile_starts(image_w, tile_w, overlap)]
+
+    crops = (img[y0:y0+tile_h, x0:x0+tile_w] for y0, x0 in tiles)
+    acc = None
+    weight_sum = np.zeros((image_h, image_w), dtype=np.float32)
+    for i, outputs in iter_batched(sess, logits, image, crops, batch_size, feed_dict):
+        y0, x0 = tiles[i]
+        if acc is None:
+            acc = _map_outputs(lambda x: np.zeros((image_h, image_w) + x.shape[2:], dtype=np.float32), outputs)
+        weight = tile_weights(tile_h, tile_w, y0, x0, image_h, image_w, overlap)
+        _add_tile(acc, outputs, weight, y0, x0)
+        weight_sum[y0:y0+tile_h, x0:x0+tile_w] += weight
+
+    def normalize(x):
+        # in place, no second full size copy of the scores
+        x /= weight_sum[..., np.newaxis]
+        return x
+    return _map_outputs(normalize, acc)
+
+def tiled_predict(sess, logits, image, img, tile_size, overlap=64, batch_size=1, feed_dict=None):
+    '''
+    Same as tiled_logits(), but return the argmax of the stitched scores, each of shape [H, W]
+    '''
+    scores = tiled_logits(sess, logits, image, img, tile_size, overlap, batch_size, feed_dict)
+    return _map_outputs(lambda x: np.argmax(x, axis=-1), scores)
+
+def estimate_activation_bytes(tile_h, tile_w, num_classes, num_outputs=1, batch_size=1):
+    '''
+    Rough estimate of the activation memory of one sess.run on a batch of tiles (float32).
+    Counted are the largest pair of consecutive feature maps of the backbone, the skip
+    features pool3/pool4 which stay alive until the decoder and num_outputs full size
+    score maps, e.g 3 for fcn32s/fcn16s/fcn8s. Weights are not included.
+    '''
+    pixels = tile_h * tile_w
+    sizes = [channels * pixels / (scale * scale) for channels, scale in VGG16_ACTIVATIONS]
+    peak_pair = max(a + b for a, b in zip(sizes[:-1], sizes[1:]))
+    skips = 256 * pixels / 64 + 512 * pixels / 256
+    outputs = num_outputs * num_classes * pixels
+    return int(4 * batch_size * (peak_pair + skips + outputs))
+
+def estimate_stitching_bytes(image_h, image_w, num_classes, num_outputs=1):
+    '''
+    Memory held outside the network for the whole image (float32/int64): the num_outputs
+    full size score accumulators and the weight sum of tiled_logits() plus the argmax
+    maps of tiled_predict(). Independent of the tile size.
+    '''
+    pixels = image_h * image_w
+    return int(4 * pixels * (num_outputs * num_classes + 1) + 8 * pixels * num_outputs)
+
+def pick_tile_size(budget_bytes, image_size, num_classes, num_outputs=1, batch_size=1):
+    '''
+    Largest tile, with the aspect ratio of the image and multiple of TILE_MULTIPLE,
+    whose estimated activation memory fits into budget_bytes. The stitching memory
+    of the whole image (estimate_stitching_bytes) is taken from the budget first.
+    image_size: (H, W)
+    Return: (tile_h, tile_w), the image size if the whole image fits
+    '''
+    image_h, image_w = image_size
+    stitching = estimate_stitching_bytes(image_h, image_w, num_classes, num_outputs)
+    if stitching >= budget_bytes:
+        raise ValueError("The stitched scores of {} bytes alone exceed the memory budget of {} bytes".format(
+                         stitching, budget_bytes))
+    budget_bytes -= stitching
+    if estimate_activation_bytes(image_h, image_w, num_classes, num_outputs, batch_size) <= budget_bytes:
+        return (image_h, image_w)
+    tile_h = (image_h // TILE_MULTIPLE) * TILE_MULTIPLE
+    while tile_h >= TILE_MULTIPLE:
+        tile_w = int(tile_h * image_w / image_h) // TILE_MULTIPLE * TILE_MULTIPLE
+        tile_w = min(max(tile_w, TILE_MULTIPLE), image_w)
+        if estimate_activation_bytes(tile_h, tile_w, num_classes, num_outputs, batch_size) <= budget_bytes:
+            return (tile_h, tile_w)
+        tile_h -= TILE_MULTIPLE
+    raise ValueError("No tile size fits into a memory budget of {} bytes".format(budget_bytes))
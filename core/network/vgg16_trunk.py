@@ -0,0 +1,117 @@
+"""VGG16 trunk shared by the FCN models: conv1_1 ... pool5 and the fully
+convolutional conv6_1 ... conv7 layers.
+The 'lite' backbone keeps the layer names and strides, but with reduced widths and
+depthwise separable convolutions, so the decoders fit on top of it unchanged.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+sys.path.append("..")
+
+import tensorflow as tf
+import nn
+
+
+def _channels(x):
+    '''Channels of a layer output, the fallback shapes of missing layers follow pruned inputs'''
+    return x.get_shape()[3].value
+
+def build_vgg16_trunk(image, feed_dict, is_train=False, var_dict=None):
+    '''
+    image: shape=[batch, Height, Width, 3], BGR
+    feed_dict: weight dict the layers are initialized from
+    is_train: dropout on conv6_x/conv7
+    var_dict: if given, the variables of every layer are saved to it
+    Return: dict layer name -> output, the skip features pool3/pool4 and conv7 are
+            the inputs of the decoders
+    '''
+    model = {}
+    model['conv1_1'] = nn.conv_layer(image, feed_dict, "conv1_1", var_dict=var_dict)
+    model['conv1_2'] = nn.conv_layer(model['conv1_1'], feed_dict, "conv1_2", var_dict=var_dict)
+    model['pool1'] = nn.max_pool_layer(model['conv1_2'], "pool1")
+
+    model['conv2_1'] = nn.conv_layer(model['pool1'], feed_dict, "conv2_1", var_dict=var_dict)
+    model['conv2_2'] = nn.conv_layer(model['conv2_1'], feed_dict, "conv2_2", var_dict=var_dict)
+    model['pool2'] = nn.max_pool_layer(model['conv2_2'], "pool2")
+
+    model['conv3_1'] = nn.conv_layer(model['pool2'], feed_dict, "conv3_1", var_dict=var_dict)
+    model['conv3_2'] = nn.conv_layer(model['conv3_1'], feed_dict, "conv3_2", var_dict=var_dict)
+    model['conv3_3'] = nn.conv_layer(model['conv3_2'], feed_dict, "conv3_3", var_dict=var_dict)
+    model['pool3'] = nn.max_pool_layer(model['conv3_3'], "pool3")
+
+    model['conv4_1'] = nn.conv_layer(model['pool3'], feed_dict, "conv4_1", var_dict=var_dict)
+    model['conv4_2'] = nn.conv_layer(model['conv4_1'], feed_dict, "conv4_2", var_dict=var_dict)
+    model['conv4_3'] = nn.conv_layer(model['conv4_2'], feed_dict, "conv4_3", var_dict=var_dict)
+    model['pool4'] = nn.max_pool_layer(model['conv4_3'], "pool4")
+
+    model['conv5_1'] = nn.conv_layer(model['pool4'], feed_dict, "conv5_1", var_dict=var_dict)
+    model['conv5_2'] = nn.conv_layer(model['conv5_1'], feed_dict, "conv5_2", var_dict=var_dict)
+    model['conv5_3'] = nn.conv_layer(model['conv5_2'], feed_dict, "conv5_3", var_dict=var_dict)
+    model['pool5'] = nn.max_pool_layer(model['conv5_3'], "pool5")
+
+    model['conv6_1'] = nn.conv_layer(model['pool5'], feed_dict, "conv6_1",
+                                     shape=[3, 3, _channels(model['pool5']), 512], dropout=is_train,
+                                     keep_prob=0.5, var_dict=var_dict)
+
+    model['conv6_2'] = nn.conv_layer(model['conv6_1'], feed_dict, "conv6_2",
+                                     shape=[3, 3, _channels(model['conv6_1']), 512], dropout=is_train,
+                                     keep_prob=0.5, var_dict=var_dict)
+
+    model['conv6_3'] = nn.conv_layer(model['conv6_2'], feed_dict, "conv6_3",
+                                     shape=[3, 3, _channels(model['conv6_2']), 4096], dropout=is_train,
+                                     keep_prob=0.5, var_dict=var_dict)
+
+    model['conv7'] = nn.conv_layer(model['conv6_3'], feed_dict, "conv7",
+                                   shape=[1, 1, _channels(model['conv6_3']), 4096], dropout=is_train,
+                                   keep_prob=0.5, var_dict=var_dict)
+
+    return model
+
+
+# Output channels of the VGG16 layers, scaled by the width of the lite backbone
+VGG16_WIDTHS = [('conv1_1', 64), ('conv1_2', 64), ('conv2_1', 128), ('conv2_2', 128),
+                ('conv3_1', 256), ('conv3_2', 256), ('conv3_3', 256),
+                ('conv4_1', 512), ('conv4_2', 512), ('conv4_3', 512),
+                ('conv5_1', 512), ('conv5_2', 512), ('conv5_3', 512),
+                ('conv6_1', 512), ('conv6_2', 512), ('conv6_3', 4096), ('conv7', 4096)]
+# Layers followed by a max pooling
+POOLS = {'conv1_2': 'pool1', 'conv2_2': 'pool2', 'conv3_3': 'pool3', 'conv4_3': 'pool4', 'conv5_3': 'pool5'}
+LITE_WIDTH = 0.25
+
+def build_lite_trunk(image, feed_dict, is_train=False, var_dict=None, width=LITE_WIDTH):
+    '''
+    Reduced-width VGG16 trunk: every layer has width times the VGG16 channels, conv1_1 and
+    conv7 are plain convolutions, all other layers are depthwise separable.
+    Same arguments and model dict as build_vgg16_trunk(), the separable layers are saved as
+    <name>_dw/<name>_pw. Missing layers are initialized randomly.
+    '''
+    model = {}
+    x = image
+    for name, channels in VGG16_WIDTHS:
+        channels = max(8, int(channels * width))
+        dropout = is_train and name.startswith(('conv6', 'conv7'))
+        if name == 'conv1_1':
+            model[name] = nn.conv_layer(x, feed_dict, name, shape=[3, 3, 3, channels],
+                                        var_dict=var_dict, random_init=True)
+        elif name == 'conv7':
+            model[name] = nn.conv_layer(x, feed_dict, name, shape=[1, 1, _channels(x), channels],
+                                        dropout=dropout, keep_prob=0.5, var_dict=var_dict, random_init=True)
+        else:
+            model[name] = nn.separable_conv_layer(x, feed_dict, name, shape=[3, 3, _channels(x), channels],
+                                                  dropout=dropout, keep_prob=0.5, var_dict=var_dict)
+        x = model[name]
+        if name in POOLS:
+            model[POOLS[name]] = nn.max_pool_layer(x, POOLS[name])
+            x = model[POOLS[name]]
+
+    return model
+
+TRUNKS = {'vgg16': build_vgg16_trunk, 'lite': build_lite_trunk}
+
+def build_trunk(backbone, image, feed_dict, is_train=False, var_dict=None):
+    '''backbone: 'vgg16' or 'lite', see TRUNKS'''
+    if backbone not in TRUNKS:
+        raise ValueError("Unknown backbone %s, choose one of %s" % (backbone, str(sorted(TRUNKS.keys()))))
+    return TRUNKS[backbone](image, feed_dict, is_train=is_train, var_dict=var_dict)
@@ -17,11 +17,19 @@ def max_pool_layer(x, name, stride=2):
                           padding='SAME', name=name)
     return pool
 
-def conv_layer(x, feed_dict, name, stride=1, shape=None, relu=True, dropout=False, keep_prob=0.5, var_dict=None):
+def conv_layer(x, feed_dict, name, stride=1, shape=None, relu=True, dropout=False, keep_prob=0.5, var_dict=None,
+               random_init=False):
+
+    if not feed_dict.has_key(name) and feed_dict.has_key(name + '_lr_a'):
+        # Low-rank factored layer, see compression/lowrank.py
+        factor = conv_layer(x, feed_dict, name + '_lr_a', stride=stride, relu=False, var_dict=var_dict)
+        return conv_layer(factor, feed_dict, name + '_lr_b', relu=relu, dropout=dropout,
+                          keep_prob=keep_prob, var_dict=var_dict)
 
     with tf.variable_scope(name) as scope:
         print('Layer name: %s' % name)  
-        kernel = get_conv_kernel(feed_dict, name, shape)
+        stddev = (2.0 / (shape[0] * shape[1] * shape[2]))**0.5 if random_init and shape is not None else None
+        kernel = get_conv_kernel(feed_dict, name, shape, stddev)
         bias = get_bias(feed_dict, name, shape)
 
         conv = tf.nn.conv2d(x, kernel,
@@ -39,6 +47,31 @@ def conv_layer(x, feed_dict, name, stride=1, shape=None, relu=True, dropout=Fals
 
     return conv_out
 
+def separable_conv_layer(x, feed_dict, name, shape, stride=1, relu=True, dropout=False, keep_prob=0.5, var_dict=None):
+    '''
+    Depthwise separable convolution: a kh x kw convolution of every input channel on its own
+    followed by a 1x1 convolution across the channels, saved as <name>_dw and <name>_pw.
+    shape: [kh, kw, in_channels, out_channels] of the replaced convolution
+    Per pixel cost: kh*kw*in + in*out instead of kh*kw*in*out multiply-adds.
+    Layers missing in feed_dict are initialized randomly, the separable models are trained from scratch.
+    '''
+    with tf.variable_scope(name + '_dw') as scope:
+        print('Layer name: %s' % (name + '_dw'))
+        dw_shape = [shape[0], shape[1], shape[2], 1]
+        kernel = get_conv_kernel(feed_dict, name + '_dw', dw_shape, stddev=(2.0 / (shape[0] * shape[1]))**0.5)
+        bias = get_bias(feed_dict, name + '_dw', [1, 1, 1, shape[2]])
+
+        conv = tf.nn.depthwise_conv2d(x, kernel,
+                                      strides=[1, stride, stride, 1],
+                                      padding='SAME')
+        conv_out = tf.nn.relu(tf.nn.bias_add(conv, bias))
+
+    if var_dict is not None:
+        var_dict[name + '_dw'] = (kernel, bias)
+
+    return conv_layer(conv_out, feed_dict, name + '_pw', shape=[1, 1, shape[2], shape[3]], relu=relu,
+                      dropout=dropout, keep_prob=keep_prob, var_dict=var_dict, random_init=True)
+
 def mask_layer(x, feed_dict, name, shape, stride=1, relu=False, dropout=False, keep_prob=0.5, var_dict=None):
     '''
     Input
@@ -75,7 +108,13 @@ def mask_layer(x, feed_dict, name, shape, stride=1, relu=False, dropout=False, k
 
 
 # Use existing code, still don't understand. Prefer to use upscore_layer() first.
-def upscore_layer(x, feed_dict, name, shape, num_class, ksize=4, stride=2, var_dict=None):
+def upscore_layer(x, feed_dict, name, shape, num_class, ksize=4, stride=2, var_dict=None, channelwise=True):
+    '''
+    channelwise: if the variables are not saved (var_dict is None, i.e no training or weight swap) and the
+                 kernel is diagonal with one separable [k, k] slice for all channels, e.g the bilinear kernel
+                 of an untrained layer, every channel is upsampled on its own, see channelwise_upscore(),
+                 instead of the dense [k, k, C, C] transposed convolution. Same result, far less multiply-adds.
+    '''
     strides = [1, stride, stride, 1]
     with tf.variable_scope(name):
         print('Layer name: %s' % name)          
@@ -96,14 +135,229 @@ def upscore_layer(x, feed_dict, name, shape, num_class, ksize=4, stride=2, var_d
         num_input = ksize * ksize * in_features / stride
         stddev = (2 / num_input)**0.5
 
-        kernel = get_deconv_kernel(feed_dict, name, f_shape)
-        deconv = tf.nn.conv2d_transpose(x, kernel, output_shape,
-                                        strides=strides, padding='SAME')
+        factors = None
+        if channelwise and var_dict is None and in_features == num_class:
+            dense = feed_dict[name] if feed_dict.has_key(name) else bilinear_kernel(f_shape)
+            factors = get_channel_factors(dense, stride)
+        if factors is not None:
+            print('Upsample every channel with the shared separable kernel of %s' % name)
+            deconv = channelwise_upscore(x, factors, new_shape, stride)
+        else:
+            kernel = get_deconv_kernel(feed_dict, name, f_shape)
+            deconv = tf.nn.conv2d_transpose(x, kernel, output_shape,
+                                            strides=strides, padding='SAME')
     if var_dict is not None:
         var_dict[name] = (kernel)
 
     return deconv
 
+def _upscore_axis(x, taps, stride, size, axis):
+    '''
+    Transposed convolution of every channel of x [batch, h, w, C] along axis (1 or 2) with the
+    1-d kernel taps, SAME padding as conv2d_transpose, output length size.
+    The kernel length is m * stride: output pixel j * stride + q of the unpadded output is the
+    sum of the m inputs j - t weighted by taps[q + t * stride], the stride phases q are interleaved.
+    '''
+    m = len(taps) // stride
+    in_shape = tf.shape(x)
+    length = in_shape[axis]
+    paddings = [[0, 0]] * 4
+    paddings[axis] = [m - 1, m - 1]
+    padded = tf.pad(x, paddings)
+
+    shifted = []
+    for t in range(m):
+        begin = [0, 0, 0, 0]
+        begin[axis] = m - 1 - t
+        slice_size = [-1, -1, -1, -1]
+        slice_size[axis] = length + m - 1
+        shifted.append(tf.slice(padded, begin, slice_size))
+    phases = []
+    for q in range(stride):
+        phases.append(tf.add_n([float(taps[q + t * stride]) * shifted[t] for t in range(m)]))
+    full = tf.pack(phases, axis=axis + 1)
+
+    # merge the phases into the axis, then crop the SAME padding
+    full_shape = [in_shape[0], in_shape[1], in_shape[2], in_shape[3]]
+    full_shape[axis] = (length + m - 1) * stride
+    full = tf.reshape(full, tf.pack(full_shape))
+    pad_front = tf.maximum((length - 1) * stride + len(taps) - size, 0) // 2
+    begin = [0, 0, 0, 0]
+    begin[axis] = pad_front
+    crop = [-1, -1, -1, -1]
+    crop[axis] = size
+    return tf.slice(full, tf.pack(begin), tf.pack(crop))
+
+def channelwise_upscore(x, factors, new_shape, stride):
+    '''
+    Transposed convolution of every channel of x [batch, h, w, C] on its own with the separable
+    kernel [k, k] = outer(factors[0], factors[1]), as a transposed convolution along the height
+    and one along the width. k / stride multiply-adds per output pixel and axis instead of
+    k * k * C / stride^2 of the dense [k, k, C, C] kernel.
+    new_shape: [batch, H, W, C] of the output
+    '''
+    num_class = x.get_shape()[3].value
+    up = _upscore_axis(x, factors[0], stride, new_shape[1], axis=1)
+    up = _upscore_axis(up, factors[1], stride, new_shape[2], axis=2)
+    up.set_shape([None, None, None, num_class])
+    return up
+
+def resize_image(image, factor):
+    '''
+    Resize a batch of images by factor (python float or scalar tensor), shape=[batch, H, W, C].
+    The size is rounded to the nearest pixel.
+    '''
+    in_shape = tf.shape(image)
+    size = tf.to_int32(tf.round(tf.to_float(in_shape[1:3]) * factor))
+    return tf.image.resize_bilinear(image, size)
+
+def upsample_logits(logits, shape):
+    '''Bilinear upsampling of scores [batch, h, w, C] to the height and width of shape'''
+    return tf.image.resize_bilinear(logits, tf.pack([shape[1], shape[2]]))
+
+def upsample_labels(labels, shape):
+    '''Nearest neighbour upsampling of a label map [batch, h, w] to the height and width of shape'''
+    labels = tf.expand_dims(tf.to_int32(labels), 3)
+    labels = tf.image.resize_nearest_neighbor(labels, tf.pack([shape[1], shape[2]]))
+    return tf.squeeze(labels, [3])
+
+def label_boundaries(labels):
+    '''True where a label of [batch, h, w] differs from one of its 8 neighbours'''
+    labels = tf.expand_dims(tf.to_float(labels), 3)
+    high = tf.nn.max_pool(labels, [1, 3, 3, 1], [1, 1, 1, 1], padding='SAME')
+    low = -tf.nn.max_pool(-labels, [1, 3, 3, 1], [1, 1, 1, 1], padding='SAME')
+    return tf.squeeze(tf.not_equal(high, low), [3])
+
+def upscore_source(out_size, in_size, stride):
+    '''
+    Geometry of upscore_layer() with the bilinear kernel (ksize 2 * stride, SAME padding): the output
+    pixel y is centred on the input coordinate y / stride + offset, e.g (y + 0.5) / stride - 0.5 if
+    out_size = in_size * stride.
+    out_size, in_size: int32 tensors of the same shape, e.g [height, width]
+    Return: offset, float32, same shape
+    '''
+    pad = tf.maximum((in_size - 1) * stride + 2 * stride - out_size, 0) // 2
+    return (tf.to_float(pad) - stride + 0.5) / stride
+
+def _gather_axis(x, indices, axis):
+    '''tf.gather of x along axis'''
+    rank = x.get_shape().ndims
+    perm = [axis] + [i for i in range(rank) if i != axis]
+    inverse = [perm.index(i) for i in range(rank)]
+    return tf.transpose(tf.gather(tf.transpose(x, perm), indices), inverse)
+
+def interpolate_logits_at(logits, points, shape, stride):
+    '''
+    Scores [batch, h, w, C] bilinearly upsampled by stride to the height and width of shape with the
+    geometry of upscore_layer(), see upscore_source(), but only evaluated at points: [n, 3] int64
+    (batch, y, x) of the upsampled map. The borders are clamped, the transposed convolution scales
+    the border pixels down instead, their argmax is the same.
+    Return: shape=[n, C]
+    '''
+    in_size = tf.shape(logits)[1:3]
+    offset = upscore_source(tf.pack([shape[1], shape[2]]), in_size, stride)
+    src = tf.to_float(points[:, 1:3]) / stride + offset
+    floor = tf.floor(src)
+    frac = src - floor
+    last = tf.to_int64(in_size) - 1
+    top_left = tf.minimum(tf.maximum(tf.to_int64(floor), 0), last)
+    bottom_right = tf.minimum(tf.maximum(tf.to_int64(floor) + 1, 0), last)
+
+    def corner(y, x):
+        return tf.gather_nd(logits, tf.pack([points[:, 0], y, x], axis=1))
+    left, right = top_left[:, 1], bottom_right[:, 1]
+    top = corner(top_left[:, 0], left)
+    top += (corner(top_left[:, 0], right) - top) * frac[:, 1:2]
+    bottom = corner(bottom_right[:, 0], left)
+    bottom += (corner(bottom_right[:, 0], right) - bottom) * frac[:, 1:2]
+    return top + (bottom - top) * frac[:, 0:1]
+
+def upsample_nearest(labels, shape, stride):
+    '''
+    Nearest neighbour upsampling of a map [batch, h, w] by stride to the height and width of shape,
+    with the geometry of upscore_layer(), see upscore_source()
+    '''
+    in_size = tf.shape(labels)[1:3]
+    offset = upscore_source(tf.pack([shape[1], shape[2]]), in_size, stride)
+    for axis in (1, 2):
+        src = tf.to_float(tf.range(shape[axis])) / stride + offset[axis - 1]
+        nearest = tf.minimum(tf.maximum(tf.to_int32(tf.floor(src + 0.5)), 0), in_size[axis - 1] - 1)
+        labels = _gather_axis(labels, nearest, axis)
+    return labels
+
+def upsample_argmax(logits, shape, stride, refine=True):
+    '''
+    Argmax of scores [batch, h, w, C] upsampled by stride with upscore_layer() and its bilinear kernel,
+    at the height and width of shape, without upsampling the scores.
+    The argmax is upsampled by nearest neighbour. If refine, the pixels next to a label boundary
+    get the argmax of the bilinear upsampled scores, evaluated only there. Away from the boundaries
+    all scores interpolated for a pixel share their argmax, so the refined labels are the labels of
+    tf.argmax(upscore_layer(logits, ...)) with C values per boundary pixel instead of per pixel.
+    Return: int32 labels, shape=[batch, H, W]
+    '''
+    labels = tf.to_int32(tf.argmax(logits, dimension=3))
+    upsampled = upsample_nearest(labels, shape, stride)
+    if not refine:
+        return upsampled
+    edge = upsample_nearest(label_boundaries(labels), shape, stride)
+    points = tf.where(edge)
+    refined = tf.to_int32(tf.argmax(interpolate_logits_at(logits, points, shape, stride), dimension=1))
+    refined = tf.sparse_to_dense(points, tf.to_int64(tf.shape(upsampled)), refined, default_value=0)
+    return tf.select(edge, refined, upsampled)
+
+def fill_rows(labels, shape, top, fill):
+    '''
+    Pad a label map [batch, h, w] computed on the rows top ... top+h-1 of an image to the height
+    of shape, e.g the prediction of a region of interest back to the image size.
+    fill: label of the rows above and below, or (label above, label below)
+    '''
+    fill_top, fill_bottom = fill if isinstance(fill, (tuple, list)) else (fill, fill)
+    in_shape = tf.shape(labels)
+    bottom = shape[1] - top - in_shape[1]
+    above = tf.fill(tf.pack([in_shape[0], top, in_shape[2]]), tf.cast(fill_top, labels.dtype))
+    below = tf.fill(tf.pack([in_shape[0], bottom, in_shape[2]]), tf.cast(fill_bottom, labels.dtype))
+    return tf.concat(1, [above, labels, below])
+
+def compact_labels(labels, label_lut=None):
+    '''
+    Cast a label map (e.g the int64 argmax) to uint8 in the graph, so only one byte per pixel
+    is copied out of the session.
+    label_lut: optional lookup table applied before, e.g CityDataSet.trainId2labelId_lut
+               to output labelIds instead of trainIds
+    '''
+    if label_lut is not None:
+        lut = tf.constant(np.asarray(label_lut, dtype=np.uint8))
+        return tf.gather(lut, tf.to_int32(labels))
+    return tf.cast(labels, tf.uint8)
+
+def assign_var_dict(sess, var_dict, data_dict, assign_ops):
+    '''
+    Assign the arrays of a weight dict to the variables of an already built model,
+    so a new weight file can be evaluated without rebuilding the graph.
+    var_dict: layer name -> (kernel, bias) or kernel, as filled by the layer functions
+    data_dict: weight dict in the same format, e.g loaded by data_utils.load_weight
+    assign_ops: cache of placeholders and assign ops, they are only created on the first call
+    '''
+    ops = []
+    feed = {}
+    for name, variables in var_dict.items():
+        if not data_dict.has_key(name):
+            print("No matched weight %s, keep the current values" % name)
+            continue
+        values = data_dict[name]
+        if not isinstance(variables, (tuple, list)):
+            # upscore layers only have a kernel
+            variables = (variables,)
+            values = (values,)
+        for var, value in zip(variables, values):
+            if var.name not in assign_ops:
+                value_ph = tf.placeholder(var.dtype.base_dtype, shape=var.get_shape())
+                assign_ops[var.name] = (value_ph, tf.assign(var, value_ph))
+            value_ph, assign_op = assign_ops[var.name]
+            feed[value_ph] = value
+            ops.append(assign_op)
+    sess.run(ops, feed_dict=feed)
+
 def get_mask_conv_kernel(feed_dict, feed_name, shape):
     if not feed_dict.has_key(feed_name):
         print("No matched kernel %s, randomly initialize the kernel with shape: %s " % (feed_name, str(shape)))
@@ -117,11 +371,14 @@ def get_mask_conv_kernel(feed_dict, feed_name, shape):
     return var
 
 
-def get_conv_kernel(feed_dict, feed_name, shape):
+def get_conv_kernel(feed_dict, feed_name, shape, stddev=None):
+    '''stddev: of the truncated normal init of a missing kernel, zeros if None'''
     if not feed_dict.has_key(feed_name):
         print("No matched kernel %s, randomly initialize the kernel with shape: %s " % (feed_name, str(shape)))
-        init = tf.constant_initializer(value=0, dtype=tf.float32)
-	#init = tf.truncated_normal_initializer(stddev=0.001, dtype=tf.float32)
+        if stddev is None:
+            init = tf.constant_initializer(value=0, dtype=tf.float32)
+        else:
+            init = tf.truncated_normal_initializer(stddev=stddev, dtype=tf.float32)
     else:
         kernel = feed_dict[feed_name][0]
         shape = kernel.shape
@@ -144,22 +401,47 @@ def get_bias(feed_dict, feed_name, shape):
     var = tf.get_variable(name="bias", initializer=init, shape=shape)
     return var
     
+def bilinear_kernel(f_shape):
+    '''Transposed convolution kernel f_shape=[k, k, C, C] of a bilinear upsampling of every channel'''
+    width = f_shape[0]
+    heigh = f_shape[0]
+    f = ceil(width/2.0)
+    c = (2 * f - 1 - f % 2) / (2.0 * f)
+    bilinear = np.zeros([f_shape[0], f_shape[1]])
+    for x in range(width):
+        for y in range(heigh):
+            value = (1 - abs(x / f - c)) * (1 - abs(y / f - c))
+            bilinear[x, y] = value
+    kernel = np.zeros(f_shape)
+    for i in range(f_shape[2]):
+        kernel[:, :, i, i] = bilinear
+    return kernel
+
+def get_channel_factors(kernel, stride):
+    '''
+    Factors (column, row) of a transposed convolution kernel [k, k, C, C] which is zero off the
+    channel diagonal, has the same separable [k, k] slice outer(column, row) for every channel and
+    k a multiple of stride, as the bilinear kernel. None for any other kernel.
+    '''
+    kernel = np.asarray(kernel, dtype=np.float64)
+    if kernel.ndim != 4 or kernel.shape[2] != kernel.shape[3] or kernel.shape[0] % stride or kernel.shape[1] % stride:
+        return None
+    channels = np.arange(kernel.shape[2])
+    diagonal = kernel[:, :, channels, channels]
+    off_diagonal = kernel.copy()
+    off_diagonal[:, :, channels, channels] = 0
+    if np.any(off_diagonal) or np.any(diagonal != diagonal[:, :, :1]):
+        return None
+    u, s, vt = np.linalg.svd(diagonal[:, :, 0])
+    column, row = u[:, 0] * np.sqrt(s[0]), vt[0] * np.sqrt(s[0])
+    if not np.allclose(np.outer(column, row), diagonal[:, :, 0], rtol=1e-6, atol=1e-7 * s[0]):
+        return None
+    return column, row
+
 def get_deconv_kernel(feed_dict, feed_name, f_shape):
     if not feed_dict.has_key(feed_name):
         print("No matched deconv_kernel %s, use bilinear interpolation " % feed_name)
-        # Bilinear interpolation
-        width = f_shape[0]
-        heigh = f_shape[0]
-        f = ceil(width/2.0)
-        c = (2 * f - 1 - f % 2) / (2.0 * f)
-        bilinear = np.zeros([f_shape[0], f_shape[1]])
-        for x in range(width):
-            for y in range(heigh):
-                value = (1 - abs(x / f - c)) * (1 - abs(y / f - c))
-                bilinear[x, y] = value
-        kernel = np.zeros(f_shape)
-        for i in range(f_shape[2]):
-            kernel[:, :, i, i] = bilinear
+        kernel = bilinear_kernel(f_shape)
     else:
         kernel = feed_dict[feed_name]
         print('Load deconv_kernel %s with shape: %s' % (feed_name, kernel.shape))
@@ -0,0 +1,87 @@
+'''
+Speed/accuracy table of the reduced-resolution inference mode of FCN16VGG on the val set.
+The graph is built once with the resize factor as placeholder, every factor and upsample
+mode is timed (sess.run only, image loading excluded) and evaluated (mIoU).
+'''
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+sys.path.append("..")
+
+import os
+import time
+from PIL import Image
+
+import numpy as np
+import tensorflow as tf
+
+from network.fcn_vgg16 import FCN16VGG
+import data_utils as dt
+
+from eval.evalPixelSemantic import Evaluator
+
+# Specify which GPU to use
+os.environ['CUDA_VISIBLE_DEVICES'] = '1'
+
+val_data_config = {'city_dir':"../data/CityDatabase",
+                   'randomize': False,
+                   'seed': None,
+                   'dataset':'val'}
+
+params = {'num_classes': 20,
+          'trained_weight_path':'../data/val_weights/city_fcn8s_skip_100000.npy',
+          'scale_min': 'fcn8s',
+          'factors': [1.0, 0.75, 0.5, 0.375, 0.25],
+          'upsample': ['logits', 'labels'],
+          'num_images': 100,     # first n val images, all if None
+          'warmup': 2}           # runs per setting not timed
+
+val_dataset = dt.CityDataSet(val_data_config)
+num_images = params['num_images'] or len(val_dataset.img_indices)
+
+print('Loading %d val images ...'%num_images)
+images = []
+gt_labelIds = []
+for i in range(num_images):
+    images.append(val_dataset.load_image(val_dataset.img_indices[i]))
+    gt_labelIds.append(np.array(Image.open(val_dataset.gt_path(i, 'labelIds')), dtype=np.uint8))
+
+with tf.Session() as sess:
+    image = tf.placeholder(tf.float32, shape=[None, None, None, 3])
+    factor = tf.placeholder(tf.float32, shape=[])
+    vgg_fcn = FCN16VGG(params['trained_weight_path'])
+    option = {'fcn32s':False, 'fcn16s':False, 'fcn8s':False}
+    option[params['scale_min']] = True
+
+    # One prediction per upsample mode, the weights are shared by reusing the variable scope
+    predict_ = {}
+    for i, mode in enumerate(params['upsample']):
+        with tf.variable_scope('fcn', reuse=i > 0):
+            predict_[mode] = vgg_fcn.inference(image, num_classes=params['num_classes'], scale_min=params['scale_min'],
+                                               option=option, resize_factor=factor, upsample=mode)[params['scale_min']]
+    init = tf.initialize_all_variables()
+    sess.run(init)
+
+    table = []
+    for f in params['factors']:
+        for mode in params['upsample']:
+            for i in range(min(params['warmup'], num_images)):
+                sess.run(predict_[mode], feed_dict={image: images[i][np.newaxis, ...], factor: f})
+
+            evaluator = Evaluator()
+            seconds = 0.0
+            for i in range(num_images):
+                start = time.time()
+                pred = sess.run(predict_[mode], feed_dict={image: images[i][np.newaxis, ...], factor: f})
+                seconds += time.time() - start
+                evaluator.add(val_dataset.trainID_to_labelID(pred[0]), gt_labelIds[i])
+            table.append((f, mode, 1000.0 * seconds / num_images, num_images / seconds,
+                          evaluator.summary()['averageScoreClasses']))
+            print('factor %.3f, %s: %.1f ms/img, mIoU %.4f'%(f, mode, table[-1][2], table[-1][4]))
+
+print('')
+print('{:>8} {:>8} {:>10} {:>8} {:>8}'.format('factor', 'upsample', 'ms/img', 'img/s', 'mIoU'))
+for row in table:
+    print('{:>8.3f} {:>8} {:>10.1f} {:>8.2f} {:>8.4f}'.format(*row))
@@ -0,0 +1,64 @@
+'''
+Export frozen inference graphs, one file per network/scale, see network/frozen.py.
+FCN16VGG: one graph per scale in export_config['scales'], output name is the scale.
+InstanceFCN8s: one graph, output names are the predicted class names, e.g 'car'.
+The input placeholder is named 'image', shape=[None, None, None, 3].
+'''
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+sys.path.append("..")
+
+import os
+import tensorflow as tf
+
+from network.fcn_vgg16 import FCN16VGG
+from network.fcn_instance import InstanceFCN8s
+from network.frozen import export_frozen
+
+# Specify which GPU to use
+os.environ['CUDA_VISIBLE_DEVICES'] = ''
+
+# 'semantic': FCN16VGG weights, 'instance': InstanceFCN8s weights
+export_config = {'mode': 'semantic',
+                 'weight_path': '../data/val_weights/city_fcn8s_skip_100000.npy',
+                 'save_dir': '../data/frozen',
+                 'prefix': 'city_',            # e.g city_fcn8s.pb, city_instance.pb
+                 'scales': ['fcn32s', 'fcn16s', 'fcn8s'],
+                 'logits': False,              # export the scores instead of the argmax
+                 'optimize': True}
+
+params = {'num_classes': 20, 'max_instance': 30,
+          'gt_class':{11:'person', 13:'car'},
+          'pred_class':{13:'car'}}
+
+if not os.path.isdir(export_config['save_dir']):
+    os.makedirs(export_config['save_dir'])
+
+if export_config['mode'] == 'semantic':
+    for scale in export_config['scales']:
+        # A fresh graph per scale, so every file only holds the layers its scale needs
+        with tf.Graph().as_default(), tf.Session() as sess:
+            image = tf.placeholder(tf.float32, shape=[None, None, None, 3], name='image')
+            model = FCN16VGG(export_config['weight_path'])
+            option = {'fcn32s':False, 'fcn16s':False, 'fcn8s':False}
+            option[scale] = True
+            predict = model.inference(image, num_classes=params['num_classes'], scale_min=scale,
+                                      option=option, logits=export_config['logits'])
+            sess.run(tf.initialize_all_variables())
+            path = os.path.join(export_config['save_dir'], export_config['prefix'] + scale + '.pb')
+            export_frozen(sess, predict, {'image': image}, path, export_config['optimize'])
+else:
+    with tf.Graph().as_default(), tf.Session() as sess:
+        image = tf.placeholder(tf.float32, shape=[None, None, None, 3], name='image')
+        model = InstanceFCN8s(data_path=export_config['weight_path'], gt_class=params['gt_class'],
+                              pred_class=params['pred_class'])
+        masks = model.inference(params, image, direct_slice=False, squeeze=False, logits=export_config['logits'])
+        sess.run(tf.initialize_all_variables())
+        outputs = {}
+        for i, trainId in enumerate(sorted(params['pred_class'].keys())):
+            outputs[params['pred_class'][trainId]] = masks[i]
+        path = os.path.join(export_config['save_dir'], export_config['prefix'] + 'instance.pb')
+        export_frozen(sess, outputs, {'image': image}, path, export_config['optimize'])
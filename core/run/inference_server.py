@@ -0,0 +1,170 @@
+'''
+Long-running local inference service for FCN16VGG and/or InstanceFCN8s.
+The models are loaded once, concurrent requests are coalesced into micro-batches
+(see network.batch_inference.MicroBatcher) under a maximum latency.
+
+Endpoints:
+  POST /semantic   body: PNG/JPEG image or .npy array (uint8 RGB, [H, W, 3])
+                   response: labelIds as PNG, or .npy with ?format=npy
+  POST /instance   same input, response: stacked uint8 instance maps [H, W, num_pred_class]
+                   as .npy, or the map of the first class as PNG with ?format=png
+  GET  /stats      json with queue depth, counters and latency percentiles per model
+
+Example:
+  curl --data-binary @frankfurt_000000_000294_leftImg8bit.png localhost:8500/semantic > labelIds.png
+'''
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+sys.path.append("..")
+
+import os
+import io
+import json
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+from PIL import Image
+
+import numpy as np
+import tensorflow as tf
+
+from network.fcn_vgg16 import FCN16VGG
+from network.fcn_instance import InstanceFCN8s
+from network.batch_inference import MicroBatcher
+import data_utils as dt
+import cpu_profile
+
+# Specify which GPU to use
+os.environ['CUDA_VISIBLE_DEVICES'] = ''
+
+server_config = {'host': 'localhost',
+                 'port': 8500,
+                 'models': ['semantic', 'instance'],
+                 'semantic_weight_path': '../data/val_weights/city_fcn8s_skip_100000.npy',
+                 'instance_weight_path': '../data/val_weights/city_instance_50000.npy',
+                 'max_batch_size': 4,
+                 'max_latency_ms': 20,
+                 'cpu_profile': '../data/cpu_profile.json'}  # thread pools, see run/tune_cpu.py
+
+params = {'num_classes': 20, 'scale_min': 'fcn8s', 'max_instance': 30,
+          'gt_class':{11:'person', 13:'car'},
+          'pred_class':{13:'car'}}
+
+# Only used for the trainId -> labelId table
+city_config = {'city_dir':"../data/CityDatabase",
+               'randomize': False,
+               'seed': None,
+               'dataset':'val'}
+
+
+def decode_image(body):
+    '''PNG/JPEG bytes or a .npy array -> float32 BGR image as CityDataSet.load_image'''
+    if body[:6] == b'\x93NUMPY':
+        img = np.load(io.BytesIO(body))
+    else:
+        img = np.array(Image.open(io.BytesIO(body)).convert('RGB'))
+    if img.ndim != 3 or img.shape[2] != 3:
+        raise ValueError('Expected an RGB image of shape [H, W, 3], got %s'%str(img.shape))
+    return img.astype(np.float32)[:, :, ::-1]   # RGB -> BGR
+
+def encode_array(array, fmt):
+    buf = io.BytesIO()
+    if fmt == 'png':
+        Image.fromarray(array).save(buf, format='PNG')
+    else:
+        np.save(buf, array)
+    return buf.getvalue()
+
+
+class InferenceHandler(BaseHTTPRequestHandler):
+
+    def _reply(self, code, body, content_type):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path != '/stats':
+            self._reply(404, b'Unknown path\n', 'text/plain')
+            return
+        stats = dict((name, batcher.stats()) for name, batcher in batchers.items())
+        self._reply(200, json.dumps(stats).encode('utf-8'), 'application/json')
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        name = url.path.strip('/')
+        if name not in batchers:
+            self._reply(404, b'Unknown model\n', 'text/plain')
+            return
+        query = parse_qs(url.query)
+        fmt = query.get('format', ['png' if name == 'semantic' else 'npy'])[0]
+        try:
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            img = decode_image(body)
+        except Exception as e:
+            self._reply(400, ('%s\n'%e).encode('utf-8'), 'text/plain')
+            return
+
+        try:
+            # a failed sess.run fails every request of its batch
+            output = batchers[name].predict(img)
+            if name == 'instance' and fmt == 'png':
+                output = output[..., 0]
+            reply = encode_array(output, fmt)
+        except Exception as e:
+            self._reply(500, ('%s\n'%e).encode('utf-8'), 'text/plain')
+            return
+        content_type = 'image/png' if fmt == 'png' else 'application/octet-stream'
+        self._reply(200, reply, content_type)
+
+    def log_message(self, format, *args):
+        # one line per request is too much for a busy service
+        pass
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+city_dataset = dt.CityDataSet(city_config)
+sess = cpu_profile.make_session(server_config['cpu_profile'])
+image = tf.placeholder(tf.float32, shape=[None, None, None, 3])
+
+# Both models in one graph, the layer names of the trunks are equal
+outputs = {}
+if 'semantic' in server_config['models']:
+    with tf.variable_scope('semantic'):
+        model = FCN16VGG(server_config['semantic_weight_path'])
+        option = {'fcn32s':False, 'fcn16s':False, 'fcn8s':False}
+        option[params['scale_min']] = True
+        outputs['semantic'] = model.inference(image, num_classes=params['num_classes'], scale_min=params['scale_min'],
+                                              option=option, label_lut=city_dataset.trainId2labelId_lut)[params['scale_min']]
+if 'instance' in server_config['models']:
+    with tf.variable_scope('instance'):
+        model = InstanceFCN8s(data_path=server_config['instance_weight_path'], gt_class=params['gt_class'],
+                              pred_class=params['pred_class'])
+        outputs['instance'] = model.inference(params, image, direct_slice=False, squeeze=False, compact=True)
+sess.run(tf.initialize_all_variables())
+
+batchers = {}
+for name, output in outputs.items():
+    batchers[name] = MicroBatcher(sess, output, image, server_config['max_batch_size'],
+                                  server_config['max_latency_ms'] / 1000.0)
+
+server = ThreadingHTTPServer((server_config['host'], server_config['port']), InferenceHandler)
+print('Serving %s on %s:%d'%(', '.join(sorted(batchers.keys())), server_config['host'], server_config['port']))
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    pass
+server.server_close()
+sess.close()
@@ -0,0 +1,81 @@
+'''
+Low-rank factorization of conv6_3 and conv7 of a trained FCN16VGG weight file.
+For every rank a factored weight file is written and its latency and mIoU on the val set
+are reported next to the unfactored baseline, see compression/lowrank.py.
+'''
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+sys.path.append("..")
+
+import os
+import time
+from PIL import Image
+
+import numpy as np
+import tensorflow as tf
+
+from network.fcn_vgg16 import FCN16VGG
+from compression.lowrank import factorize_weight_dict
+import data_utils as dt
+
+from eval.evalPixelSemantic import Evaluator
+
+# Specify which GPU to use
+os.environ['CUDA_VISIBLE_DEVICES'] = ''
+
+val_data_config = {'city_dir':"../data/CityDatabase",
+                   'randomize': False,
+                   'seed': None,
+                   'dataset':'val'}
+
+lowrank_config = {'weight_path': '../data/val_weights/city_fcn8s_skip_100000.npy',
+                  'save_pattern': '../data/val_weights/city_fcn8s_skip_100000_rank%d.npy',
+                  'layers': ['conv6_3', 'conv7'],
+                  'ranks': [1024, 512, 256, 128],
+                  'num_images': 100}       # first n val images, all if None
+
+params = {'num_classes': 20, 'scale_min': 'fcn8s'}
+
+val_dataset = dt.CityDataSet(val_data_config)
+num_images = lowrank_config['num_images'] or len(val_dataset.img_indices)
+
+def evaluate(weight_path):
+    '''Mean ms per image (sess.run only) and mIoU of a weight file'''
+    with tf.Graph().as_default(), tf.Session() as sess:
+        image = tf.placeholder(tf.float32, shape=[1, None, None, 3])
+        option = {'fcn32s':False, 'fcn16s':False, 'fcn8s':False}
+        option[params['scale_min']] = True
+        predict = FCN16VGG(weight_path).inference(image, num_classes=params['num_classes'],
+                                                  scale_min=params['scale_min'], option=option,
+                                                  label_lut=val_dataset.trainId2labelId_lut)[params['scale_min']]
+        sess.run(tf.initialize_all_variables())
+
+        evaluator = Evaluator()
+        seconds = 0.0
+        for i in range(num_images):
+            img = val_dataset.load_image(val_dataset.img_indices[i])
+            start = time.time()
+            pred = sess.run(predict, feed_dict={image: img[np.newaxis, ...]})
+            if i > 0:
+                # the first run is not timed, it allocates and selects the kernels
+                seconds += time.time() - start
+            gt_labelIds = np.array(Image.open(val_dataset.gt_path(i, 'labelIds')), dtype=np.uint8)
+            evaluator.add(pred[0], gt_labelIds)
+    return 1000.0 * seconds / max(num_images - 1, 1), evaluator.summary()['averageScoreClasses']
+
+table = [('full',) + evaluate(lowrank_config['weight_path'])]
+data_dict = dt.load_weight(lowrank_config['weight_path'])
+for rank in lowrank_config['ranks']:
+    factored = factorize_weight_dict(data_dict, dict((layer, rank) for layer in lowrank_config['layers']))
+    save_path = lowrank_config['save_pattern'] % rank
+    np.save(save_path, factored)
+    table.append((str(rank),) + evaluate(save_path))
+    print('rank %s: %.1f ms/img, mIoU %.4f'%table[-1])
+
+print('')
+print('{:>8} {:>10} {:>8} {:>10}'.format('rank', 'ms/img', 'mIoU', 'delta'))
+for rank, ms, mIoU in table:
+    print('{:>8} {:>10.1f} {:>8.4f} {:>+10.4f}'.format(rank, ms, mIoU, mIoU - table[0][2]))
@@ -0,0 +1,92 @@
+'''
+Structured channel pruning of the VGG16 trunk of a trained FCN16VGG weight file.
+1. the filters are ranked by their L1 norm or by their mean activation on a few val images
+2. the pruned weight dict is saved, see compression/prune.py
+3. full and pruned weights are evaluated: ms/img and mIoU on the val images
+The pruned file is fine-tuned like any weight file: set 'trained_weight_path' of
+train_fcn32_city.py (or train_fcn8_instance.py for the instance trunk) to save_path.
+'''
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+sys.path.append("..")
+
+import os
+import time
+from PIL import Image
+
+import numpy as np
+import tensorflow as tf
+
+from network.fcn_vgg16 import FCN16VGG
+from compression.prune import prune_weight_dict, activation_means, trunk_macs, DEFAULT_KEEP
+import data_utils as dt
+
+from eval.evalPixelSemantic import Evaluator
+
+# Specify which GPU to use
+os.environ['CUDA_VISIBLE_DEVICES'] = ''
+
+val_data_config = {'city_dir':"../data/CityDatabase",
+                   'randomize': False,
+                   'seed': None,
+                   'dataset':'val'}
+
+prune_config = {'weight_path': '../data/val_weights/city_fcn8s_skip_100000.npy',
+                'save_path': '../data/val_weights/city_fcn8s_skip_100000_pruned.npy',
+                'criterion': 'activation',   # or 'l1'
+                'keep': DEFAULT_KEEP,        # layer -> fraction of filters kept
+                'num_calib_images': 8,       # first images of the val set, used for the activation means
+                'num_eval_images': 100}      # images after the calibration images, all if None
+
+params = {'num_classes': 20, 'scale_min': 'fcn8s'}
+
+val_dataset = dt.CityDataSet(val_data_config)
+num_calib = prune_config['num_calib_images']
+eval_indices = range(num_calib, len(val_dataset.img_indices))
+if prune_config['num_eval_images'] is not None:
+    eval_indices = eval_indices[:prune_config['num_eval_images']]
+
+def evaluate(weight_path, calibrate=False):
+    '''Mean ms per image (sess.run only), mIoU of a weight file and the activation means if calibrate'''
+    means = None
+    with tf.Graph().as_default(), tf.Session() as sess:
+        image = tf.placeholder(tf.float32, shape=[1, None, None, 3])
+        model = FCN16VGG(weight_path)
+        layers = model._build_model(image, params['num_classes'], is_train=False, scale_min=params['scale_min'])
+        predict = tf.argmax(layers[params['scale_min']], dimension=3)
+        sess.run(tf.initialize_all_variables())
+
+        if calibrate:
+            images = (val_dataset.load_image(val_dataset.img_indices[i]) for i in range(num_calib))
+            means = activation_means(sess, layers, image, images)
+
+        evaluator = Evaluator()
+        seconds = 0.0
+        for n, i in enumerate(eval_indices):
+            img = val_dataset.load_image(val_dataset.img_indices[i])
+            start = time.time()
+            pred = sess.run(predict, feed_dict={image: img[np.newaxis, ...]})
+            if n > 0:
+                # the first run is not timed, it allocates and selects the kernels
+                seconds += time.time() - start
+            gt_labelIds = np.array(Image.open(val_dataset.gt_path(i, 'labelIds')), dtype=np.uint8)
+            evaluator.add(val_dataset.trainID_to_labelID(pred[0]), gt_labelIds)
+    ms = 1000.0 * seconds / max(len(eval_indices) - 1, 1)
+    return ms, evaluator.summary()['averageScoreClasses'], means
+
+full_ms, full_mIoU, means = evaluate(prune_config['weight_path'],
+                                     calibrate=prune_config['criterion'] == 'activation')
+
+data_dict = dt.load_weight(prune_config['weight_path'])
+pruned, _ = prune_weight_dict(data_dict, prune_config['keep'], prune_config['criterion'], means)
+np.save(prune_config['save_path'], pruned)
+pruned_ms, pruned_mIoU, _ = evaluate(prune_config['save_path'])
+
+print('')
+print('{:<8} {:>10} {:>10} {:>8}'.format('weights', 'GMACs', 'ms/img', 'mIoU'))
+print('{:<8} {:>10.1f} {:>10.1f} {:>8.4f}'.format('full', trunk_macs(data_dict) / 1e9, full_ms, full_mIoU))
+print('{:<8} {:>10.1f} {:>10.1f} {:>8.4f}'.format('pruned', trunk_macs(pruned) / 1e9, pruned_ms, pruned_mIoU))
+print('mIoU delta before fine-tuning: %+.4f, pruned weights saved to %s'%(pruned_mIoU - full_mIoU, prune_config['save_path']))
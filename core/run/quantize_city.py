@@ -0,0 +1,89 @@
+'''
+Quantize a trained FCN16VGG weight file to int8 or fp16 and report the mIoU delta.
+1. the activation statistics are collected on a few val images with the float weights
+2. the weight dict is quantized and saved, see compression/quantize.py
+3. float and quantized weights are evaluated on the same val images
+The quantized file is loaded by data_utils.load_weight like any float weight file.
+'''
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+sys.path.append("..")
+
+import os
+import time
+from PIL import Image
+
+import numpy as np
+import tensorflow as tf
+
+from network.fcn_vgg16 import FCN16VGG
+from compression.quantize import quantize_weight_dict, activation_stats, weight_dict_bytes
+import data_utils as dt
+
+from eval.evalPixelSemantic import Evaluator
+
+# Specify which GPU to use
+os.environ['CUDA_VISIBLE_DEVICES'] = ''
+
+val_data_config = {'city_dir':"../data/CityDatabase",
+                   'randomize': False,
+                   'seed': None,
+                   'dataset':'val'}
+
+quant_config = {'weight_path': '../data/val_weights/city_fcn8s_skip_100000.npy',
+                'save_path': '../data/val_weights/city_fcn8s_skip_100000_int8.npy',
+                'mode': 'int8',              # or 'fp16'
+                'num_calib_images': 8,       # first images of the val set, used for the calibration
+                'num_eval_images': 100}      # images after the calibration images, all if None
+
+params = {'num_classes': 20, 'scale_min': 'fcn8s'}
+
+val_dataset = dt.CityDataSet(val_data_config)
+num_calib = quant_config['num_calib_images']
+eval_indices = range(num_calib, len(val_dataset.img_indices))
+if quant_config['num_eval_images'] is not None:
+    eval_indices = eval_indices[:quant_config['num_eval_images']]
+
+def evaluate(weight_path, calibrate=False):
+    '''mIoU of a weight file, and the activation statistics if calibrate'''
+    stats = None
+    with tf.Graph().as_default(), tf.Session() as sess:
+        image = tf.placeholder(tf.float32, shape=[1, None, None, 3])
+        model = FCN16VGG(weight_path)
+        layers = model._build_model(image, params['num_classes'], is_train=False, scale_min=params['scale_min'])
+        predict = tf.argmax(layers[params['scale_min']], dimension=3)
+        sess.run(tf.initialize_all_variables())
+
+        if calibrate:
+            images = (val_dataset.load_image(val_dataset.img_indices[i]) for i in range(num_calib))
+            stats = activation_stats(sess, layers, image, images)
+
+        evaluator = Evaluator()
+        for i in eval_indices:
+            img = val_dataset.load_image(val_dataset.img_indices[i])
+            pred = sess.run(predict, feed_dict={image: img[np.newaxis, ...]})
+            gt_labelIds = np.array(Image.open(val_dataset.gt_path(i, 'labelIds')), dtype=np.uint8)
+            evaluator.add(val_dataset.trainID_to_labelID(pred[0]), gt_labelIds)
+    return evaluator.summary()['averageScoreClasses'], stats
+
+float_mIoU, stats = evaluate(quant_config['weight_path'], calibrate=True)
+
+data_dict = dt.load_weight(quant_config['weight_path'])
+quantized = quantize_weight_dict(data_dict, quant_config['mode'], stats)
+np.save(quant_config['save_path'], quantized)
+
+start = time.time()
+dt.load_weight(quant_config['save_path'])
+load_seconds = time.time() - start
+quant_mIoU, _ = evaluate(quant_config['save_path'])
+
+print('')
+print('{:<10} {:>10} {:>10} {:>8}'.format('weights', 'MB', 'file MB', 'mIoU'))
+print('{:<10} {:>10.1f} {:>10.1f} {:>8.4f}'.format('float32', weight_dict_bytes(data_dict) / 2.0**20,
+      os.path.getsize(quant_config['weight_path']) / 2.0**20, float_mIoU))
+print('{:<10} {:>10.1f} {:>10.1f} {:>8.4f}'.format(quant_config['mode'], weight_dict_bytes(quantized) / 2.0**20,
+      os.path.getsize(quant_config['save_path']) / 2.0**20, quant_mIoU))
+print('mIoU delta: %+.4f, load time of the quantized file: %.1f s'%(quant_mIoU - float_mIoU, load_seconds))
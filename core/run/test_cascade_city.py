@@ -0,0 +1,92 @@
+'''
+Cascaded coarse-to-fine inference on the Cityscapes val set, see network/cascade.py.
+For every margin threshold: mIoU, mean fraction of pixels refined by the fcn8s decoder,
+ms/img and the speedup over the full fcn8s inference of the same model.
+The decoder is a small part of the VGG16 model, the trunk runs on the whole image in both
+cases, the cascade pays off with the lite backbone ('backbone': 'lite', see train_lite_city.py).
+'''
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+sys.path.append("..")
+
+import os
+import time
+from PIL import Image
+
+import numpy as np
+import tensorflow as tf
+
+from network.fcn_vgg16 import FCN16VGG
+from network.cascade import build_cascade, cascade_predict
+import data_utils as dt
+
+from eval.evalPixelSemantic import Evaluator
+
+# Specify which GPU to use
+os.environ['CUDA_VISIBLE_DEVICES'] = ''
+
+val_data_config = {'city_dir':"../data/CityDatabase",
+                   'randomize': False,
+                   'seed': None,
+                   'dataset':'val'}
+
+cascade_config = {'weight_path': '../data/val_weights/city_fcn8s_skip_100000.npy',
+                  'backbone': 'vgg16',
+                  'thresholds': [0.1, 0.3, 0.5],
+                  'tile_size': 256,
+                  'num_images': 100}     # first n val images, all if None
+
+params = {'num_classes': 20}
+
+val_dataset = dt.CityDataSet(val_data_config)
+num_images = cascade_config['num_images'] or len(val_dataset.img_indices)
+
+with tf.Session() as sess:
+    image = tf.placeholder(tf.float32, shape=[1, None, None, 3])
+    model = FCN16VGG(cascade_config['weight_path'], backbone=cascade_config['backbone'])._build_model(
+        image, params['num_classes'], scale_min='fcn8s')
+    cascade = build_cascade(model, image)
+    sess.run(tf.initialize_all_variables())
+
+    # 'full' is the plain fcn8s inference, threshold -> cascade
+    evaluators = {'full': Evaluator()}
+    seconds = {'full': 0.0}
+    refined = {}
+    for threshold in cascade_config['thresholds']:
+        evaluators[threshold] = Evaluator()
+        seconds[threshold] = 0.0
+        refined[threshold] = 0.0
+
+    for i in range(num_images):
+        img = val_dataset.load_image(val_dataset.img_indices[i])
+        gt_labelIds = np.array(Image.open(val_dataset.gt_path(i, 'labelIds')), dtype=np.uint8)
+
+        start = time.time()
+        pred = sess.run(cascade['fine'], feed_dict={image: img[np.newaxis, ...]})[0]
+        if i > 0:
+            # the first runs are not timed, they allocate and select the kernels
+            seconds['full'] += time.time() - start
+        evaluators['full'].add(val_dataset.trainID_to_labelID(pred), gt_labelIds)
+
+        for threshold in cascade_config['thresholds']:
+            start = time.time()
+            pred, fraction = cascade_predict(sess, model, cascade, image, img,
+                                             cascade_config['tile_size'], threshold)
+            if i > 0:
+                seconds[threshold] += time.time() - start
+            refined[threshold] += fraction
+            evaluators[threshold].add(val_dataset.trainID_to_labelID(pred), gt_labelIds)
+
+timed = max(num_images - 1, 1)
+full_ms = 1000.0 * seconds['full'] / timed
+print('')
+print('{:>10} {:>8} {:>9} {:>10} {:>8}'.format('threshold', 'mIoU', 'refined', 'ms/img', 'speedup'))
+print('{:>10} {:>8.4f} {:>9.3f} {:>10.1f} {:>8.2f}'.format('full', evaluators['full'].summary()['averageScoreClasses'],
+                                                         1.0, full_ms, 1.0))
+for threshold in cascade_config['thresholds']:
+    ms = 1000.0 * seconds[threshold] / timed
+    print('{:>10.2f} {:>8.4f} {:>9.3f} {:>10.1f} {:>8.2f}'.format(threshold,
+          evaluators[threshold].summary()['averageScoreClasses'], refined[threshold] / num_images, ms, full_ms / ms))
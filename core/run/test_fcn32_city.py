@@ -21,6 +21,7 @@ import numpy as np
 import tensorflow as tf
 
 from network.fcn_vgg16 import FCN16VGG
+from network.batch_inference import iter_batched
 import data_utils as dt
 import glob
 
@@ -38,8 +39,11 @@ test_data_config = {'city_dir':"../data/CityDatabase",
                      'colored_save_path': '../data/test_city_colored',
                      'labelIDs_save_path': '../data/test_city_labelIDs'}
 
-params = {'num_classes': 20, 'rate': 1e-4,
+params = {'num_classes': 20, 'rate': 1e-4, 'batch_size': 4,
           'trained_weight_path':'../data/val_weights/city_fcn8s_skip_100000.npy',
+          'roi': None,              # e.g (256, -192): rows of the frame the network runs on
+          'roi_fill': (10, 0),      # trainIds of the rows above (sky) and below (road), not void (19),
+                                    # it becomes labelId 19 (traffic light) in the evaluation
           'pred_type_prefix':'_skip_10000_'} # When saving predicting result, the prefix is
                                        # concatenated into the file name
 
@@ -51,12 +55,14 @@ print('Validation weight:%s \n'%params['trained_weight_path'])
 with tf.Session() as sess:
     # Init model and load approriate weights-data
     vgg_fcn32s = FCN16VGG(params['trained_weight_path'])
-    image = tf.placeholder(tf.float32, shape=[1, None, None, 3])
+    # Batch dimension is left open, equal-shaped images are run as one batch
+    image = tf.placeholder(tf.float32, shape=[None, None, None, 3])
 
     # Build fcn32 model
     option={'fcn32s':False, 'fcn16s':False, 'fcn8s':True}
     predict_ = vgg_fcn32s.inference(image, num_classes=params['num_classes'],
-                                    scale_min='fcn8s', option=option)
+                                    scale_min='fcn8s', option=option, compact=True,
+                                    roi=params['roi'], roi_fill=params['roi_fill'])
 
     predict = {}
     accuracy = 0.0
@@ -65,20 +71,17 @@ with tf.Session() as sess:
     sess.run(init)
 
     print('Running the inference ...')
-    for i in range(iterations):
-        #print("iter:", i)
-        # Load data, Already converted to BGR
-        next_pair = test_dataset.next_batch()
-        next_pair_image = next_pair[0]
-        feed_dict = {image: next_pair_image}
-
-        predict = sess.run(predict_, feed_dict=feed_dict)
-        prefix_dict = []
+    prefix_dict = []
+    for key in option.keys():
+        if option[key]:
+            prefix_dict.append(key+params['pred_type_prefix'])  # e.g fcn16_skip_ will be added into the name of pred_to_color
+
+    # Images are already converted to BGR
+    images = (test_dataset.load_image(fname) for fname in test_dataset.img_indices[:iterations])
+    for i, predict in iter_batched(sess, predict_, image, images, params['batch_size']):
         for key in option.keys():
             if option[key]:
-                fname_prefix = key+params['pred_type_prefix']  # e.g fcn16_skip_ will be added into the name of pred_to_color
-                prefix_dict.append(fname_prefix)
-                test_dataset.save_trainID_img(fname_prefix, predict[key])
+                test_dataset.save_trainID_img(key+params['pred_type_prefix'], predict[key], img_idx=i)
     # print("Inference done! Start transforming to colored ...")
     # test_dataset.pred_to_color()
     print("Inference done! Start transforming to labelIDs ...")
@@ -13,12 +13,14 @@ import numpy as np
 import tensorflow as tf
 
 from network.fcn_instance import InstanceFCN8s
+from network.batch_inference import iter_batched
 import data_utils as dt
 
+from PIL import Image
 from scipy.misc import toimage
 from scipy.misc import imsave
 
-from eval import evalPixelSemantic
+from eval.evalInstanceLevel import InstanceEvaluator
 
 # Specify which GPU to use
 os.environ['CUDA_VISIBLE_DEVICES'] = ''
@@ -35,37 +37,45 @@ test_data_config = {'city_dir':"../data/CityDatabase",
 
 params = {'num_classes': 20, 'max_instance': 30, 
           'gt_class':{11:'person', 13:'car'},
-          'pred_class':{13:'car'}, 
+          'pred_class':{13:'car'}, 'batch_size': 4,
+          'lowres': False,   # argmax at 1/8 resolution, only the labels are upsampled
           'trained_weight_path':'../data/val_weights/city_instance_50000.npy'}
 
 test_dataset = dt.CityDataSet(test_data_config)
-iterations = 2
+iterations = len(test_dataset.img_indices)
 
 
 with tf.Session() as sess:
     # Initialization
     ifcn = InstanceFCN8s(data_path=params['trained_weight_path'], gt_class=params['gt_class'], pred_class=params['pred_class'])
-    image = tf.placeholder(tf.float32, shape=[1, None, None, 3])
+    # Batch dimension is left open, equal-shaped images are run as one batch
+    image = tf.placeholder(tf.float32, shape=[None, None, None, 3])
 
-    # Build fcn8s_instance, return masks of each class [mask_11,mask_13]
-    # each mask has shape [1, h, w, 1]
-    predict, masks = ifcn.inference(params, image, direct_slice=False)
+    # Build fcn8s_instance, return the masks of all classes stacked as uint8,
+    # shape [batch, h, w, num_pred_class]
+    if params['lowres']:
+        predict = ifcn.inference_lowres(params, image, direct_slice=False, squeeze=False, compact=True)
+    else:
+        predict = ifcn.inference(params, image, direct_slice=False, squeeze=False, compact=True)
     print('Finished building inference network-fcn8s_instance.')
     init = tf.initialize_all_variables()
     sess.run(init)
 
+    # AP/AP50 of the predicted classes, masks are in the order of pred_class
+    evaluator = InstanceEvaluator(classTrainIds=sorted(params['pred_class'].keys()))
+
     print('Running the inference ...')
-    for i in range(iterations):
-        # Load data, Already converted to BGR
-        next_pair = test_dataset.next_batch()
-        next_pair_image = next_pair[0]
-        feed_dict = {image: next_pair_image}
-        
-	np.save('./softmax/50000/inf.npy',sess.run(masks, feed_dict=feed_dict)) 
-        predict_ = sess.run(predict, feed_dict=feed_dict)
+    # Images are already converted to BGR
+    images = (test_dataset.load_image(fname) for fname in test_dataset.img_indices[:iterations])
+    for i, predict_ in iter_batched(sess, predict, image, images, params['batch_size']):
+        gt_instances = np.array(Image.open(test_dataset.gt_path(i, 'instanceIds')))
+        evaluator.add(predict_, gt_instances)
         #imsave('../data/test_city_instance/person_%d.png'%i,predict_[0])
-        imsave('../data/test_city_instance/car_%d_color.png'%i, predict_[0])
+        imsave('../data/test_city_instance/car_%d_color.png'%i, predict_[..., 0])
         #pname = '../data/test_city_instance/person_%d.png'%i
         cname = '../data/test_city_instance/car_%d.png'%i
         #toimage(predict_[0], high=params['max_instance'], low=0, cmin=0, cmax=params['max_instance']).save(pname)
-        toimage(predict_[0], high=params['max_instance'], low=0, cmin=0, cmax=params['max_instance']).save(cname)
+        toimage(predict_[..., 0], high=params['max_instance'], low=0, cmin=0, cmax=params['max_instance']).save(cname)
+
+    print('Inference done! Instance level scores:')
+    evaluator.printSummary()
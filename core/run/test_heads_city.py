@@ -0,0 +1,86 @@
+'''
+Compare the fcn32s, fcn16s and fcn8s heads of one FCN16VGG model on the val set.
+All heads are computed by the same forward pass (the backbone runs once per image)
+and every head is accumulated into its own Evaluator, no png is written.
+The result is printed as a side by side table of class IoUs and averages.
+'''
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+sys.path.append("..")
+
+import os
+from PIL import Image
+
+import numpy as np
+import tensorflow as tf
+
+from network.fcn_vgg16 import FCN16VGG
+import data_utils as dt
+
+from eval.evalPixelSemantic import Evaluator, printScoreComparison
+
+# Specify which GPU to use
+os.environ['CUDA_VISIBLE_DEVICES'] = '1'
+
+val_data_config = {'city_dir':"../data/CityDatabase",
+                   'randomize': False,
+                   'seed': None,
+                   'dataset':'val'}
+
+params = {'num_classes': 20,
+          'trained_weight_path':'../data/val_weights/city_fcn8s_skip_100000.npy',
+          'heads': ['fcn32s', 'fcn16s', 'fcn8s'],
+          'eval_iiou': True}
+
+HEAD_ORDER = ['fcn32s', 'fcn16s', 'fcn8s']
+
+val_dataset = dt.CityDataSet(val_data_config)
+iterations = len(val_dataset.img_indices)
+
+# The deepest requested head decides how much of the decoder is built
+scale_min = max(params['heads'], key=HEAD_ORDER.index)
+
+print('Validation weight:%s \n'%params['trained_weight_path'])
+with tf.Session() as sess:
+    vgg_fcn = FCN16VGG(params['trained_weight_path'])
+    image = tf.placeholder(tf.float32, shape=[1, None, None, 3])
+
+    option = {}
+    for head in HEAD_ORDER:
+        option[head] = head in params['heads']
+    # uint8 labelIds straight from the graph
+    predict_ = vgg_fcn.inference(image, num_classes=params['num_classes'],
+                                 scale_min=scale_min, option=option,
+                                 label_lut=val_dataset.trainId2labelId_lut)
+    print('Finished building inference network, heads: %s.'%', '.join(params['heads']))
+    init = tf.initialize_all_variables()
+    sess.run(init)
+
+    evaluators = {}
+    for head in params['heads']:
+        evaluators[head] = Evaluator()
+
+    print('Running the inference ...')
+    for i in range(iterations):
+        img = val_dataset.load_image(val_dataset.img_indices[i])
+        gt_labelIds = np.array(Image.open(val_dataset.gt_path(i, 'labelIds')), dtype=np.uint8)
+        gt_instances = None
+        if params['eval_iiou']:
+            gt_instances = np.array(Image.open(val_dataset.gt_path(i, 'instanceIds')), dtype=np.uint16)
+
+        # One run fetches the argmax of every requested head
+        predict = sess.run(predict_, feed_dict={image: img[np.newaxis, ...]})
+        for head in params['heads']:
+            evaluators[head].add(predict[head][0], gt_labelIds, gt_instances)
+
+        print("\rImages Processed: {}".format(i+1), end=' ')
+        sys.stdout.flush()
+    print('')
+
+results = {}
+for head in params['heads']:
+    results[head] = evaluators[head].summary()
+printScoreComparison(results, [head for head in HEAD_ORDER if head in params['heads']])
@@ -0,0 +1,71 @@
+'''
+Testing script for JointFCN8s: semantic labels (mIoU/iIoU) and instance masks (AP/AP50)
+of the val set from one shared VGG16 trunk pass per image.
+'''
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+sys.path.append("..")
+
+import os
+from PIL import Image
+
+import numpy as np
+import tensorflow as tf
+
+from network.fcn_joint import JointFCN8s
+from network.batch_inference import iter_batched
+import data_utils as dt
+
+from eval.evalPixelSemantic import Evaluator
+from eval.evalInstanceLevel import InstanceEvaluator
+
+# Specify which GPU to use
+os.environ['CUDA_VISIBLE_DEVICES'] = '1'
+
+val_data_config = {'city_dir':"../data/CityDatabase",
+                   'randomize': False,
+                   'seed': None,
+                   'dataset':'val'}
+
+params = {'num_classes': 20, 'max_instance': 30, 'batch_size': 1,
+          'gt_class':{11:'person', 13:'car'},
+          'pred_class':{13:'car'},
+          'semantic_weight_path':'../data/val_weights/city_fcn8s_skip_100000.npy',
+          'instance_weight_path':'../data/val_weights/city_instance_50000.npy',
+          'trunk': 'semantic'}   # weight file of the shared trunk, 'semantic' or 'instance'
+
+val_dataset = dt.CityDataSet(val_data_config)
+iterations = len(val_dataset.img_indices)
+
+with tf.Session() as sess:
+    model = JointFCN8s(params['semantic_weight_path'], params['instance_weight_path'], trunk=params['trunk'],
+                       pred_class=params['pred_class'], gt_class=params['gt_class'])
+    image = tf.placeholder(tf.float32, shape=[None, None, None, 3])
+    # uint8 labelIds and stacked uint8 instance masks straight from the graph
+    predict_ = model.inference(params, image, scale_min='fcn8s', squeeze=False,
+                               compact=True, label_lut=val_dataset.trainId2labelId_lut)
+    print('Finished building inference network-joint fcn8s.')
+    init = tf.initialize_all_variables()
+    sess.run(init)
+
+    evaluator = Evaluator()
+    inst_evaluator = InstanceEvaluator(classTrainIds=sorted(params['pred_class'].keys()))
+
+    print('Running the inference ...')
+    images = (val_dataset.load_image(fname) for fname in val_dataset.img_indices[:iterations])
+    for i, (semantic, instance_masks) in iter_batched(sess, predict_, image, images, params['batch_size']):
+        gt_labelIds = np.array(Image.open(val_dataset.gt_path(i, 'labelIds')), dtype=np.uint8)
+        gt_instances = np.array(Image.open(val_dataset.gt_path(i, 'instanceIds')))
+        evaluator.add(semantic, gt_labelIds, gt_instances)
+        inst_evaluator.add(instance_masks, gt_instances)
+
+        print("\rImages Processed: {}".format(i+1), end=' ')
+        sys.stdout.flush()
+    print('')
+
+result = evaluator.summary()
+print('mIoU: %.4f, iIoU: %.4f'%(result['averageScoreClasses'], result['averageScoreInstClasses']))
+inst_evaluator.printSummary()
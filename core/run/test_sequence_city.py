@@ -0,0 +1,84 @@
+'''
+Accuracy/throughput tradeoff of temporal feature reuse on the Cityscapes val sequences
+(leftImg8bit_sequence must be extracted next to leftImg8bit), see network/temporal.py.
+For every keyframe interval the snippets of the val images are streamed through a
+KeyframeSegmenter. The stream of the i-th snippet starts (i mod interval) frames before
+the annotated frame, so the annotated frames cover all distances to their keyframe.
+Reported: mIoU on the annotated frames, ms per keyframe / other frame and frames per second.
+'''
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+sys.path.append("..")
+
+import os
+import time
+from PIL import Image
+
+import numpy as np
+import tensorflow as tf
+
+from network.fcn_vgg16 import FCN16VGG
+from network.temporal import KeyframeSegmenter
+import data_utils as dt
+
+from eval.evalPixelSemantic import Evaluator
+
+# Specify which GPU to use
+os.environ['CUDA_VISIBLE_DEVICES'] = ''
+
+val_data_config = {'city_dir':"../data/CityDatabase",
+                   'randomize': False,
+                   'seed': None,
+                   'dataset':'val'}
+
+sequence_config = {'weight_path': '../data/val_weights/city_fcn8s_skip_100000.npy',
+                   'intervals': [1, 2, 5, 10],
+                   'num_sequences': 50}    # first n val images with their snippets, all if None
+
+params = {'num_classes': 20}
+
+val_dataset = dt.CityDataSet(val_data_config)
+num_sequences = sequence_config['num_sequences'] or len(val_dataset.img_indices)
+
+with tf.Session() as sess:
+    image = tf.placeholder(tf.float32, shape=[1, None, None, 3])
+    model = FCN16VGG(sequence_config['weight_path'])._build_model(image, params['num_classes'], scale_min='fcn8s')
+    predict = tf.argmax(model['fcn8s'], dimension=3)
+    sess.run(tf.initialize_all_variables())
+
+    table = []
+    for interval in sequence_config['intervals']:
+        segmenter = KeyframeSegmenter(sess, model, image, predict, keyframe_interval=interval)
+        evaluator = Evaluator()
+        seconds = {True: 0.0, False: 0.0}
+        counts = {True: 0, False: 0}
+        for i in range(num_sequences):
+            frames = val_dataset.sequence_frames(i, first=-(i % interval), last=0)
+            if len(frames) == 0:
+                print('No sequence frames of %s'%val_dataset.img_indices[i])
+                continue
+            segmenter.reset()
+            for fname in frames:
+                img = val_dataset.load_image(fname)
+                start = time.time()
+                pred = segmenter.segment(img)
+                seconds[segmenter.last_was_keyframe] += time.time() - start
+                counts[segmenter.last_was_keyframe] += 1
+            # the last frame of the stream is the annotated one
+            gt_labelIds = np.array(Image.open(val_dataset.gt_path(i, 'labelIds')), dtype=np.uint8)
+            evaluator.add(val_dataset.trainID_to_labelID(pred[0]), gt_labelIds)
+
+        key_ms = 1000.0 * seconds[True] / max(counts[True], 1)
+        other_ms = 1000.0 * seconds[False] / max(counts[False], 1)
+        # steady state: one keyframe and interval-1 other frames
+        fps = 1000.0 * interval / (key_ms + (interval - 1) * other_ms)
+        table.append((interval, evaluator.summary()['averageScoreClasses'], key_ms, other_ms, fps))
+        print('interval %d: mIoU %.4f, keyframe %.1f ms, other frames %.1f ms, %.2f fps'%table[-1])
+
+print('')
+print('{:>8} {:>8} {:>10} {:>10} {:>8}'.format('interval', 'mIoU', 'key ms', 'other ms', 'fps'))
+for row in table:
+    print('{:>8d} {:>8.4f} {:>10.1f} {:>10.1f} {:>8.2f}'.format(*row))
@@ -0,0 +1,79 @@
+'''
+Tiled inference of FCN16VGG on the val set with bounded activation memory.
+Every image is cut into overlapping tiles, the logits of the tiles are blended and
+the argmax of the stitched scores is evaluated (mIoU).
+The tile size is given directly or picked as the largest tile that fits into memory_budget.
+'''
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+sys.path.append("..")
+
+import os
+from PIL import Image
+
+import numpy as np
+import tensorflow as tf
+
+from network.fcn_vgg16 import FCN16VGG
+from network.tiling import tiled_predict, pick_tile_size, estimate_activation_bytes, estimate_stitching_bytes
+import data_utils as dt
+
+from eval.evalPixelSemantic import Evaluator
+
+# Specify which GPU to use
+os.environ['CUDA_VISIBLE_DEVICES'] = ''
+
+val_data_config = {'city_dir':"../data/CityDatabase",
+                   'randomize': False,
+                   'seed': None,
+                   'dataset':'val'}
+
+params = {'num_classes': 20,
+          'trained_weight_path':'../data/val_weights/city_fcn8s_skip_100000.npy',
+          'scale_min': 'fcn8s',
+          'tile_size': None,             # (tile_h, tile_w), picked from memory_budget if None
+          'memory_budget': 1 << 30,      # bytes of activations per sess.run and stitched scores
+          'overlap': 64,
+          'batch_size': 1}               # tiles per sess.run
+
+val_dataset = dt.CityDataSet(val_data_config)
+iterations = len(val_dataset.img_indices)
+
+with tf.Session() as sess:
+    vgg_fcn = FCN16VGG(params['trained_weight_path'])
+    image = tf.placeholder(tf.float32, shape=[None, None, None, 3])
+
+    option = {'fcn32s':False, 'fcn16s':False, 'fcn8s':False}
+    option[params['scale_min']] = True
+    logits_ = vgg_fcn.inference(image, num_classes=params['num_classes'], scale_min=params['scale_min'],
+                                option=option, logits=True)
+    init = tf.initialize_all_variables()
+    sess.run(init)
+
+    evaluator = Evaluator()
+    print('Running the inference ...')
+    for i in range(iterations):
+        img = val_dataset.load_image(val_dataset.img_indices[i])
+        tile_size = params['tile_size']
+        if tile_size is None:
+            tile_size = pick_tile_size(params['memory_budget'], img.shape[:2], params['num_classes'],
+                                       num_outputs=1, batch_size=params['batch_size'])
+        if i == 0:
+            print('Tile size: %s, estimated activations: %.1f MB, stitching: %.1f MB'%(str(tile_size),
+                  estimate_activation_bytes(tile_size[0], tile_size[1], params['num_classes'],
+                                            batch_size=params['batch_size']) / 2.0**20,
+                  estimate_stitching_bytes(img.shape[0], img.shape[1], params['num_classes']) / 2.0**20))
+
+        predict = tiled_predict(sess, logits_, image, img, tile_size, params['overlap'], params['batch_size'])
+        gt_labelIds = np.array(Image.open(val_dataset.gt_path(i, 'labelIds')), dtype=np.uint8)
+        evaluator.add(val_dataset.trainID_to_labelID(predict[params['scale_min']]), gt_labelIds)
+
+        print("\rImages Processed: {}".format(i+1), end=' ')
+        sys.stdout.flush()
+    print('')
+
+result = evaluator.summary()
+print('mIoU: %.4f'%result['averageScoreClasses'])
@@ -37,7 +37,7 @@ train_data_config = {'city_dir':"../data/CityDatabase",
 fcn_scale = 'fcn32s'
 params = {'num_classes': 20, 'rate': 1e-6,
           'tsboard_save_path': '../data/tsboard_result/%s'%fcn_scale,
-          'trained_weight_path':'../data/val_weights/fcn32s/city_fcn32s_skip_130000.npy',
+          'trained_weight_path':'../data/val_weights/fcn32s/city_fcn32s_skip_130000.npy',  # or a pruned file, see run/prune_city.py
           'save_trained_weight_path':'../data/val_weights/'}
 
 # Change to Cityscape databse
@@ -35,9 +35,12 @@ train_data_config = {'voc_dir':"../data/VOC2012",
                                              # Set to True only when you know it will happen, e.g you defined a class
                                              # Default is false
                      'randomize': True,
-                     'seed': None}
+                     'seed': None,
+                     'buckets': [(352, 512), (512, 352), (384, 512), (512, 384), (512, 512)]}  # canonical padded sizes
 
 params = {'num_classes': 20, 'rate': 1e-4,
+          'batch_size': 4,                  # samples of one bucket per iteration
+          'ignore_label': dt.IGNORE_LABEL,  # void and padded pixels
           'trained_weight_path':'../data/vgg16.npy',
           'save_trained_weight_path':'../data',		# specify later
           'predef_index':None}              # None, if not needed
@@ -53,15 +56,15 @@ with tf.Session() as sess:
     vgg_fcn32s = FCN16VGG(params['trained_weight_path'])
 
     # Be aware of loaded data type....
-    batch = tf.placeholder(tf.float32, shape=[1, None, None, 3])
+    batch = tf.placeholder(tf.float32, shape=[None, None, None, 3])
     label = tf.placeholder(tf.int32, shape=[None])	# label is already vectorized before feed
 
     # create model and train op
-    [train_op, loss] = vgg_fcn32s.train_fcn32(params=params,
-                                              image=batch,
-                                              truth=label,
-                                              random_init_fc8=False,
-                                              save_var=True)
+    [train_op, loss] = vgg_fcn32s.train(params=params,
+                                        image=batch,
+                                        truth=label,
+                                        scale_min='fcn32s',
+                                        save_var=True)
     trained_var_dict = vgg_fcn32s.var_dict
     print('Finished building network-fcn32.')
     init = tf.initialize_all_variables()
@@ -71,12 +74,14 @@ with tf.Session() as sess:
     for i in range(iterations):
         print("iter: ", i)
         # Load data, ......
-        next_pair = train_dataset.next_batch(params['predef_index'])
+        if params['predef_index'] is None:
+            # a few padded shapes only, equal-shaped samples are batched
+            next_pair = train_dataset.next_bucket_batch(params['batch_size'])
+        else:
+            next_pair = train_dataset.next_batch(params['predef_index'])
         next_pair_image = next_pair[0]
 
-        image_shape = next_pair_image.shape
-        num_pixels = image_shape[1] * image_shape[2]
-        next_pair_label = np.reshape(next_pair[1], num_pixels)	# reshape to numpy 1-D vector
+        next_pair_label = np.reshape(next_pair[1], -1)	# reshape to numpy 1-D vector
 
         feed_dict = {batch: next_pair_image,
                      label: next_pair_label,}
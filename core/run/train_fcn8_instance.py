@@ -34,7 +34,7 @@ params = {'rate': 1e-4, 'num_classes': 20, 'max_instance': 30,
           'gt_class':{11:'person', 13:'car'},
           'pred_class':{13:'car'}, 
           'tsboard_save_path': '../data/tsboard_result/instance',          
-          'trained_weight_path':'../data/val_weights/fcn8s/city_fcn8s_skip_100000.npy',
+          'trained_weight_path':'../data/val_weights/fcn8s/city_fcn8s_skip_100000.npy',  # or a pruned file, see run/prune_city.py
           'save_trained_weight_path':'../data/val_weights/'}
 
 # Load ground truth masks ##### 
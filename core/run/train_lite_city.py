@@ -0,0 +1,90 @@
+'''
+Train the lite FCN8s (reduced width, depthwise separable trunk) by distillation:
+the trained VGG16 FCN8s is the teacher, its softened scores are learned alongside the
+ground truth labels, see FCN16VGG.train(teacher=...).
+The student is trained from scratch, or continued from 'student_weight_path'.
+The saved weights are evaluated like any FCN16VGG weight file with FCN16VGG(path, backbone='lite').
+'''
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+sys.path.append("..")
+
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from network.fcn_vgg16 import FCN16VGG
+import data_utils as dt
+
+# Specify which GPU to use
+os.environ['CUDA_VISIBLE_DEVICES'] = '1'
+
+train_data_config = {'city_dir':"../data/CityDatabase",
+                     'randomize': True,
+                     'seed': None,
+                     'dataset': 'train'}
+
+fcn_scale = 'fcn8s'
+params = {'num_classes': 20, 'rate': 1e-4,
+          'temperature': 4.0,           # softens the teacher scores
+          'distill_weight': 0.7,        # weight of the soft loss, the hard loss gets 1 - distill_weight
+          'tsboard_save_path': '../data/tsboard_result/lite_%s'%fcn_scale,
+          'teacher_weight_path':'../data/val_weights/city_fcn8s_skip_100000.npy',
+          'student_weight_path': None,  # None to train from scratch
+          'save_trained_weight_path':'../data/val_weights/'}
+
+train_dataset = dt.CityDataSet(train_data_config)
+
+# Hyper-parameters
+train_iter = 200000
+val_step = 10000
+
+print('Training config: lite %s distilled from %s, iters %d'%(fcn_scale, params['teacher_weight_path'], train_iter))
+with tf.Session() as sess:
+    teacher = FCN16VGG(params['teacher_weight_path'])
+    student = FCN16VGG(params['student_weight_path'], backbone='lite')
+    npy_path = params['save_trained_weight_path']
+
+    train_img = tf.placeholder(tf.float32, shape=[1, None, None, 3])
+    train_label = tf.placeholder(tf.int32, shape=[None])
+
+    [train_op, loss] = student.train(params=params, image=train_img, truth=train_label, scale_min=fcn_scale,
+                                     save_var=True, teacher=teacher)
+    var_dict_to_train = student.var_dict
+    tf.scalar_summary('train_loss', loss)
+
+    merged_summary = tf.merge_all_summaries()
+    writer = tf.train.SummaryWriter(params['tsboard_save_path'], sess.graph)
+
+    sess.run(tf.initialize_all_variables())
+
+    print('Start training...')
+    for i in range(train_iter+1):
+        # Load data, Already converted to BGR
+        next_pair = train_dataset.next_batch()
+        next_pair_image = next_pair[0]
+
+        image_shape = next_pair_image.shape
+        num_pixels = image_shape[1] * image_shape[2]
+        next_pair_label = np.reshape(next_pair[1], num_pixels)
+
+        train_feed_dict = {train_img: next_pair_image,
+                           train_label: next_pair_label}
+        sess.run(train_op, train_feed_dict)
+        # Save loss value
+        if i % 100 == 0:
+            summary, loss_value = sess.run([merged_summary, loss], train_feed_dict)
+            writer.add_summary(summary, i)
+            print('Iter %d Training Loss: %f' % (i,loss_value))
+
+        # Save weight for validation
+        if i >= val_step and i % val_step == 0:
+            train_weight_dict = sess.run(var_dict_to_train)
+            fpath = npy_path + 'city_lite_%s_%d.npy'%(fcn_scale, i)
+            np.save(fpath, train_weight_dict)
+            print("trained weights saved: ", fpath)
+    print('Finished training')
@@ -0,0 +1,29 @@
+'''
+Tune the session thread pools of FCN16VGG inference on this host and save the
+best setting, loaded by cpu_profile.make_session() in the inference scripts.
+'''
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+sys.path.append("..")
+
+import os
+import cpu_profile
+
+# CPU only
+os.environ['CUDA_VISIBLE_DEVICES'] = ''
+
+tune_config = {'weight_path': '../data/val_weights/city_fcn8s_skip_100000.npy',
+               'save_path': '../data/cpu_profile.json',
+               'image_size': (1024, 2048),
+               'settings': None,             # list of (intra_op, inter_op), derived from the core count if None
+               'batch_sizes': (1, 2),
+               'runs': 3,
+               'objective': 'throughput'}    # or 'latency'
+
+cpu_profile.tune(tune_config['weight_path'], image_size=tune_config['image_size'],
+                 settings=tune_config['settings'], batch_sizes=tune_config['batch_sizes'],
+                 runs=tune_config['runs'], objective=tune_config['objective'],
+                 save_path=tune_config['save_path'])
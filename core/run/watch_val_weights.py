@@ -0,0 +1,177 @@
+'''
+Long-running validation of the weight files written by the training scripts.
+The directory of saved weights is watched for new files, e.g city_fcn8s_skip_<iter>.npy
+or city_instance_<iter>.npy. The graph is built only once, every new weight file is
+assigned to the existing variables and evaluated on the val set, whose ground truth
+is decoded once and kept in memory. Results are appended to a metrics log, one json per line.
+'''
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+sys.path.append("..")
+
+import os
+import re
+import glob
+import json
+import time
+from PIL import Image
+
+import numpy as np
+import tensorflow as tf
+
+from network.fcn_vgg16 import FCN16VGG
+from network.fcn_instance import InstanceFCN8s
+import data_utils as dt
+import cpu_profile
+
+from eval.evalPixelSemantic import Evaluator
+from eval.evalInstanceLevel import InstanceEvaluator
+
+# Specify which GPU to use
+os.environ['CUDA_VISIBLE_DEVICES'] = ''
+
+val_data_config = {'city_dir':"../data/CityDatabase",
+                   'randomize': False,
+                   'seed': None,
+                   'dataset':'val'}
+
+# 'semantic': FCN16VGG weights, scored with mIoU/iIoU
+# 'instance': InstanceFCN8s weights, scored with AP/AP50
+watch_config = {'mode': 'semantic',
+                'weights_dir': '../data/val_weights/',
+                'pattern': 'city_fcn8s_skip_*.npy',   # 'city_instance_*.npy' for mode 'instance'
+                'metrics_log': '../data/val_weights/metrics.log',
+                'poll_interval': 60,        # seconds between two scans of weights_dir
+                'num_images': None,         # evaluate the first n val images, all if None
+                'eval_iiou': False,         # also keep instanceIds in memory for the iIoU
+                'cache_images': False,      # also keep the decoded val images in memory (uint8)
+                'cpu_profile': '../data/cpu_profile.json'}  # thread pools, see run/tune_cpu.py
+
+params = {'num_classes': 20, 'scale_min': 'fcn8s', 'max_instance': 30,
+          'gt_class':{11:'person', 13:'car'},
+          'pred_class':{13:'car'}}
+
+
+def weight_iteration(fname):
+    '''Training iteration from the weight file name, e.g city_fcn8s_skip_100000.npy -> 100000'''
+    match = re.search(r'_(\d+)\.npy$', fname)
+    return int(match.group(1)) if match else -1
+
+def find_new_weights(done):
+    search = os.path.join(watch_config['weights_dir'], watch_config['pattern'])
+    fnames = [fname for fname in glob.glob(search) if os.path.basename(fname) not in done]
+    return sorted(fnames, key=weight_iteration)
+
+def load_done(log_path):
+    '''Weight files already evaluated in a previous run'''
+    done = set()
+    if os.path.isfile(log_path):
+        with open(log_path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    done.add(json.loads(line)['weights'])
+    return done
+
+def wait_until_written(fname):
+    '''np.save may still be writing the file, wait until its size is stable'''
+    size = -1
+    while size != os.path.getsize(fname):
+        size = os.path.getsize(fname)
+        time.sleep(2)
+
+
+val_dataset = dt.CityDataSet(val_data_config)
+num_images = watch_config['num_images'] or len(val_dataset.img_indices)
+
+# Decode the val ground truth once
+print('Loading ground truth of %d val images ...'%num_images)
+gt_labelIds = []
+gt_instances = []
+cached_images = []
+for idx in range(num_images):
+    if watch_config['mode'] == 'semantic':
+        gt_labelIds.append(np.array(Image.open(val_dataset.gt_path(idx, 'labelIds')), dtype=np.uint8))
+    if watch_config['mode'] == 'instance' or watch_config['eval_iiou']:
+        gt_instances.append(np.array(Image.open(val_dataset.gt_path(idx, 'instanceIds')), dtype=np.uint16))
+    if watch_config['cache_images']:
+        cached_images.append(np.array(Image.open(val_dataset.img_indices[idx]), dtype=np.uint8))
+
+done = load_done(watch_config['metrics_log'])
+print('Watching %s for %s, %d already evaluated'%(watch_config['weights_dir'], watch_config['pattern'], len(done)))
+
+# The graph is built with the first new weight file
+new_weights = find_new_weights(done)
+while not new_weights:
+    time.sleep(watch_config['poll_interval'])
+    new_weights = find_new_weights(done)
+wait_until_written(new_weights[0])
+
+with cpu_profile.make_session(watch_config['cpu_profile']) as sess:
+    image = tf.placeholder(tf.float32, shape=[1, None, None, 3])
+    if watch_config['mode'] == 'semantic':
+        model = FCN16VGG(new_weights[0])
+        option = {'fcn32s':False, 'fcn16s':False, 'fcn8s':False}
+        option[params['scale_min']] = True
+        predict_ = model.inference(image, num_classes=params['num_classes'], scale_min=params['scale_min'],
+                                   option=option, save_var=True,
+                                   label_lut=val_dataset.trainId2labelId_lut)[params['scale_min']]
+    else:
+        model = InstanceFCN8s(data_path=new_weights[0], gt_class=params['gt_class'], pred_class=params['pred_class'])
+        predict_ = model.inference(params, image, direct_slice=False, save_var=True, compact=True)
+    init = tf.initialize_all_variables()
+    sess.run(init)
+    # The initial values are already the first weight file
+    loaded = new_weights[0]
+
+    while True:
+        new_weights = find_new_weights(done)
+        if not new_weights:
+            time.sleep(watch_config['poll_interval'])
+            continue
+
+        for fpath in new_weights:
+            wait_until_written(fpath)
+            start = time.time()
+            if fpath != loaded:
+                model.load_weights(sess, dt.load_weight(fpath))
+                loaded = fpath
+
+            if watch_config['mode'] == 'semantic':
+                evaluator = Evaluator()
+            else:
+                evaluator = InstanceEvaluator(classTrainIds=sorted(params['pred_class'].keys()))
+
+            for idx in range(num_images):
+                if watch_config['cache_images']:
+                    img = cached_images[idx].astype(np.float32)[:,:,::-1]   # RGB -> BGR
+                else:
+                    img = val_dataset.load_image(val_dataset.img_indices[idx])
+                pred = sess.run(predict_, feed_dict={image: img[np.newaxis, ...]})
+
+                if watch_config['mode'] == 'semantic':
+                    instances = gt_instances[idx] if watch_config['eval_iiou'] else None
+                    evaluator.add(pred[0], gt_labelIds[idx], instances)
+                else:
+                    evaluator.add(pred, gt_instances[idx])
+
+            metrics = {'weights': os.path.basename(fpath),
+                       'iteration': weight_iteration(fpath),
+                       'num_images': num_images,
+                       'seconds': time.time() - start}
+            if watch_config['mode'] == 'semantic':
+                result = evaluator.summary()
+                metrics['mIoU'] = result['averageScoreClasses']
+                metrics['iIoU'] = result['averageScoreInstClasses']
+                metrics['categoryIoU'] = result['averageScoreCategories']
+            else:
+                result = evaluator.summary()
+                metrics['AP'] = result['averageAP']
+                metrics['AP50'] = result['averageAP50']
+            print('Evaluated %s: %s'%(os.path.basename(fpath), json.dumps(metrics)))
+
+            with open(watch_config['metrics_log'], 'a') as f:
+                f.write(json.dumps(metrics) + '\n')
+            done.add(os.path.basename(fpath))